@@ -1,20 +1,52 @@
 import os
 import json
 import base64
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, jsonify
 from werkzeug.utils import secure_filename
 from collections import Counter
 import requests
 from PIL import Image
 import tempfile
 import io
+import sys
+
+# Shared pipeline modules live in the project root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from filters import parse_filter_params, filter_detection_dicts
+from imaging import inspect_image, ImageValidationError
+from assets import register_asset_routes
+from client_uploads import register_client_upload_routes
+from cassette import shared_cassette
+from deadline import request_deadline, start_request_deadlines
 
 app = Flask(__name__, template_folder='../templates')
 app.config['MAX_CONTENT_LENGTH'] = 4 * 1024 * 1024  # 4MB max for Vercel
+asset_store = register_asset_routes(app)
+register_client_upload_routes(app)
+start_request_deadlines(app)
 
 # Initialize Roboflow client (lightweight version)
 ROBOFLOW_API_KEY = os.getenv("ROBOFLOW_API_KEY", "OCYzLwdUcqDtypAh0OYT")
 ROBOFLOW_API_URL = "https://detect.roboflow.com"
+ROBOFLOW_MODEL = "petes-workspace-oetpj/furniture-detection-v2/1"
+
+def call_roboflow(file_data, params, timeout=30):
+    """POST the image to the hosted model; returns (status code, JSON body or None)"""
+    def post():
+        response = requests.post(
+            f"{ROBOFLOW_API_URL}/{ROBOFLOW_MODEL}",
+            params=dict(params, api_key=ROBOFLOW_API_KEY),
+            data=base64.b64encode(file_data).decode('utf-8'),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            timeout=max(timeout, 0.1)
+        )
+        return response.status_code, response.json() if response.status_code == 200 else None
+    
+    # Recorded or replayed when ROBOFLOW_CASSETTE is set
+    cassette = shared_cassette()
+    if cassette is None:
+        return post()
+    return tuple(cassette.call('detect', dict(params, model=ROBOFLOW_MODEL), [file_data], post))
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 
@@ -33,7 +65,7 @@ def create_simple_visualization(image_data, detections):
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return asset_store.page('index.html')
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -48,36 +80,42 @@ def upload_file():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file type. Please upload an image file.'}), 400
         
+        try:
+            filters = parse_filter_params(request.values)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid filter: {str(e)}'}), 400
+        
         # Read file data
         file_data = file.read()
         
-        # Validate image with PIL
+        # Validate from the header alone; nothing is decoded
         try:
-            img = Image.open(io.BytesIO(file_data))
-            img.verify()
-        except Exception:
-            return jsonify({'error': 'Invalid image file'}), 400
+            inspect_image(io.BytesIO(file_data))
+        except ImageValidationError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Use Roboflow API directly (lightweight approach)
+        # Use Roboflow API directly (lightweight approach), within the request's time budget
+        deadline = request_deadline()
         try:
-            # Prepare the image for API call
-            img_b64 = base64.b64encode(file_data).decode('utf-8')
+            # Push confidence and class filters to the hosted API
+            params = {}
+            if filters['min_confidence'] is not None:
+                params["confidence"] = round(filters['min_confidence'] * 100)
+            if filters['classes'] is not None:
+                params["classes"] = ",".join(sorted(filters['classes']))
             
             # Call Roboflow API
-            response = requests.post(
-                f"{ROBOFLOW_API_URL}/petes-workspace-oetpj/furniture-detection-v2/1",
-                params={"api_key": ROBOFLOW_API_KEY},
-                data=img_b64,
-                headers={"Content-Type": "application/x-www-form-urlencoded"},
-                timeout=30
-            )
+            status_code, result = call_roboflow(file_data, params, deadline.timeout())
             
-            if response.status_code != 200:
+            if status_code != 200:
                 return jsonify({'error': 'AI detection service unavailable'}), 500
             
-            result = response.json()
             detections = result.get('predictions', [])
             
+        except requests.Timeout:
+            # Out of time: answer with what there is rather than a timeout error
+            deadline.skip('inference')
+            detections = []
         except Exception as e:
             # Fallback: create mock data for demo
             detections = [
@@ -86,7 +124,21 @@ def upload_file():
                 {'class': 'Lamp', 'confidence': 0.92, 'x': 300, 'y': 80, 'width': 30, 'height': 100}
             ]
         
+        # The API rounds the threshold and cannot apply top-k, so filter here too
+        detections = filter_detection_dicts(detections, filters)
+        
         if not detections:
+            if deadline.partial:
+                return jsonify({
+                    'success': True,
+                    'message': 'Detection did not finish in time.',
+                    'total_objects': 0,
+                    'object_counts': {},
+                    'detections': [],
+                    'partial': True,
+                    'skipped': deadline.skipped,
+                    'output_image': f"data:image/jpeg;base64,{base64.b64encode(file_data).decode('utf-8')}"
+                })
             return jsonify({'error': 'No furniture detected in the image'}), 400
         
         # Count objects by class
@@ -120,6 +172,7 @@ def upload_file():
             'total_objects': len(detections),
             'object_counts': dict(object_counts.most_common()),
             'detections': detection_list,
+            'partial': deadline.partial,
             'output_image': f"data:image/jpeg;base64,{img_data}"
         }
         
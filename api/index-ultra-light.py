@@ -1,10 +1,16 @@
 import os
 import json
+import sys
 import base64
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, jsonify
+
+# Frontend assets are shared with the other apps in the project root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from assets import register_asset_routes
 
 app = Flask(__name__, template_folder='../templates')
 app.config['MAX_CONTENT_LENGTH'] = 4 * 1024 * 1024  # 4MB max
+asset_store = register_asset_routes(app)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 
@@ -13,7 +19,7 @@ def allowed_file(filename):
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return asset_store.page('index.html')
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -3,7 +3,7 @@ import sys
 import json
 import cv2
 import numpy as np
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, jsonify
 from werkzeug.utils import secure_filename
 from collections import Counter
 from inference_sdk import InferenceHTTPClient
@@ -12,8 +12,18 @@ from io import BytesIO
 from PIL import Image
 import tempfile
 
+# Shared pipeline modules live in the project root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from detections import DetectionSet
+from postprocess import postprocess_detections
+from imaging import decode_image, inspect_image, ImageValidationError
+from assets import register_asset_routes
+from client_uploads import register_client_upload_routes
+
 app = Flask(__name__, template_folder='../templates')
 app.config['MAX_CONTENT_LENGTH'] = 4 * 1024 * 1024  # 4MB max for Vercel
+asset_store = register_asset_routes(app)
+register_client_upload_routes(app)
 
 # Initialize Roboflow client
 client = InferenceHTTPClient(
@@ -26,13 +36,13 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def create_visualization(image_path, detections, output_path):
-    """Create a visualization of the detections on the image"""
+def create_visualization(image_path, detections):
+    """Render the detections on the image and return it as JPEG bytes (None on failure)"""
     try:
-        # Load image
-        image = cv2.imread(image_path)
+        # Load image (upright, with the EXIF orientation applied)
+        image = decode_image(image_path)[0]
         if image is None:
-            return False
+            return None
         
         # Define colors for different classes (BGR format for OpenCV)
         colors = [
@@ -86,17 +96,17 @@ def create_visualization(image_path, detections, output_path):
             cv2.putText(image, label, (x1, y1 - 5), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
         
-        # Save the visualization
-        cv2.imwrite(output_path, image)
-        return True
+        # Encode in memory; the result only ever goes into the response
+        ok, encoded = cv2.imencode('.jpg', image)
+        return encoded.tobytes() if ok else None
         
     except Exception as e:
         print(f"Error creating visualization: {str(e)}")
-        return False
+        return None
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return asset_store.page('index.html')
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -116,26 +126,33 @@ def upload_file():
             file.save(temp_input.name)
             filepath = temp_input.name
         
+        # Validate from the header alone, before any pixels are decoded
+        try:
+            info = inspect_image(filepath)
+        except ImageValidationError as e:
+            os.unlink(filepath)
+            return jsonify({'error': str(e)}), 400
+        
+        # Rotated photos are sent upright so detection and rendering agree
+        image_source = filepath
+        if info.orientation != 1:
+            image_source = decode_image(filepath, info=info)[0]
+        
         # Run furniture detection
         result = client.run_workflow(
             workspace_name="petes-workspace-oetpj",
             workflow_id="detect-count-and-visualise-furniture-instant",
             images={
-                "image": filepath
+                "image": image_source
             },
             use_cache=True
         )
         
-        # Extract detections
-        detections = []
-        if isinstance(result, list) and len(result) > 0:
-            first_result = result[0]
-            if 'predictions' in first_result and 'predictions' in first_result['predictions']:
-                detections = first_result['predictions']['predictions']
-            elif 'detections' in first_result:
-                detections = first_result['detections']
+        # Parse detections, then filter, clip and de-duplicate overlapping boxes
+        detections = postprocess_detections(DetectionSet.from_roboflow(result), info.size).to_dicts()
         
         if not detections:
+            os.unlink(filepath)
             return jsonify({'error': 'No furniture detected in the image'}), 400
         
         # Count objects by class
@@ -161,13 +178,12 @@ def upload_file():
             })
         
         # Create visualization
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_output:
-            output_path = temp_output.name
+        visualization = create_visualization(filepath, detections)
+        os.unlink(filepath)
         
-        if create_visualization(filepath, detections, output_path):
+        if visualization is not None:
             # Convert output image to base64 for display
-            with open(output_path, 'rb') as img_file:
-                img_data = base64.b64encode(img_file.read()).decode('utf-8')
+            img_data = base64.b64encode(visualization).decode('utf-8')
             
             response_data = {
                 'success': True,
@@ -177,10 +193,6 @@ def upload_file():
                 'output_image': f"data:image/jpeg;base64,{img_data}"
             }
             
-            # Clean up temporary files
-            os.unlink(filepath)
-            os.unlink(output_path)
-            
             return jsonify(response_data)
         else:
             return jsonify({'error': 'Failed to create visualization'}), 500
@@ -2,15 +2,43 @@ import os
 import json
 import cv2
 import numpy as np
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from werkzeug.utils import secure_filename
-from collections import Counter
-from inference_sdk import InferenceHTTPClient
+from inference_sdk import InferenceHTTPClient, InferenceConfiguration
 import base64
 from io import BytesIO
 from PIL import Image
+from profiling import profile_upload, register_profiling_routes
+from detections import DetectionSet, encode_json
+from postprocess import postprocess_detections
+from filters import parse_filter_params, apply_filters
+from inventory import InventoryStore, register_inventory_routes
+from fingerprints import crop_fingerprints
+from crops import register_crop_routes, save_crop_thumbnails, crops_omitted
+from export import register_export_routes
+from imaging import (decode_image, inspect_image, ImageValidationError, VISUALIZATION_MAX_SIDE,
+                     INFERENCE_MAX_SIDE, JPEG_FORMATS, reduction_factor)
+from image_cache import NearDuplicateCache, image_hash
+from tiling import tiling_possible, should_tile, run_tiled_inference
+from chunked_upload import ChunkedUploadStore, copy_with_digest, register_chunked_upload_routes
+from remote_images import RemoteImageFetcher, register_remote_image_routes
+from memory_budget import MemoryAccount, MemoryBudgetError, MemoryMonitor, plan_request, projected_bytes
+from scratch import ScratchSpace
+from assets import register_asset_routes, compress_json_responses
+from client_uploads import register_client_upload_routes
+from cassette import CassetteError, shared_cassette, wrap_client
+from deadline import (Deadline, DeadlineExceeded, request_deadline, start_request_deadlines, call_stats,
+                      DEADLINE_FALLBACK_MIN, DEADLINE_CROPS_MIN, DEADLINE_RENDER_MIN,
+                      DEADLINE_RENDER_FULL, DEADLINE_RENDER_REDUCED_SIDE)
+from ensemble import Ensemble, WORKFLOW_MODEL, parse_models, map_classes
+from model_selection import ModelSelector, parse_candidates
+from progressive import (stream_passes, PROGRESSIVE_PREVIEW_SIDE, PROGRESSIVE_PREVIEW_MODEL,
+                         PROGRESSIVE_PREVIEW_TIMEOUT)
 import requests
 import logging
+import threading
+import time
+import hashlib
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -27,30 +55,227 @@ app.config['OUTPUT_FOLDER'] = '/tmp/outputs'
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
-# Initialize Roboflow client with error handling
+ROBOFLOW_API_URL = "https://serverless.roboflow.com"
+ROBOFLOW_API_KEY = os.getenv("ROBOFLOW_API_KEY", "OCYzLwdUcqDtypAh0OYT")
+
+# Names of workflow inputs that accept a confidence threshold / class list.
+# Only set these if the workflow defines such inputs.
+WORKFLOW_CONFIDENCE_INPUT = os.getenv("WORKFLOW_CONFIDENCE_INPUT", "")
+WORKFLOW_CLASSES_INPUT = os.getenv("WORKFLOW_CLASSES_INPUT", "")
+
+# Initialize Roboflow client with error handling; with ROBOFLOW_CASSETTE set,
+# calls are recorded to or replayed from a file
 try:
-    client = InferenceHTTPClient(
-        api_url="https://serverless.roboflow.com",
-        api_key=os.getenv("ROBOFLOW_API_KEY", "OCYzLwdUcqDtypAh0OYT")
-    )
+    cassette = shared_cassette()
+except CassetteError as e:
+    # Replaying from a missing or broken file would only produce misses
+    logger.error(f"Cannot start with ROBOFLOW_CASSETTE: {e}")
+    raise SystemExit(1)
+try:
+    client = wrap_client(InferenceHTTPClient(
+        api_url=ROBOFLOW_API_URL,
+        api_key=ROBOFLOW_API_KEY
+    ))
     logger.info("Roboflow client initialized successfully")
 except Exception as e:
     logger.error(f"Failed to initialize Roboflow client: {e}")
     client = None
 
+register_profiling_routes(app)
+
+# Fingerprinted, precompressed frontend assets; JSON responses compressed on request
+asset_store = register_asset_routes(app)
+compress_json_responses(app)
+
+# Each request's time budget starts when it arrives, before the body is read
+start_request_deadlines(app)
+
+# Persistent property -> room -> photo inventory
+inventory_store = InventoryStore(os.getenv("INVENTORY_DB", "/tmp/inventory.db"))
+register_inventory_routes(app, inventory_store)
+register_export_routes(app, inventory_store)
+
+# Per-detection crop thumbnails, served from the output folder
+CROP_FOLDER = os.path.join(app.config['OUTPUT_FOLDER'], 'crops')
+register_crop_routes(app, CROP_FOLDER)
+
+# Reuses detections for resized/recompressed copies of recently seen photos
+image_cache = NearDuplicateCache()
+
+# Per-request memory budget and instance-wide admission by projected memory
+request_memory = MemoryMonitor()
+
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+# Running a real inference during warm-up costs an API call, so it is opt-in
+WARMUP_INFERENCE = os.getenv("WARMUP_INFERENCE", "0") == "1"
+WARMUP_RETRY_SECONDS = 30
+
+warmup_state = {
+    'status': 'pending',
+    'started_at': None,
+    'duration_ms': None,
+    'steps': {},
+    'error': None
+}
+warmup_lock = threading.Lock()
+
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def create_visualization(image_path, detections, output_path):
-    """Create a visualization of the detections on the image"""
+def workflow_parameters(filters):
+    """Workflow inputs that push request filters upstream, where supported"""
+    parameters = {}
+    if filters:
+        if WORKFLOW_CONFIDENCE_INPUT and filters['min_confidence'] is not None:
+            parameters[WORKFLOW_CONFIDENCE_INPUT] = filters['min_confidence']
+        if WORKFLOW_CLASSES_INPUT and filters['classes'] is not None:
+            parameters[WORKFLOW_CLASSES_INPUT] = sorted(filters['classes'])
+    return parameters
+
+def model_client(filters):
+    """Client for direct model inference with request filters applied server-side"""
+    if not filters:
+        return client
+    configuration = InferenceConfiguration(
+        confidence_threshold=filters['min_confidence'],
+        class_filter=sorted(filters['classes']) if filters['classes'] is not None else None
+    )
+    if configuration == InferenceConfiguration.init_default():
+        return client
+    # A per-request client, since configuring the shared one is not thread-safe
+    return wrap_client(InferenceHTTPClient(api_url=ROBOFLOW_API_URL, api_key=ROBOFLOW_API_KEY)).configure(configuration)
+
+# Optional ensemble (ENSEMBLE_MODELS): all models at once, fused, instead of the fallback
+ensemble = Ensemble(parse_models())
+if ensemble.enabled:
+    logger.info(f"Ensemble mode: {', '.join(f'{m.name} x{m.weight}' for m in ensemble.models)}")
+
+# Optional routing (MODEL_CANDIDATES): one model per request, picked by latency and quality
+model_selector = ModelSelector(parse_candidates())
+if model_selector.enabled and not ensemble.enabled:
+    logger.info(f"Model selection: {', '.join(f'{c.name} q{c.quality}' for c in model_selector.candidates)}, "
+                f"p95 SLO {model_selector.slo_ms:.0f}ms")
+
+# Model for progressive uploads' preview pass. Called directly, so previews of
+# small images stay out of the ensemble and model selection statistics
+preview_model = parse_models(PROGRESSIVE_PREVIEW_MODEL or WORKFLOW_MODEL)[0]
+
+def run_detection(image_source, filters=None, deadline=None):
+    """Run the furniture workflow on a path or image array, falling back to COCO
+
+    Returns the parsed detections as a DetectionSet. With a deadline, each
+    call gets the remaining budget and the fallback only runs if
+    DEADLINE_FALLBACK_MIN seconds are left; otherwise DeadlineExceeded.
+    In ensemble mode every configured model is queried concurrently and
+    the results are fused; with model selection, the model currently
+    best within the latency SLO is used, with the others as fallbacks.
+    """
+    if ensemble.enabled:
+        return ensemble.run(lambda model: run_model(model, image_source, filters), deadline)
+    if model_selector.enabled:
+        return model_selector.run(lambda model: run_model(model, image_source, filters), deadline)
+    
+    def workflow():
+        return call_model(WORKFLOW_MODEL, image_source, filters)
+    
+    def fallback():
+        return call_model("coco/3", image_source, filters)
+    
+    try:
+        # Try the workflow first
+        detections = deadline.call('inference', workflow) if deadline else workflow()
+        logger.info("Roboflow workflow detection completed")
+    except DeadlineExceeded:
+        raise
+    except Exception as workflow_error:
+        if deadline and not deadline.allows(DEADLINE_FALLBACK_MIN):
+            deadline.skip('fallback')
+            raise DeadlineExceeded(f"No time left for the COCO fallback after: {workflow_error}")
+        logger.warning(f"Workflow failed: {workflow_error}, trying COCO model...")
+        # Fallback to COCO model
+        detections = deadline.call('inference', fallback) if deadline else fallback()
+        logger.info("COCO model detection completed")
+    return detections
+
+def call_model(model_name, image_source, filters):
+    """One Roboflow call: the furniture workflow or a model id, parsed to a DetectionSet
+    
+    Every inference goes through here, so the client (and its cassette)
+    and the request filters are applied the same way in every mode.
+    """
+    if model_name == WORKFLOW_MODEL:
+        result = client.run_workflow(
+            workspace_name="petes-workspace-oetpj",
+            workflow_id="detect-count-and-visualise-furniture-instant",
+            images={
+                "image": image_source
+            },
+            parameters=workflow_parameters(filters),
+            use_cache=True
+        )
+    else:
+        result = model_client(filters).infer(image_source, model_id=model_name)
+    return DetectionSet.from_roboflow(result)
+
+def run_model(model, image_source, filters):
+    """One ensemble member's or candidate's detections, in that model's own class names"""
+    if model.name != WORKFLOW_MODEL and filters:
+        # Class filters name furniture classes, which this model does not know;
+        # they are applied after class mapping
+        filters = dict(filters, classes=None)
+    return call_model(model.name, image_source, filters)
+
+def detection_variant(filters, tiled):
+    """Request inputs other than the image that change what detection returns"""
+    if not filters:
+        return (None, None, tiled)
+    classes = tuple(sorted(filters['classes'])) if filters['classes'] is not None else None
+    return (filters['min_confidence'], classes, tiled)
+
+def audit_cached_detections(image, scale, image_size, cached, distance, filters):
+    """Re-run detection for a cache hit and record whether the counts agree"""
+    try:
+        fresh = run_detection(image, filters).scaled(1 / scale[0], 1 / scale[1])
+        fresh = postprocess_detections(fresh, image_size)
+        cached = postprocess_detections(cached, image_size)
+        image_cache.record_audit(distance, cached.counts(), fresh.counts())
+    except Exception as e:
+        logger.warning(f"Image cache audit failed: {e}")
+
+def run_file_detection(filepath, info, filters=None, max_side=None, deadline=None):
+    """Run detection on an uploaded file in upright coordinates
+    
+    Rotated photos are sent as decoded, upright arrays so the model sees the
+    same pixels that are rendered. With INFERENCE_MAX_SIDE or max_side (the
+    memory budget) set, large JPEGs are decoded at 1/2, 1/4 or 1/8 scale;
+    boxes are mapped back to full size.
+    """
+    sides = [side for side in (INFERENCE_MAX_SIDE, max_side) if side]
+    target_side = min(sides) if sides else None
+    if target_side or info.orientation != 1:
+        image, scale = decode_image(filepath, target_side, info)
+        if image is not None and (scale != (1.0, 1.0) or info.orientation != 1):
+            return run_detection(image, filters, deadline).scaled(1 / scale[0], 1 / scale[1])
+    return run_detection(filepath, filters, deadline)
+
+def json_response(payload):
+    """Like jsonify, but encodes DetectionSets directly with the fast encoder"""
+    return app.response_class(encode_json(payload), mimetype='application/json')
+
+def create_visualization(image_path, detections, max_side=VISUALIZATION_MAX_SIDE):
+    """Render the detections on the image and return it as JPEG bytes (None on failure)"""
     try:
-        # Load image
-        image = cv2.imread(image_path)
+        # Decode only as large as the rendered output needs, and map the
+        # boxes into the decoded image's coordinates
+        image, scale = decode_image(image_path, max_side)
         if image is None:
             logger.error(f"Failed to load image: {image_path}")
-            return False
+            return None
+        
+        if scale != (1.0, 1.0):
+            detections = detections.scaled(*scale)
         
         # Define colors for different classes (BGR format for OpenCV)
         colors = [
@@ -64,30 +289,15 @@ def create_visualization(image_path, detections, output_path):
             (255, 165, 0),  # Orange
         ]
         
-        class_color_map = {}
-        color_index = 0
+        # One color per entry in the interned class table
+        class_colors = [colors[i % len(colors)] for i in range(len(detections.class_names))]
+        boxes = detections.boxes_xyxy().astype(np.int32).tolist()
         
         # Draw bounding boxes and labels
-        for detection in detections:
-            class_name = detection.get('class', 'Unknown')
-            confidence = detection.get('confidence', 0)
-            x = detection.get('x', 0)
-            y = detection.get('y', 0)
-            width = detection.get('width', 0)
-            height = detection.get('height', 0)
-            
-            # Assign color to class if not already assigned
-            if class_name not in class_color_map:
-                class_color_map[class_name] = colors[color_index % len(colors)]
-                color_index += 1
-            
-            color = class_color_map[class_name]
-            
-            # Calculate bounding box coordinates
-            x1 = int(x - width / 2)
-            y1 = int(y - height / 2)
-            x2 = int(x + width / 2)
-            y2 = int(y + height / 2)
+        for (x1, y1, x2, y2), class_index, confidence in zip(
+                boxes, detections.class_index.tolist(), detections.confidence.tolist()):
+            class_name = detections.class_names[class_index]
+            color = class_colors[class_index]
             
             # Draw bounding box
             cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
@@ -104,28 +314,152 @@ def create_visualization(image_path, detections, output_path):
             cv2.putText(image, label, (x1, y1 - 5), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
         
-        # Save the visualization
-        cv2.imwrite(output_path, image)
-        logger.info(f"Visualization saved to: {output_path}")
-        return True
+        # Encode in memory; the result only ever goes into the response
+        ok, encoded = cv2.imencode('.jpg', image)
+        if not ok:
+            logger.error("Failed to encode visualization")
+            return None
+        return encoded.tobytes()
         
     except Exception as e:
         logger.error(f"Error creating visualization: {str(e)}")
-        return False
+        return None
+
+def create_warmup_image():
+    """Build a tiny built-in test image so warm-up needs no bundled assets"""
+    gradient = np.linspace(0, 255, 64, dtype=np.uint8)
+    image = np.dstack([
+        np.tile(gradient, (64, 1)),
+        np.tile(gradient[:, None], (1, 64)),
+        np.full((64, 64), 128, dtype=np.uint8)
+    ])
+    return image
+
+def warm_up():
+    """Warm the codecs and rendering path and check the inference host is reachable
+
+    No connection is kept warm for inference: the SDK sends every call on
+    a new connection of its own, so the host check at most fills an
+    OS-level DNS cache. Only WARMUP_INFERENCE (a real call through the
+    client) warms the inference path itself.
+    """
+    if not warmup_lock.acquire(blocking=False):
+        return
+    try:
+        warmup_state['status'] = 'warming'
+        warmup_state['started_at'] = time.time()
+        warmup_state['error'] = None
+        steps = {}
+        start = time.perf_counter()
+
+        # Image codecs: first calls pay for lazy library initialization
+        step_start = time.perf_counter()
+        image = create_warmup_image()
+        ok, jpeg_bytes = cv2.imencode('.jpg', image)
+        cv2.imencode('.png', image)
+        cv2.imdecode(jpeg_bytes, cv2.IMREAD_COLOR)
+        Image.open(BytesIO(jpeg_bytes.tobytes())).load()
+        base64.b64encode(jpeg_bytes.tobytes())
+        steps['codecs_ms'] = (time.perf_counter() - step_start) * 1000
+
+        # Rendering path, through the same function uploads use
+        step_start = time.perf_counter()
+        warmup_path = os.path.join(app.config['UPLOAD_FOLDER'], 'warmup.jpg')
+        with open(warmup_path, 'wb') as f:
+            f.write(jpeg_bytes.tobytes())
+        warmup_detections = DetectionSet.from_dicts(
+            [{'class': 'Warmup', 'confidence': 0.5, 'x': 32, 'y': 32, 'width': 24, 'height': 24}])
+        rendered = create_visualization(warmup_path, warmup_detections) is not None
+        steps['visualization_ms'] = (time.perf_counter() - step_start) * 1000
+
+        # Reachability of the inference host; nothing here is reused by the SDK
+        step_start = time.perf_counter()
+        if cassette is not None and cassette.replaying:
+            # Replays run offline; the host is never called
+            steps['inference_host_status'] = 'replay'
+            host_reachable = True
+        else:
+            try:
+                response = requests.get(ROBOFLOW_API_URL, timeout=WARMUP_TIMEOUT)
+                steps['inference_host_status'] = response.status_code
+                host_reachable = True
+            except requests.RequestException as e:
+                logger.warning(f"Warm-up could not reach inference host: {e}")
+                host_reachable = False
+        steps['connection_ms'] = (time.perf_counter() - step_start) * 1000
+
+        if WARMUP_INFERENCE and client and host_reachable:
+            step_start = time.perf_counter()
+            try:
+                client.infer(warmup_path, model_id="coco/3")
+                steps['inference_ms'] = (time.perf_counter() - step_start) * 1000
+            except Exception as e:
+                logger.warning(f"Warm-up inference failed: {e}")
+                steps['inference_error'] = str(e)
+
+        if os.path.exists(warmup_path):
+            os.remove(warmup_path)
+
+        warmup_state['steps'] = steps
+        warmup_state['duration_ms'] = (time.perf_counter() - start) * 1000
+        if not client:
+            warmup_state['status'] = 'failed'
+            warmup_state['error'] = 'Roboflow client not initialized'
+        elif not host_reachable:
+            warmup_state['status'] = 'failed'
+            warmup_state['error'] = 'Inference host unreachable'
+        elif not rendered:
+            warmup_state['status'] = 'failed'
+            warmup_state['error'] = 'Visualization warm-up failed'
+        else:
+            warmup_state['status'] = 'ready'
+        logger.info(f"Warm-up {warmup_state['status']} in {warmup_state['duration_ms']:.0f} ms: {steps}")
+    except Exception as e:
+        logger.error(f"Warm-up failed: {e}")
+        warmup_state['status'] = 'failed'
+        warmup_state['error'] = str(e)
+    finally:
+        warmup_lock.release()
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return asset_store.page('index.html')
 
 @app.route('/health')
 def health():
     return jsonify({
         'status': 'healthy', 
         'port': os.environ.get('PORT', 8080),
-        'roboflow_client': 'initialized' if client else 'failed'
+        'roboflow_client': 'initialized' if client else 'failed',
+        'warmup': warmup_state['status'],
+        'warmup_ms': warmup_state['duration_ms'],
+        'image_cache': image_cache.stats(),
+        'remote_images': remote_fetcher.stats(),
+        'memory': request_memory.stats(),
+        'scratch': scratch.stats(),
+        'cassette': cassette.stats() if cassette is not None else None,
+        'deadline_calls': call_stats(),
+        'ensemble': ensemble.stats() if ensemble.enabled else None,
+        'model_selection': model_selector.stats() if model_selector.enabled and not ensemble.enabled else None
     })
 
+@app.route('/ready')
+def ready():
+    # Retry a failed warm-up in the background rather than failing forever
+    if (warmup_state['status'] == 'failed' and
+            time.time() - (warmup_state['started_at'] or 0) > WARMUP_RETRY_SECONDS):
+        threading.Thread(target=warm_up, daemon=True).start()
+
+    status_code = 200 if warmup_state['status'] == 'ready' else 503
+    return jsonify({
+        'status': warmup_state['status'],
+        'warmup_ms': warmup_state['duration_ms'],
+        'steps': warmup_state['steps'],
+        'error': warmup_state['error']
+    }), status_code
+
 @app.route('/upload', methods=['POST'])
+@profile_upload
 def upload_file():
     try:
         if not client:
@@ -141,107 +475,318 @@ def upload_file():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file type. Please upload an image file.'}), 400
         
-        # Save uploaded file
-        filename = secure_filename(file.filename)
-        timestamp = str(int(os.urandom(4).hex(), 16))
-        filename = f"{timestamp}_{filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        logger.info(f"File saved: {filepath}")
+        if request.values.get('progressive') == '1' and PROGRESSIVE_PREVIEW_SIDE:
+            return Response(stream_with_context(progressive_upload(file, request.values)),
+                            mimetype='application/x-ndjson')
         
-        # Run furniture detection using Roboflow API
-        logger.info("Running Roboflow detection...")
+        # Save uploaded file, hashing it on the way so an exact repeat is a cache hit.
+        # The request directory is removed however processing ends
+        with scratch.request_dir() as directory:
+            filepath, digest = save_upload(file, directory)
+            return process_upload(filepath, file.filename, request.values, digest)
+    
+    except Exception as e:
+        logger.error(f"Upload processing failed: {str(e)}")
+        # Clean up file if it exists
+        if 'filepath' in locals() and os.path.exists(filepath):
+            os.remove(filepath)
+        return jsonify({'error': f'Processing failed: {str(e)}'}), 500
+
+def save_upload(file, directory):
+    """Save an uploaded file under a unique name; returns (path, SHA-256 hex digest)"""
+    filename = secure_filename(file.filename)
+    timestamp = str(int(os.urandom(4).hex(), 16))
+    filename = f"{timestamp}_{filename}"
+    filepath = os.path.join(directory, filename)
+    digest = hashlib.sha256()
+    with open(filepath, 'wb') as out:
+        copy_with_digest(file.stream, out, digest)
+    logger.info(f"File saved: {filepath}")
+    return filepath, digest.hexdigest()
+
+def progressive_upload(file, values):
+    """NDJSON for /upload with progressive=1: a quick preview, then the full result
+    
+    The full pipeline starts at once; meanwhile detection runs on a copy
+    downscaled to PROGRESSIVE_PREVIEW_SIDE with PROGRESSIVE_PREVIEW_MODEL
+    (default: the workflow) and its detections are sent first, without an
+    image. Cached photos get the final line only.
+    
+    The preview decode is charged to the memory budget like any request; an
+    image that does not fit, or an instance that is busy, gets no preview
+    (the full pass then reports or waits as usual).
+    """
+    deadline = request_deadline()
+    with scratch.request_dir() as directory:
+        filepath, digest = save_upload(file, directory)
+        preview = {'image': None, 'reservation': None}
+        if not upload_is_cached(digest, values):
+            # Decoded before the full pass starts, since that removes the file when done
+            try:
+                info = inspect_image(filepath)
+                plan_request(info, os.path.getsize(filepath))
+                # Only JPEGs decode at reduced size; anything else is decoded in full
+                factor = (reduction_factor(info.size, PROGRESSIVE_PREVIEW_SIDE)
+                          if info.format in JPEG_FORMATS else 1)
+                nbytes = projected_bytes(-(-info.width // factor), -(-info.height // factor), 0)
+                preview['reservation'] = request_memory.reserve(nbytes, 0)
+                preview['image'], preview['scale'] = decode_image(filepath, PROGRESSIVE_PREVIEW_SIDE, info)
+            except (ImageValidationError, MemoryBudgetError):
+                pass
+        
+        def preview_pass():
+            try:
+                if preview['image'] is None:
+                    return None
+                return preview_result(preview['image'], preview['scale'], info.size, values, deadline)
+            finally:
+                preview['image'] = None
+                if preview['reservation'] is not None:
+                    preview['reservation'].release()
+        
+        def full():
+            return process_upload(filepath, file.filename, values, digest, deadline)
+        
+        try:
+            yield from stream_passes(preview_pass, full)
+        finally:
+            # Released once; this covers a client that left before the preview ran
+            if preview['reservation'] is not None:
+                preview['reservation'].release()
+
+def preview_result(image, scale, image_size, values, deadline):
+    """Detections on a downscaled decode, as an /upload response without an image"""
+    height, width = image.shape[:2]
+    factor = PROGRESSIVE_PREVIEW_SIDE / max(height, width)
+    if factor < 1:
+        # decode_image only reduces JPEGs, and only by powers of two
+        image = cv2.resize(image, (max(1, round(width * factor)), max(1, round(height * factor))),
+                           interpolation=cv2.INTER_AREA)
+        scale = (image.shape[1] / image_size[0], image.shape[0] / image_size[1])
+    filters = parse_filter_params(values)
+    # A budget of its own, so a slow preview never marks the full result partial
+    budget = Deadline(min(PROGRESSIVE_PREVIEW_TIMEOUT, deadline.remaining()))
+    detections = budget.call('preview', run_model, preview_model, image, filters)
+    detections = map_classes(detections, preview_model.class_map).scaled(1 / scale[0], 1 / scale[1])
+    detections = apply_filters(postprocess_detections(detections, image_size), filters)
+    return json_response({
+        'success': True,
+        'preview': True,
+        'total_objects': len(detections),
+        'object_counts': detections.counts(),
+        'detections': detections,
+        'output_image': None
+    })
+
+def process_upload(filepath, original_filename, values, digest=None, deadline=None):
+    """Run detection on a saved upload and build the /upload response
+    
+    Shared by /upload and chunked uploads. values holds the request
+    parameters (filters, tiled, cache, property/room, crops); digest is the
+    SHA-256 of the file. The file is removed once processing ends.
+    
+    Every stage runs within deadline (default: the request's). Stages that
+    do not fit are skipped or degraded and the response is marked partial.
+    """
+    memory = MemoryAccount()
+    reservation = None
+    deadline = deadline or request_deadline()
+    try:
         try:
-            # Try the workflow first
-            result = client.run_workflow(
-                workspace_name="petes-workspace-oetpj",
-                workflow_id="detect-count-and-visualise-furniture-instant",
-                images={
-                    "image": filepath
-                },
-                use_cache=True
-            )
-            logger.info("Roboflow workflow detection completed")
-        except Exception as workflow_error:
-            logger.warning(f"Workflow failed: {workflow_error}, trying COCO model...")
-            # Fallback to COCO model
-            result = client.infer(filepath, model_id="coco/3")
-            logger.info("COCO model detection completed")
+            filters = parse_filter_params(values)
+        except ValueError as e:
+            os.remove(filepath)
+            return jsonify({'error': f'Invalid filter: {str(e)}'}), 400
+        
+        # Validate from the header alone, before any pixels are decoded
+        try:
+            info = inspect_image(filepath)
+        except ImageValidationError as e:
+            os.remove(filepath)
+            return jsonify({'error': str(e)}), 400
+        image_size = info.size
+        
+        # Project this request's peak memory: decode at reduced size when it
+        # is over budget, and wait while other large images hold the instance
+        try:
+            memory.plan = plan_request(info, os.path.getsize(filepath))
+            reservation = request_memory.reserve(memory.plan.projected_bytes, deadline.remaining())
+        except MemoryBudgetError as e:
+            if e.status == 413:
+                request_memory.reject()
+            os.remove(filepath)
+            response = jsonify({'error': str(e)})
+            if e.status == 503:
+                response.headers['Retry-After'] = '5'
+            return response, e.status
+        decode_side = memory.plan.max_side
+        memory.mark('inspect')
+        
+        # Look for a near-duplicate of a recent photo before calling Roboflow
+        tiled = values.get('tiled')
+        cache_hit = None
+        use_cache = image_cache.enabled and values.get('cache') != '0'
+        if use_cache:
+            variant = detection_variant(filters, tiled)
+            cached = image_cache.lookup_digest(digest, variant) if digest else None
+            if cached is not None:
+                cache_hit = (0, cached[1])
+            else:
+                photo_hash = image_hash(filepath, info.orientation)
+                cache_hit = image_cache.lookup(photo_hash, image_size, variant)
+        
+        if cache_hit is not None:
+            distance, detections = cache_hit
+            logger.info(f"Near-duplicate cache hit (distance {distance})")
+            if image_cache.should_audit():
+                image, scale = decode_image(filepath, decode_side, info)
+                threading.Thread(target=audit_cached_detections, daemon=True,
+                                 args=(image, scale, image_size, detections, distance, filters)).start()
+                image = None
+        else:
+            # Run furniture detection using Roboflow API
+            logger.info("Running Roboflow detection...")
+            try:
+                if tiling_possible(tiled):
+                    image = None
+                    if should_tile(image_size[0], image_size[1], tiled):
+                        image, scale = decode_image(filepath, decode_side, info)
+                    if image is not None:
+                        # Tiles cut off by the deadline are skipped; the rest are kept
+                        detections = run_tiled_inference(image, lambda tile: run_detection(tile, filters, deadline),
+                                                         deadline=deadline)
+                        detections = detections.scaled(1 / scale[0], 1 / scale[1])
+                        image = None
+                    else:
+                        detections = run_file_detection(filepath, info, filters, decode_side, deadline)
+                else:
+                    detections = run_file_detection(filepath, info, filters, decode_side, deadline)
+            except DeadlineExceeded as e:
+                logger.warning(f"Returning partial result: {e}")
+                detections = DetectionSet.empty()
+            # Only complete results are reused
+            if use_cache and not deadline.partial:
+                image_cache.store(photo_hash, image_size, variant, detections, digest)
+        memory.mark('inference')
         
-        # Extract detections
-        detections = []
-        if isinstance(result, list) and len(result) > 0:
-            # Workflow response format
-            first_result = result[0]
-            if 'predictions' in first_result and 'predictions' in first_result['predictions']:
-                detections = first_result['predictions']['predictions']
-            elif 'detections' in first_result:
-                detections = first_result['detections']
-        elif 'predictions' in result:
-            # Direct inference response format
-            detections = result['predictions']
-        elif 'detections' in result:
-            detections = result['detections']
+        # Clip and de-duplicate overlapping boxes, then apply the request
+        # filters so counting, rendering and the response use the reduced set
+        detections = postprocess_detections(detections, image_size)
+        detections = apply_filters(detections, filters)
         
-        if not detections:
+        # Decode once for the steps below that work on crops
+        property_name = values.get('property')
+        room_name = values.get('room')
+        want_crops = values.get('crops') == '1'
+        if property_name and room_name and deadline.partial:
+            # Incomplete detections would undercount the room
+            deadline.skip('inventory')
+            property_name = room_name = None
+        if want_crops and not deadline.allows(DEADLINE_CROPS_MIN):
+            deadline.skip('crops')
+            want_crops = False
+        image = None
+        if (property_name and room_name) or want_crops:
+            image, scale = decode_image(filepath, decode_side, info)
+            memory.mark('decode')
+        
+        # Record the photo in the inventory when a property and room are given
+        photo_id = None
+        if property_name and room_name:
+            # Fingerprint every crop so repeat sightings of an item across
+            # photos of the room are counted once
+            fingerprints = crop_fingerprints(image, detections.scaled(*scale)) if image is not None else None
+            photo_id = inventory_store.add_photo(property_name, room_name, detections,
+                                                 original_filename, image_size, fingerprints)
+        
+        # Thumbnail of each detected item, when requested
+        crops = None
+        omitted_crops = 0
+        if want_crops and image is not None and len(detections):
+            crops = save_crop_thumbnails(image, detections.scaled(*scale), CROP_FOLDER)
+            omitted_crops = crops_omitted(detections)
+        # Release the decoded pixels before rendering the visualization
+        image = None
+        memory.mark('crops')
+        
+        if len(detections) == 0:
             # Return original image if no furniture detected
             with open(filepath, 'rb') as img_file:
                 img_data = base64.b64encode(img_file.read()).decode('utf-8')
             
             os.remove(filepath)
             
+            timed_out = any(stage in deadline.skipped for stage in ('inference', 'fallback', 'tiles'))
             return jsonify({
                 'success': True,
-                'message': 'No furniture detected in the image.',
+                'message': ('Detection did not finish in time.' if timed_out
+                            else 'No furniture detected in the image.'),
                 'total_objects': 0,
                 'object_counts': {},
                 'detections': [],
+                'photo_id': photo_id,
+                'cached': cache_hit is not None,
+                'crops': crops,
+                'crops_omitted': omitted_crops,
+                'partial': deadline.partial,
+                'skipped': deadline.skipped,
                 'output_image': f"data:image/jpeg;base64,{img_data}"
             })
         
         # Count objects by class
-        object_counts = Counter()
-        detection_list = []
-        
-        for detection in detections:
-            class_name = detection.get('class', 'Unknown')
-            confidence = detection.get('confidence', 0)
-            object_counts[class_name] += 1
-            
-            # Include all detection data for frontend processing
-            detection_list.append({
-                'class': class_name,
-                'confidence': confidence,
-                'x': detection.get('x', 0),
-                'y': detection.get('y', 0),
-                'width': detection.get('width', 0),
-                'height': detection.get('height', 0),
-                'detection_id': detection.get('detection_id', ''),
-                'class_id': detection.get('class_id', 0)
-            })
-        
-        # Create visualization
-        output_filename = f"output_{filename}"
-        output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+        object_counts = detections.counts()
         
-        if create_visualization(filepath, detections, output_path):
+        # Create visualization at full size, reduced size or, when the budget
+        # is nearly spent, not at all (the browser then draws the boxes)
+        visualization = None
+        if not deadline.allows(DEADLINE_RENDER_MIN):
+            deadline.skip('visualization')
+        elif not deadline.allows(DEADLINE_RENDER_FULL):
+            deadline.skip('full_size_visualization')
+            visualization = create_visualization(filepath, detections,
+                                                 min(VISUALIZATION_MAX_SIDE, DEADLINE_RENDER_REDUCED_SIDE))
+        else:
+            visualization = create_visualization(filepath, detections)
+        memory.mark('visualization')
+        if visualization is not None:
             # Convert output image to base64 for display
-            with open(output_path, 'rb') as img_file:
-                img_data = base64.b64encode(img_file.read()).decode('utf-8')
+            img_data = base64.b64encode(visualization).decode('utf-8')
+            visualization = None
             
             response_data = {
                 'success': True,
                 'total_objects': len(detections),
-                'object_counts': dict(object_counts.most_common()),
-                'detections': detection_list,
+                'object_counts': object_counts,
+                'detections': detections,
+                'photo_id': photo_id,
+                'cached': cache_hit is not None,
+                'crops': crops,
+                'crops_omitted': omitted_crops,
+                'partial': deadline.partial,
+                'skipped': deadline.skipped,
                 'output_image': f"data:image/jpeg;base64,{img_data}"
             }
             
             # Clean up files
             os.remove(filepath)
-            os.remove(output_path)
             
-            return jsonify(response_data)
+            return json_response(response_data)
+        elif 'visualization' in deadline.skipped:
+            os.remove(filepath)
+            
+            return json_response({
+                'success': True,
+                'total_objects': len(detections),
+                'object_counts': object_counts,
+                'detections': detections,
+                'photo_id': photo_id,
+                'cached': cache_hit is not None,
+                'crops': crops,
+                'crops_omitted': omitted_crops,
+                'partial': True,
+                'skipped': deadline.skipped,
+                'output_image': None
+            })
         else:
             # If visualization fails, return original image
             with open(filepath, 'rb') as img_file:
@@ -249,12 +794,18 @@ def upload_file():
             
             os.remove(filepath)
             
-            return jsonify({
+            return json_response({
                 'success': True,
                 'message': 'Detection successful but visualization failed.',
                 'total_objects': len(detections),
-                'object_counts': dict(object_counts.most_common()),
-                'detections': detection_list,
+                'object_counts': object_counts,
+                'detections': detections,
+                'photo_id': photo_id,
+                'cached': cache_hit is not None,
+                'crops': crops,
+                'crops_omitted': omitted_crops,
+                'partial': deadline.partial,
+                'skipped': deadline.skipped,
                 'output_image': f"data:image/jpeg;base64,{img_data}"
             })
             
@@ -264,6 +815,80 @@ def upload_file():
         if 'filepath' in locals() and os.path.exists(filepath):
             os.remove(filepath)
         return jsonify({'error': f'Processing failed: {str(e)}'}), 500
+    finally:
+        # Runs after the response body is built, so 'response' covers encoding
+        if reservation is not None:
+            memory.mark('response')
+            reservation.release()
+            request_memory.record(memory)
+
+def upload_is_cached(digest, values):
+    """Whether detections for this exact content and these parameters are cached"""
+    if not image_cache.enabled or values.get('cache') == '0':
+        return False
+    try:
+        filters = parse_filter_params(values)
+    except ValueError:
+        return False
+    return image_cache.lookup_digest(digest, detection_variant(filters, values.get('tiled'))) is not None
+
+def cached_upload_result(digest, values):
+    """The /upload response for content whose detections are cached, or None
+    
+    Lets the browser skip the upload entirely. There is no output_image:
+    the browser draws the boxes on its own copy. Inventory and crop
+    requests need the pixels, so they always upload.
+    """
+    if not image_cache.enabled or values.get('cache') == '0':
+        return None
+    if values.get('property') or values.get('room') or values.get('crops') == '1':
+        return None
+    try:
+        filters = parse_filter_params(values)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter: {str(e)}'}), 400
+    cached = image_cache.lookup_digest(digest, detection_variant(filters, values.get('tiled')))
+    if cached is None:
+        return None
+    image_size, detections = cached
+    logger.info("Exact cache hit before upload")
+    detections = postprocess_detections(detections, image_size)
+    detections = apply_filters(detections, filters)
+    response_data = {
+        'success': True,
+        'total_objects': len(detections),
+        'object_counts': detections.counts(),
+        'detections': detections,
+        'photo_id': None,
+        'cached': True,
+        'crops': None,
+        'crops_omitted': 0,
+        'output_image': None
+    }
+    if len(detections) == 0:
+        response_data['message'] = 'No furniture detected in the image.'
+    return json_response(response_data)
+
+# Browser-side downscaling settings, and result lookup by hash before uploading
+register_client_upload_routes(app, cached_upload_result, progressive=bool(PROGRESSIVE_PREVIEW_SIDE))
+
+# Resumable chunked uploads for photos too large for one request
+chunked_uploads = ChunkedUploadStore(os.path.join(app.config['UPLOAD_FOLDER'], 'chunked'))
+register_chunked_upload_routes(app, chunked_uploads, process_upload, upload_is_cached)
+
+# Detection for images given by URL, e.g. listing photos from the crawler
+remote_fetcher = RemoteImageFetcher(os.path.join(app.config['UPLOAD_FOLDER'], 'url_cache'))
+register_remote_image_routes(app, remote_fetcher, app.config['UPLOAD_FOLDER'], process_upload)
+
+# Janitor for uploads and outputs (crop thumbnails included) left behind by
+# failed requests; chunked uploads and the URL cache manage their own files
+scratch = ScratchSpace([app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER']],
+                       skip=[chunked_uploads.folder, remote_fetcher.cache_folder],
+                       on_sweep=chunked_uploads.expire)
+scratch.start()
+
+# Warm up in the background so the worker can answer /ready while warming
+threading.Thread(target=warm_up, daemon=True).start()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
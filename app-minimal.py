@@ -2,7 +2,7 @@ import os
 import json
 import cv2
 import numpy as np
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, jsonify
 from werkzeug.utils import secure_filename
 from collections import Counter
 from inference_sdk import InferenceHTTPClient
@@ -10,9 +10,11 @@ import base64
 from io import BytesIO
 from PIL import Image
 import requests
+from assets import register_asset_routes
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+asset_store = register_asset_routes(app)
 
 # Use /tmp for Cloud Run
 app.config['UPLOAD_FOLDER'] = '/tmp/uploads'
@@ -103,7 +105,7 @@ def create_visualization(image_path, detections, output_path):
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return asset_store.page('index.html')
 
 @app.route('/health')
 def health():
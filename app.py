@@ -2,13 +2,25 @@ import os
 import json
 import cv2
 import numpy as np
-from flask import Flask, request, render_template, jsonify, send_file, url_for
+from flask import Flask, request, jsonify, send_file, url_for
 from werkzeug.utils import secure_filename
-from collections import Counter
 from inference_sdk import InferenceHTTPClient
 import base64
 from io import BytesIO
 from PIL import Image
+from profiling import profile_upload, register_profiling_routes
+from detections import DetectionSet, encode_json
+from postprocess import postprocess_detections
+from filters import parse_filter_params, apply_filters
+from inventory import InventoryStore, register_inventory_routes
+from fingerprints import crop_fingerprints
+from crops import register_crop_routes, save_crop_thumbnails
+from export import register_export_routes
+from imaging import decode_image, inspect_image, ImageValidationError, VISUALIZATION_MAX_SIDE
+from scratch import ScratchSpace
+from assets import register_asset_routes, compress_json_responses
+from client_uploads import register_client_upload_routes
+from cassette import wrap_client
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
@@ -26,24 +38,54 @@ except PermissionError:
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
-# Initialize Roboflow client
-client = InferenceHTTPClient(
+# Initialize Roboflow client (recorded or replayed when ROBOFLOW_CASSETTE is set)
+client = wrap_client(InferenceHTTPClient(
     api_url="https://serverless.roboflow.com",
     api_key=os.getenv("ROBOFLOW_API_KEY", "OCYzLwdUcqDtypAh0OYT")
-)
+))
+
+register_profiling_routes(app)
+
+# Fingerprinted, precompressed frontend assets; JSON responses compressed on request
+asset_store = register_asset_routes(app)
+compress_json_responses(app)
+
+# Browser-side downscaling settings
+register_client_upload_routes(app)
+
+# Persistent property -> room -> photo inventory
+inventory_store = InventoryStore(os.getenv("INVENTORY_DB", "inventory.db"))
+register_inventory_routes(app, inventory_store)
+register_export_routes(app, inventory_store)
+
+# Per-detection crop thumbnails, served from the output folder
+CROP_FOLDER = os.path.join(app.config['OUTPUT_FOLDER'], 'crops')
+register_crop_routes(app, CROP_FOLDER)
+
+# Janitor for uploads and outputs (crop thumbnails included), with age and size limits
+scratch = ScratchSpace([app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER']])
+scratch.start()
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def create_visualization(image_path, detections, output_path):
-    """Create a visualization of the detections on the image"""
+def json_response(payload):
+    """Like jsonify, but encodes DetectionSets directly with the fast encoder"""
+    return app.response_class(encode_json(payload), mimetype='application/json')
+
+def create_visualization(image_path, detections):
+    """Render the detections on the image and return it as JPEG bytes (None on failure)"""
     try:
-        # Load image
-        image = cv2.imread(image_path)
+        # Decode only as large as the rendered output needs, and map the
+        # boxes into the decoded image's coordinates
+        image, scale = decode_image(image_path, VISUALIZATION_MAX_SIDE)
         if image is None:
-            return False
+            return None
+        
+        if scale != (1.0, 1.0):
+            detections = detections.scaled(*scale)
         
         # Define colors for different classes (BGR format for OpenCV)
         colors = [
@@ -57,30 +99,15 @@ def create_visualization(image_path, detections, output_path):
             (255, 165, 0),  # Orange
         ]
         
-        class_color_map = {}
-        color_index = 0
+        # One color per entry in the interned class table
+        class_colors = [colors[i % len(colors)] for i in range(len(detections.class_names))]
+        boxes = detections.boxes_xyxy().astype(np.int32).tolist()
         
         # Draw bounding boxes and labels
-        for detection in detections:
-            class_name = detection.get('class', 'Unknown')
-            confidence = detection.get('confidence', 0)
-            x = detection.get('x', 0)
-            y = detection.get('y', 0)
-            width = detection.get('width', 0)
-            height = detection.get('height', 0)
-            
-            # Assign color to class if not already assigned
-            if class_name not in class_color_map:
-                class_color_map[class_name] = colors[color_index % len(colors)]
-                color_index += 1
-            
-            color = class_color_map[class_name]
-            
-            # Calculate bounding box coordinates
-            x1 = int(x - width / 2)
-            y1 = int(y - height / 2)
-            x2 = int(x + width / 2)
-            y2 = int(y + height / 2)
+        for (x1, y1, x2, y2), class_index, confidence in zip(
+                boxes, detections.class_index.tolist(), detections.confidence.tolist()):
+            class_name = detections.class_names[class_index]
+            color = class_colors[class_index]
             
             # Draw bounding box
             cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
@@ -97,19 +124,20 @@ def create_visualization(image_path, detections, output_path):
             cv2.putText(image, label, (x1, y1 - 5), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
         
-        # Save the visualization
-        cv2.imwrite(output_path, image)
-        return True
+        # Encode in memory; the result only ever goes into the response
+        ok, encoded = cv2.imencode('.jpg', image)
+        return encoded.tobytes() if ok else None
         
     except Exception as e:
         print(f"Error creating visualization: {str(e)}")
-        return False
+        return None
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return asset_store.page('index.html')
 
 @app.route('/upload', methods=['POST'])
+@profile_upload
 def upload_file():
     try:
         if 'file' not in request.files:
@@ -122,80 +150,101 @@ def upload_file():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file type. Please upload an image file.'}), 400
         
-        # Save uploaded file
-        filename = secure_filename(file.filename)
-        timestamp = str(int(np.random.random() * 1000000))
-        filename = f"{timestamp}_{filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Run furniture detection
-        result = client.run_workflow(
-            workspace_name="petes-workspace-oetpj",
-            workflow_id="detect-count-and-visualise-furniture-instant",
-            images={
-                "image": filepath
-            },
-            use_cache=True
-        )
+        try:
+            filters = parse_filter_params(request.values)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid filter: {str(e)}'}), 400
         
-        # Extract detections
-        detections = []
-        if isinstance(result, list) and len(result) > 0:
-            first_result = result[0]
-            if 'predictions' in first_result and 'predictions' in first_result['predictions']:
-                detections = first_result['predictions']['predictions']
-            elif 'detections' in first_result:
-                detections = first_result['detections']
-        
-        if not detections:
-            return jsonify({'error': 'No furniture detected in the image'}), 400
-        
-        # Count objects by class
-        object_counts = Counter()
-        detection_list = []
-        
-        for detection in detections:
-            class_name = detection.get('class', 'Unknown')
-            confidence = detection.get('confidence', 0)
-            object_counts[class_name] += 1
+        # Save uploaded file into a request directory that is removed however
+        # processing ends
+        with scratch.request_dir() as directory:
+            filename = secure_filename(file.filename)
+            timestamp = str(int(np.random.random() * 1000000))
+            filename = f"{timestamp}_{filename}"
+            filepath = os.path.join(directory, filename)
+            file.save(filepath)
             
-            # Include all detection data for frontend processing
-            detection_list.append({
-                'class': class_name,
-                'confidence': confidence,
-                'x': detection.get('x', 0),
-                'y': detection.get('y', 0),
-                'width': detection.get('width', 0),
-                'height': detection.get('height', 0),
-                'detection_id': detection.get('detection_id', ''),
-                'class_id': detection.get('class_id', 0)
-            })
-        
-        # Create visualization
-        output_filename = f"output_{filename}"
-        output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
-        
-        if create_visualization(filepath, detections, output_path):
-            # Convert output image to base64 for display
-            with open(output_path, 'rb') as img_file:
-                img_data = base64.b64encode(img_file.read()).decode('utf-8')
+            # Validate from the header alone, before any pixels are decoded
+            try:
+                info = inspect_image(filepath)
+            except ImageValidationError as e:
+                os.remove(filepath)
+                return jsonify({'error': str(e)}), 400
+            image_size = info.size
+            
+            # Rotated photos are sent upright so detection and rendering agree
+            image_source = filepath
+            if info.orientation != 1:
+                image_source = decode_image(filepath, info=info)[0]
+            
+            # Run furniture detection
+            result = client.run_workflow(
+                workspace_name="petes-workspace-oetpj",
+                workflow_id="detect-count-and-visualise-furniture-instant",
+                images={
+                    "image": image_source
+                },
+                use_cache=True
+            )
+            
+            # Parse detections once into a columnar set
+            detections = DetectionSet.from_roboflow(result)
+            
+            # Clip and de-duplicate overlapping boxes, then apply the request
+            # filters so counting, rendering and the response use the reduced set
+            detections = postprocess_detections(detections, image_size)
+            detections = apply_filters(detections, filters)
+            
+            # Decode once for the steps below that work on crops
+            property_name = request.values.get('property')
+            room_name = request.values.get('room')
+            want_crops = request.values.get('crops') == '1'
+            image = None
+            if (property_name and room_name) or want_crops:
+                image = decode_image(filepath, info=info)[0]
+            
+            # Record the photo in the inventory when a property and room are given
+            photo_id = None
+            if property_name and room_name:
+                # Fingerprint every crop so repeat sightings of an item across
+                # photos of the room are counted once
+                fingerprints = crop_fingerprints(image, detections) if image is not None else None
+                photo_id = inventory_store.add_photo(property_name, room_name, detections,
+                                                     file.filename, image_size, fingerprints)
             
-            response_data = {
-                'success': True,
-                'total_objects': len(detections),
-                'object_counts': dict(object_counts.most_common()),
-                'detections': detection_list,
-                'output_image': f"data:image/jpeg;base64,{img_data}"
-            }
+            # Thumbnail of each detected item, when requested
+            crops = None
+            if want_crops and image is not None and len(detections):
+                crops = save_crop_thumbnails(image, detections, CROP_FOLDER)
+            # Release the decoded pixels before rendering the visualization
+            image = None
             
-            # Clean up uploaded file
-            os.remove(filepath)
+            if len(detections) == 0:
+                return jsonify({'error': 'No furniture detected in the image'}), 400
             
-            return jsonify(response_data)
-        else:
-            return jsonify({'error': 'Failed to create visualization'}), 500
+            # Count objects by class
+            object_counts = detections.counts()
             
+            # Create visualization
+            visualization = create_visualization(filepath, detections)
+            if visualization is not None:
+                # Convert output image to base64 for display
+                img_data = base64.b64encode(visualization).decode('utf-8')
+                
+                response_data = {
+                    'success': True,
+                    'total_objects': len(detections),
+                    'object_counts': object_counts,
+                    'detections': detections,
+                    'photo_id': photo_id,
+                    'crops': crops,
+                    'output_image': f"data:image/jpeg;base64,{img_data}"
+                }
+                
+                return json_response(response_data)
+            else:
+                return jsonify({'error': 'Failed to create visualization'}), 500
+                
     except Exception as e:
         return jsonify({'error': f'Processing failed: {str(e)}'}), 500
 
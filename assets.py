@@ -0,0 +1,227 @@
+import os
+import gzip
+import json
+import hashlib
+import logging
+import argparse
+from flask import request, render_template, url_for, abort, current_app
+
+# Brotli is optional; without it assets and JSON are served gzip-compressed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+ASSET_SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+ASSET_BUILD_DIR = os.path.join(ASSET_SOURCE_DIR, 'dist')
+MANIFEST_NAME = 'manifest.json'
+ASSET_TYPES = {
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8',
+}
+# Fingerprinted URLs never change content, so browsers may keep them for a year
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# JSON responses smaller than this are sent uncompressed
+JSON_COMPRESS_MIN_BYTES = int(os.getenv("JSON_COMPRESS_MIN_BYTES", "1024"))
+JSON_GZIP_LEVEL = int(os.getenv("JSON_GZIP_LEVEL", "6"))
+JSON_BROTLI_QUALITY = int(os.getenv("JSON_BROTLI_QUALITY", "5"))
+
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def fingerprint(name, data):
+    """app.css -> app.<content hash>.css"""
+    base, ext = os.path.splitext(name)
+    return f"{base}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def precompress(data):
+    """Maximum-effort compressed variants that are actually smaller than data"""
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {encoding: body for encoding, body in variants.items() if len(body) < len(data)}
+
+
+def _sources(source_dir):
+    for name in sorted(os.listdir(source_dir)):
+        path = os.path.join(source_dir, name)
+        if os.path.isfile(path) and os.path.splitext(name)[1] in ASSET_TYPES:
+            with open(path, 'rb') as f:
+                yield name, f.read()
+
+
+def build_assets(source_dir=ASSET_SOURCE_DIR, build_dir=ASSET_BUILD_DIR):
+    """Write fingerprinted, precompressed copies of every asset plus a manifest
+
+    Returns the manifest: source name -> fingerprinted name. Files from
+    earlier builds that are no longer referenced are removed.
+    """
+    os.makedirs(build_dir, exist_ok=True)
+    manifest = {}
+    written = {MANIFEST_NAME}
+    for name, data in _sources(source_dir):
+        hashed = fingerprint(name, data)
+        manifest[name] = hashed
+        outputs = {hashed: data}
+        for encoding, body in precompress(data).items():
+            outputs[hashed + ENCODING_SUFFIXES[encoding]] = body
+        for filename, body in outputs.items():
+            with open(os.path.join(build_dir, filename), 'wb') as f:
+                f.write(body)
+            written.add(filename)
+    with open(os.path.join(build_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    for filename in os.listdir(build_dir):
+        if filename not in written:
+            os.remove(os.path.join(build_dir, filename))
+    return manifest
+
+
+def _negotiate(available):
+    """Best of the available encodings the client accepts: br, then gzip, else identity"""
+    offered = [encoding for encoding in ('br', 'gzip') if encoding in available]
+    if not offered:
+        return None
+    return request.accept_encodings.best_match(offered)
+
+
+def _respond(body, variants, content_type, etag, cache_control):
+    encoding = _negotiate(variants)
+    response = current_app.response_class(variants[encoding] if encoding else body,
+                                          content_type=content_type)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = cache_control
+    # Each encoding is a different representation, so it gets its own ETag
+    response.set_etag(f"{etag}-{encoding}" if encoding else etag)
+    return response.make_conditional(request)
+
+
+class AssetStore:
+    """Fingerprinted frontend assets and cached HTML pages, held in memory
+
+    Uses the build output (python assets.py) when its manifest matches the
+    current sources; otherwise, e.g. in development, the sources are
+    fingerprinted and compressed once at startup.
+    """
+
+    def __init__(self, source_dir=ASSET_SOURCE_DIR, build_dir=ASSET_BUILD_DIR):
+        self.files = {}
+        self.manifest = {}
+        self.pages = {}
+        self._load(source_dir, build_dir)
+
+    def _load(self, source_dir, build_dir):
+        try:
+            with open(os.path.join(build_dir, MANIFEST_NAME)) as f:
+                built = json.load(f)
+        except (OSError, ValueError):
+            built = {}
+        stale = False
+        for name, data in _sources(source_dir):
+            hashed = fingerprint(name, data)
+            variants = None
+            if built.get(name) == hashed:
+                variants = self._read_variants(build_dir, hashed)
+            if variants is None:
+                stale = True
+                variants = precompress(data)
+            self.manifest[name] = hashed
+            self.files[hashed] = {
+                'body': data,
+                'variants': variants,
+                'content_type': ASSET_TYPES[os.path.splitext(name)[1]],
+                'etag': hashed
+            }
+        if stale:
+            logger.info("Asset build missing or out of date; compressed assets at startup")
+
+    def _read_variants(self, build_dir, hashed):
+        variants = {}
+        for encoding, suffix in ENCODING_SUFFIXES.items():
+            path = os.path.join(build_dir, hashed + suffix)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    variants[encoding] = f.read()
+        return variants if 'gzip' in variants else None
+
+    def url(self, name):
+        return url_for('asset_file', filename=self.manifest.get(name, name))
+
+    def serve(self, filename):
+        entry = self.files.get(filename)
+        if entry is None:
+            abort(404)
+        return _respond(entry['body'], entry['variants'], entry['content_type'], entry['etag'],
+                        ASSET_CACHE_CONTROL)
+
+    def page(self, template_name, **context):
+        """Serve a rendered template with an ETag, so a repeat visit costs a 304
+
+        Pages are rendered once per process; they only change on deploy.
+        """
+        entry = self.pages.get(template_name)
+        if entry is None:
+            body = render_template(template_name, **context).encode('utf-8')
+            entry = {
+                'body': body,
+                'variants': precompress(body),
+                'etag': hashlib.sha256(body).hexdigest()[:16]
+            }
+            self.pages[template_name] = entry
+        # no-cache: the browser keeps the page but revalidates it on every visit
+        return _respond(entry['body'], entry['variants'], 'text/html; charset=utf-8', entry['etag'],
+                        'no-cache')
+
+
+def register_asset_routes(app, store=None):
+    """Serve fingerprinted assets under /assets and expose asset_url() to templates"""
+    store = store or AssetStore()
+
+    @app.route('/assets/<filename>')
+    def asset_file(filename):
+        return store.serve(filename)
+
+    app.jinja_env.globals['asset_url'] = store.url
+    return store
+
+
+def compress_json_responses(app, min_bytes=JSON_COMPRESS_MIN_BYTES):
+    """Compress JSON responses with brotli or gzip when the client accepts it"""
+
+    @app.after_request
+    def compress_json(response):
+        if (response.mimetype != 'application/json' or response.direct_passthrough
+                or response.is_streamed or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = _negotiate(['br', 'gzip'] if brotli is not None else ['gzip'])
+        data = response.get_data()
+        if encoding is None or len(data) < min_bytes:
+            return response
+        if encoding == 'br':
+            data = brotli.compress(data, quality=JSON_BROTLI_QUALITY)
+        else:
+            data = gzip.compress(data, compresslevel=JSON_GZIP_LEVEL)
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress the frontend assets")
+    parser.add_argument('--source', default=ASSET_SOURCE_DIR)
+    parser.add_argument('--output', default=ASSET_BUILD_DIR)
+    args = parser.parse_args()
+    if brotli is None:
+        print("brotli is not installed; writing gzip variants only")
+    for name, hashed in build_assets(args.source, args.output).items():
+        print(f"{name} -> {hashed}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+const uploadArea = document.getElementById('uploadArea');
+const fileInput = document.getElementById('fileInput');
+const uploadBtn = document.getElementById('uploadBtn');
+const uploadSection = document.getElementById('uploadSection');
+const loading = document.getElementById('loading');
+const results = document.getElementById('results');
+const error = document.getElementById('error');
+const refining = document.getElementById('refining');
+
+// File upload handlers
+uploadBtn.addEventListener('click', () => fileInput.click());
+uploadArea.addEventListener('click', () => fileInput.click());
+
+// Drag and drop handlers
+uploadArea.addEventListener('dragover', (e) => {
+    e.preventDefault();
+    uploadArea.classList.add('dragover');
+});
+
+uploadArea.addEventListener('dragleave', () => {
+    uploadArea.classList.remove('dragover');
+});
+
+uploadArea.addEventListener('drop', (e) => {
+    e.preventDefault();
+    uploadArea.classList.remove('dragover');
+    const files = e.dataTransfer.files;
+    if (files.length > 0) {
+        handleFile(files[0]);
+    }
+});
+
+fileInput.addEventListener('change', (e) => {
+    if (e.target.files.length > 0) {
+        handleFile(e.target.files[0]);
+    }
+});
+
+// Upload settings advertised by the server; without them photos are sent as taken
+const configReady = fetch('/config')
+    .then(response => response.ok ? response.json() : null)
+    .catch(() => null);
+
+const uploadWorkerUrl = document.currentScript && document.currentScript.dataset.worker;
+let uploadWorker = null;
+let nextJobId = 0;
+const pendingJobs = new Map();
+
+function handleFile(file) {
+    // Validate file type
+    const allowedTypes = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/bmp'];
+    if (!allowedTypes.includes(file.type)) {
+        showError('Please upload a valid image file (JPG, PNG, GIF, BMP)');
+        return;
+    }
+
+    uploadImage(file);
+}
+
+function getUploadWorker() {
+    if (!uploadWorker && uploadWorkerUrl && window.Worker) {
+        uploadWorker = new Worker(uploadWorkerUrl);
+        uploadWorker.onmessage = (event) => {
+            const job = pendingJobs.get(event.data.id);
+            pendingJobs.delete(event.data.id);
+            if (job) {
+                job(event.data);
+            }
+        };
+    }
+    return uploadWorker;
+}
+
+// Downscale and hash the photo in the worker; falls back to the original file
+function prepareUpload(file, config) {
+    const worker = config ? getUploadWorker() : null;
+    if (!worker) {
+        return Promise.resolve({ blob: file, sha256: null });
+    }
+    return new Promise((resolve) => {
+        const id = nextJobId++;
+        pendingJobs.set(id, (result) => {
+            resolve(result.error ? { blob: file, sha256: null } : result);
+        });
+        worker.postMessage({ id, file, config });
+    });
+}
+
+// Ask for a known result by hash before sending any image bytes
+function lookupResult(sha256) {
+    return fetch('/results/' + sha256)
+        .then(response => response.ok ? response.json() : null)
+        .catch(() => null);
+}
+
+function postUpload(blob, filename, onPreview) {
+    const formData = new FormData();
+    formData.append('file', blob, filename);
+    if (onPreview) {
+        formData.append('progressive', '1');
+    }
+    return fetch('/upload', {
+        method: 'POST',
+        body: formData
+    }).then((response) => {
+        const type = response.headers.get('Content-Type') || '';
+        if (!type.startsWith('application/x-ndjson')) {
+            return response.json();
+        }
+        return readPasses(response, onPreview);
+    });
+}
+
+// Progressive uploads answer with NDJSON: a preview line, then the final result
+async function readPasses(response, onPreview) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    let final = null;
+    for (;;) {
+        const { done, value } = await reader.read();
+        buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+        for (const line of lines.filter((line) => line.trim())) {
+            const message = JSON.parse(line);
+            if (message.pass === 'preview') {
+                onPreview(message.result);
+            } else {
+                final = message.result;
+            }
+        }
+        if (done) {
+            return final || { error: 'The connection closed before the result arrived' };
+        }
+    }
+}
+
+function uploadFilename(file, blob) {
+    // A re-encoded photo gets the extension of its new format
+    if (blob === file) {
+        return file.name;
+    }
+    const extension = blob.type === 'image/png' ? '.png' : '.jpg';
+    return file.name.replace(/\.[^.]*$/, '') + extension;
+}
+
+async function uploadImage(file) {
+    // Show loading state
+    uploadSection.style.display = 'none';
+    loading.style.display = 'block';
+    error.style.display = 'none';
+    results.style.display = 'none';
+    refining.style.display = 'none';
+    document.getElementById('inventoryList').innerHTML = '';
+
+    try {
+        const config = await configReady;
+        const prepared = await prepareUpload(file, config);
+
+        // Validate the size of what will actually be sent (16MB unless the server says otherwise)
+        const maxBytes = (config && config.max_upload_bytes) || 16 * 1024 * 1024;
+        if (prepared.blob.size > maxBytes) {
+            loading.style.display = 'none';
+            showError(`File size must be less than ${Math.round(maxBytes / 1024 / 1024)}MB`);
+            return;
+        }
+
+        let data = null;
+        if (prepared.sha256 && config && config.hash_lookup) {
+            data = await lookupResult(prepared.sha256);
+        }
+        if (!data) {
+            let finished = false;
+            // Show the quick first pass while the full one runs; the final result replaces it
+            const onPreview = config && config.progressive ? async (preview) => {
+                preview.output_image = await drawDetections(prepared.blob, preview.detections);
+                if (!finished) {
+                    loading.style.display = 'none';
+                    displayResults(preview);
+                    refining.style.display = 'block';
+                }
+            } : null;
+            data = await postUpload(prepared.blob, uploadFilename(file, prepared.blob), onPreview);
+            finished = true;
+        }
+
+        if (data.success && !data.output_image) {
+            // A result found by hash comes without an image; draw it here
+            data.output_image = await drawDetections(prepared.blob, data.detections);
+        }
+        loading.style.display = 'none';
+        refining.style.display = 'none';
+
+        if (data.success) {
+            displayResults(data);
+        } else {
+            showError(data.error || 'An error occurred while processing the image');
+        }
+    } catch (err) {
+        loading.style.display = 'none';
+        refining.style.display = 'none';
+        showError('Network error: ' + err.message);
+    }
+}
+
+// Same palette as the server's visualization
+const boxColors = ['#0000ff', '#00ff00', '#ff0000', '#00ffff', '#ff00ff', '#ffff00', '#800080', '#00a5ff'];
+
+async function drawDetections(blob, detections) {
+    const bitmap = await createImageBitmap(blob, { imageOrientation: 'from-image' });
+    const canvas = document.createElement('canvas');
+    canvas.width = bitmap.width;
+    canvas.height = bitmap.height;
+    const context = canvas.getContext('2d');
+    context.drawImage(bitmap, 0, 0);
+    bitmap.close();
+
+    const classes = [];
+    context.lineWidth = 2;
+    context.font = 'bold 16px sans-serif';
+    context.textBaseline = 'bottom';
+    detections.forEach((detection) => {
+        if (!classes.includes(detection.class)) {
+            classes.push(detection.class);
+        }
+        const color = boxColors[classes.indexOf(detection.class) % boxColors.length];
+        const x = detection.x - detection.width / 2;
+        const y = detection.y - detection.height / 2;
+        const label = `${detection.class}: ${(detection.confidence * 100).toFixed(1)}%`;
+
+        context.strokeStyle = color;
+        context.strokeRect(x, y, detection.width, detection.height);
+        context.fillStyle = color;
+        context.fillRect(x, y - 22, context.measureText(label).width + 6, 22);
+        context.fillStyle = '#ffffff';
+        context.fillText(label, x + 3, y - 4);
+    });
+    return canvas.toDataURL('image/jpeg', 0.9);
+}
+
+function displayResults(data) {
+    // Display the result image
+    document.getElementById('resultImage').src = data.output_image;
+
+    // Display total objects
+    document.getElementById('totalObjects').textContent = data.total_objects;
+
+    // Display object counts
+    const objectCountsDiv = document.getElementById('objectCounts');
+    objectCountsDiv.innerHTML = '';
+
+    for (const [objectName, count] of Object.entries(data.object_counts)) {
+        const countDiv = document.createElement('div');
+        countDiv.className = 'object-count';
+        countDiv.innerHTML = `
+            <span class="object-name">${objectName}</span>
+            <span class="object-number">${count}</span>
+        `;
+        objectCountsDiv.appendChild(countDiv);
+    }
+
+    // Display inventory list with simplified single-row format. Rows are
+    // updated in place, so refining a preview keeps each item's checkbox
+    const inventoryListDiv = document.getElementById('inventoryList');
+    const unused = Array.from(inventoryListDiv.children);
+
+    data.detections.forEach((detection) => {
+        // Format confidence as percentage
+        const confidencePercent = (detection.confidence * 100).toFixed(1);
+
+        const match = unused.findIndex((row) => row.dataset.class === detection.class);
+        let inventoryDiv;
+        if (match >= 0) {
+            inventoryDiv = unused.splice(match, 1)[0];
+        } else {
+            inventoryDiv = document.createElement('div');
+            inventoryDiv.className = 'inventory-item';
+            inventoryDiv.innerHTML = `
+                <input type="checkbox" class="inventory-checkbox" checked>
+                <div class="inventory-content">
+                    <div class="inventory-details">
+                        <div class="inventory-meta">
+                            <span class="inventory-name"></span>
+                            <span class="inventory-confidence"></span>
+                        </div>
+                    </div>
+                    <div class="inventory-quantity">1</div>
+                </div>
+            `;
+        }
+        inventoryDiv.dataset.class = detection.class;
+        inventoryDiv.querySelector('.inventory-name').textContent = detection.class;
+        inventoryDiv.querySelector('.inventory-confidence').textContent = `${confidencePercent}%`;
+        // Appending an existing row moves it into the new order
+        inventoryListDiv.appendChild(inventoryDiv);
+    });
+    unused.forEach((row) => row.remove());
+
+    results.style.display = 'block';
+}
+
+function showError(message) {
+    document.getElementById('errorMessage').textContent = message;
+    error.style.display = 'block';
+    uploadSection.style.display = 'block';
+}
+
+function resetApp() {
+    uploadSection.style.display = 'block';
+    loading.style.display = 'none';
+    results.style.display = 'none';
+    error.style.display = 'none';
+    fileInput.value = '';
+}
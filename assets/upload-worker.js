@@ -0,0 +1,50 @@
+// Prepares a photo for upload off the main thread: downscales it to the
+// server's preferred size and hashes the bytes that will be sent.
+
+self.onmessage = async (event) => {
+    const { id, file, config } = event.data;
+    try {
+        const blob = await downscale(file, config);
+        const sha256 = await digest(blob);
+        self.postMessage({ id, blob, sha256 });
+    } catch (err) {
+        self.postMessage({ id, error: err.message });
+    }
+};
+
+async function downscale(file, config) {
+    if (!config.max_dimension || typeof OffscreenCanvas === 'undefined') {
+        return file;
+    }
+
+    // Decode with the EXIF orientation applied, so the pixels we send are upright
+    const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+    try {
+        const scale = config.max_dimension / Math.max(bitmap.width, bitmap.height);
+        if (scale >= 1) {
+            return file;
+        }
+
+        const width = Math.max(1, Math.round(bitmap.width * scale));
+        const height = Math.max(1, Math.round(bitmap.height * scale));
+        const canvas = new OffscreenCanvas(width, height);
+        const context = canvas.getContext('2d');
+        context.imageSmoothingQuality = 'high';
+        context.drawImage(bitmap, 0, 0, width, height);
+        const blob = await canvas.convertToBlob({ type: config.format, quality: config.quality });
+
+        // A heavily compressed original can beat the re-encode; keep whichever is smaller
+        return blob.size < file.size ? blob : file;
+    } finally {
+        bitmap.close();
+    }
+}
+
+async function digest(blob) {
+    // crypto.subtle only exists on HTTPS and localhost
+    if (!self.crypto || !self.crypto.subtle) {
+        return null;
+    }
+    const hash = await self.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+    return Array.from(new Uint8Array(hash), (byte) => byte.toString(16).padStart(2, '0')).join('');
+}
@@ -0,0 +1,110 @@
+"""Compare full and reduced-resolution JPEG decoding of large photos.
+
+Usage:
+    python benchmarks/bench_decode.py [photo.jpg ...] --repeat 5
+
+Without arguments, synthetic 12 MP (4032x3024) and 48 MP (8064x6048)
+phone-style JPEGs are generated from living-room.jpg. For each photo this
+times cv2.imread at full size, the IMREAD_REDUCED_COLOR_2/4/8 flags, PIL
+with draft(), and decode_image() for the visualization target, and reports
+the peak memory each decode allocates.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from imaging import decode_image, VISUALIZATION_MAX_SIDE
+
+
+def make_photo(directory, width, height):
+    """Upscale the sample photo and add sensor-like noise so it compresses like a real one"""
+    base = cv2.imread(os.path.join(ROOT, 'living-room.jpg'))
+    image = cv2.resize(base, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = np.random.default_rng(0).normal(0, 4, image.shape)
+    image = np.clip(image + noise, 0, 255).astype(np.uint8)
+    path = os.path.join(directory, f'phone_{width}x{height}.jpg')
+    cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+    return path
+
+
+def pil_draft(path, factor):
+    with Image.open(path) as img:
+        img.draft('RGB', (img.size[0] // factor, img.size[1] // factor))
+        return np.asarray(img.convert('RGB'))
+
+
+def decoders(path):
+    return [
+        ('cv2 full', lambda: cv2.imread(path)),
+        ('cv2 reduced 1/2', lambda: cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_2)),
+        ('cv2 reduced 1/4', lambda: cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_4)),
+        ('cv2 reduced 1/8', lambda: cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_8)),
+        ('PIL draft 1/4', lambda: pil_draft(path, 4)),
+        (f'decode_image({VISUALIZATION_MAX_SIDE})', lambda: decode_image(path, VISUALIZATION_MAX_SIDE)[0]),
+    ]
+
+
+def best_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def peak_bytes(fn):
+    """Peak bytes allocated while fn runs (decoded arrays are allocated through NumPy)"""
+    gc.collect()
+    tracemalloc.start()
+    image = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, image.shape
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('photos', nargs='*', help='JPEG files to decode (default: synthetic phone photos)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        photos = args.photos or [make_photo(directory, 4032, 3024), make_photo(directory, 8064, 6048)]
+        results = []
+        for path in photos:
+            print(f"\n{os.path.basename(path)} ({os.path.getsize(path) / 1e6:.1f} MB)")
+            print(f"{'decoder':<24}{'size':>12}{'ms':>10}{'peak MB':>10}")
+            for name, fn in decoders(path):
+                peak, shape = peak_bytes(fn)
+                row = {
+                    'photo': os.path.basename(path),
+                    'decoder': name,
+                    'width': shape[1],
+                    'height': shape[0],
+                    'ms': best_time(fn, args.repeat),
+                    'peak_bytes': peak,
+                }
+                results.append(row)
+                print(f"{name:<24}{f'{shape[1]}x{shape[0]}':>12}{row['ms']:>10.1f}{peak / 1e6:>10.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
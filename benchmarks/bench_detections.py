@@ -0,0 +1,124 @@
+"""Compare dict-based and DetectionSet detection handling.
+
+Usage:
+    python benchmarks/bench_detections.py --sizes 10 100 1000 10000
+
+Builds synthetic workflow payloads from detection_results.json and times
+parse + count + JSON serialization for the old dict/Counter/json path and
+for DetectionSet + encode_json, plus the memory each representation holds.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import uuid
+import random
+import argparse
+import tracemalloc
+from collections import Counter
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from detections import DetectionSet, encode_json, orjson
+
+
+def make_payload(count, seed=0):
+    with open(os.path.join(ROOT, 'detection_results.json')) as f:
+        templates = json.load(f)['detections']
+    rng = random.Random(seed)
+    predictions = []
+    for i in range(count):
+        detection = dict(templates[i % len(templates)])
+        detection['x'] += rng.uniform(-50, 50)
+        detection['y'] += rng.uniform(-50, 50)
+        detection['confidence'] = rng.random()
+        detection['detection_id'] = str(uuid.UUID(int=rng.getrandbits(128)))
+        predictions.append(detection)
+    return [{'predictions': {'image': {'width': 1000, 'height': 882}, 'predictions': predictions}}]
+
+
+def dict_path(result):
+    detections = result[0]['predictions']['predictions']
+    object_counts = Counter()
+    detection_list = []
+    for detection in detections:
+        class_name = detection.get('class', 'Unknown')
+        object_counts[class_name] += 1
+        detection_list.append({
+            'class': class_name,
+            'confidence': detection.get('confidence', 0),
+            'x': detection.get('x', 0),
+            'y': detection.get('y', 0),
+            'width': detection.get('width', 0),
+            'height': detection.get('height', 0),
+            'detection_id': detection.get('detection_id', ''),
+            'class_id': detection.get('class_id', 0)
+        })
+    return detection_list, json.dumps({
+        'object_counts': dict(object_counts.most_common()),
+        'detections': detection_list
+    }).encode('utf-8')
+
+
+def set_path(result):
+    detections = DetectionSet.from_roboflow(result)
+    return detections, encode_json({
+        'object_counts': detections.counts(),
+        'detections': detections
+    })
+
+
+def best_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def retained_bytes(fn):
+    """Bytes still allocated by the representation fn returns"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = fn()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    print(f"JSON encoder: {'orjson' if orjson else 'json (install orjson for faster encoding)'}")
+    print(f"{'detections':>10}{'dict ms':>10}{'set ms':>10}{'dict KB':>10}{'set KB':>10}{'JSON KB':>10}")
+    results = []
+    for size in args.sizes:
+        result = make_payload(size)
+        row = {
+            'detections': size,
+            'dict_ms': best_time(lambda: dict_path(result), args.repeat),
+            'set_ms': best_time(lambda: set_path(result), args.repeat),
+            'dict_bytes': retained_bytes(lambda: dict_path(result)[0]),
+            'set_bytes': retained_bytes(lambda: set_path(result)[0]),
+            'json_bytes': len(set_path(result)[1]),
+        }
+        results.append(row)
+        print(f"{size:>10}{row['dict_ms']:>10.3f}{row['set_ms']:>10.3f}"
+              f"{row['dict_bytes'] / 1024:>10.1f}{row['set_bytes'] / 1024:>10.1f}{row['json_bytes'] / 1024:>10.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
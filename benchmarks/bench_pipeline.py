@@ -0,0 +1,208 @@
+"""Time each /upload pipeline stage in isolation and check for regressions.
+
+Usage:
+    python benchmarks/bench_pipeline.py --save-baseline
+    python benchmarks/bench_pipeline.py --compare --threshold 0.25
+
+Fixtures are living-room.jpg, rescaled to each --sizes longest side, and
+detection_results.json, expanded to each --detections count. Stages:
+header inspection, full and visualization-size decode, detection parsing,
+post-processing, counting, create_visualization, cv2.imencode and
+cv2.imwrite of the decoded photo, base64 of the rendered JPEG, and the
+JSON response (json_response, as /upload sends it).
+
+Results are written as JSON (--output). --save-baseline stores them as the
+baseline; --compare reports each stage's median against it and exits with
+status 1 when any stage is slower by more than --threshold (and by more
+than --min-delta-ms, so sub-millisecond noise is not a regression).
+Baselines are machine-specific; keep them out of version control.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import platform
+import importlib.util
+import statistics
+import tempfile
+
+import cv2
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from detections import DetectionSet, orjson
+from postprocess import postprocess_detections
+from imaging import decode_image, inspect_image, VISUALIZATION_MAX_SIDE
+from bench_detections import make_payload
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'baseline.json')
+FIXTURE_SIZE = (1000, 882)  # living-room.jpg, which detection_results.json describes
+
+
+def load_app(directory):
+    """Import app.py with its upload, output and inventory files in directory"""
+    os.environ.setdefault('INVENTORY_DB', os.path.join(directory, 'inventory.db'))
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        spec = importlib.util.spec_from_file_location('bench_app', os.path.join(ROOT, 'app.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+def make_photo(directory, side):
+    """living-room.jpg rescaled so its longest side is side pixels"""
+    image = cv2.imread(os.path.join(ROOT, 'living-room.jpg'))
+    scale = side / max(image.shape[:2])
+    if scale != 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    path = os.path.join(directory, f'room_{side}.jpg')
+    cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+    return path, scale
+
+
+def measure(fn, repeat):
+    """Median and best milliseconds over repeat calls, after one warm-up call"""
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), min(timings)
+
+
+def run_stages(app, directory, sizes, counts, repeat):
+    results = []
+
+    def record(stage, fn, image=None, detections=None):
+        median_ms, min_ms = measure(fn, repeat)
+        row = {'stage': stage, 'image': image, 'detections': detections,
+               'median_ms': median_ms, 'min_ms': min_ms}
+        results.append(row)
+        label = f"{stage} [{image or '-'}px, {detections if detections is not None else '-'} det]"
+        print(f"{label:<44}{median_ms:>10.3f}{min_ms:>10.3f}")
+
+    payloads = {count: make_payload(count) for count in counts}
+    for count, payload in payloads.items():
+        record('parse', lambda: DetectionSet.from_roboflow(payload), detections=count)
+        parsed = DetectionSet.from_roboflow(payload)
+        record('postprocess', lambda: postprocess_detections(parsed, FIXTURE_SIZE), detections=count)
+        record('count', parsed.counts, detections=count)
+
+    for side in sizes:
+        path, scale = make_photo(directory, side)
+        record('inspect', lambda: inspect_image(path), image=side)
+        record('decode', lambda: decode_image(path), image=side)
+        record('decode_visualization', lambda: decode_image(path, VISUALIZATION_MAX_SIDE), image=side)
+        image = decode_image(path)[0]
+        record('imencode', lambda: cv2.imencode('.jpg', image), image=side)
+        written = os.path.join(directory, 'written.jpg')
+        record('imwrite', lambda: cv2.imwrite(written, image), image=side)
+        image = None
+
+        for count, payload in payloads.items():
+            detections = postprocess_detections(DetectionSet.from_roboflow(payload), FIXTURE_SIZE)
+            detections = detections.scaled(scale, scale)
+            record('visualization', lambda: app.create_visualization(path, detections), side, count)
+            rendered = app.create_visualization(path, detections)
+            record('base64', lambda: base64.b64encode(rendered).decode('utf-8'), side, count)
+            response_data = {
+                'success': True,
+                'total_objects': len(detections),
+                'object_counts': detections.counts(),
+                'detections': detections,
+                'output_image': f"data:image/jpeg;base64,{base64.b64encode(rendered).decode('utf-8')}"
+            }
+            with app.app.app_context():
+                record('json_response', lambda: app.json_response(response_data), side, count)
+    return results
+
+
+def row_key(row):
+    return (row['stage'], row['image'], row['detections'])
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Print each stage against the baseline; return the regressed rows"""
+    previous = {row_key(row): row for row in baseline['results']}
+    regressions = []
+    print(f"\n{'stage':<44}{'base ms':>10}{'now ms':>10}{'change':>10}")
+    for row in results:
+        old = previous.get(row_key(row))
+        if old is None:
+            continue
+        change = row['median_ms'] / old['median_ms'] - 1 if old['median_ms'] else 0.0
+        regressed = change > threshold and row['median_ms'] - old['median_ms'] > min_delta_ms
+        if regressed:
+            regressions.append(row)
+        label = f"{row['stage']} [{row['image'] or '-'}px, {row['detections'] if row['detections'] is not None else '-'} det]"
+        print(f"{label:<44}{old['median_ms']:>10.3f}{row['median_ms']:>10.3f}{change:>+10.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    missing = len(results) - sum(1 for row in results if row_key(row) in previous)
+    if missing:
+        print(f"{missing} stage(s) have no baseline")
+    return regressions
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'json_encoder': 'orjson' if orjson else 'json',
+        'created_at': time.time()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2048, 4032],
+                        help='Longest image sides to test')
+    parser.add_argument('--detections', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='Compare against the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Relative slowdown that counts as a regression (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.05,
+                        help='Ignore slowdowns smaller than this many milliseconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = load_app(directory)
+        print(f"{'stage':<44}{'median ms':>10}{'best ms':>10}")
+        results = run_stages(app, directory, args.sizes, args.detections, args.repeat)
+    report = {'environment': environment(), 'repeat': args.repeat, 'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Compare whole-image and tiled inference latency and detection counts.
+
+Usage:
+    python benchmarks/bench_tiling.py --image living-room.jpg --scale 4 --repeat 3
+
+Calls the live Roboflow workflow, so ROBOFLOW_API_KEY must be valid.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from inference_sdk import InferenceHTTPClient
+from detections import DetectionSet
+from tiling import run_tiled_inference, compute_tiles
+
+
+def make_infer_fn(client):
+    def infer(image):
+        result = client.run_workflow(
+            workspace_name="petes-workspace-oetpj",
+            workflow_id="detect-count-and-visualise-furniture-instant",
+            images={"image": image},
+            use_cache=False
+        )
+        return DetectionSet.from_roboflow(result)
+    return infer
+
+
+def time_runs(fn, repeat):
+    timings = []
+    detections = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        detections = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': statistics.median(timings),
+        'min_ms': min(timings),
+        'max_ms': max(timings),
+        'detections': len(detections),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--image', default='living-room.jpg')
+    parser.add_argument('--scale', type=float, default=4.0,
+                        help='Upscale factor to simulate high-resolution photos')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tile-size', type=int, default=1024)
+    parser.add_argument('--overlap', type=float, default=0.2)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image)
+    if image is None:
+        sys.exit(f"Could not read {args.image}")
+    if args.scale != 1:
+        image = cv2.resize(image, None, fx=args.scale, fy=args.scale, interpolation=cv2.INTER_CUBIC)
+    height, width = image.shape[:2]
+    tiles = compute_tiles(width, height, args.tile_size, args.overlap)
+    print(f"Image {width}x{height} ({width * height / 1e6:.1f} MP), {len(tiles)} tiles")
+
+    client = InferenceHTTPClient(
+        api_url="https://serverless.roboflow.com",
+        api_key=os.getenv("ROBOFLOW_API_KEY", "OCYzLwdUcqDtypAh0OYT")
+    )
+    infer = make_infer_fn(client)
+
+    results = {'image': args.image, 'width': width, 'height': height, 'tiles': len(tiles)}
+    results['whole_image'] = time_runs(lambda: infer(image), args.repeat)
+    for concurrency in args.concurrency:
+        results[f'tiled_c{concurrency}'] = time_runs(
+            lambda: run_tiled_inference(image, infer, args.tile_size, args.overlap, concurrency),
+            args.repeat
+        )
+
+    print(f"{'mode':<16}{'median ms':>12}{'min ms':>10}{'max ms':>10}{'detections':>12}")
+    for mode, stats in results.items():
+        if isinstance(stats, dict):
+            print(f"{mode:<16}{stats['median_ms']:>12.0f}{stats['min_ms']:>10.0f}"
+                  f"{stats['max_ms']:>10.0f}{stats['detections']:>12}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import os
+import copy
+import gzip
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# File the inference calls are recorded to or replayed from (unset: calls go to Roboflow as usual)
+CASSETTE_PATH = os.getenv("ROBOFLOW_CASSETTE", "")
+# record: call Roboflow and save every response; replay: answer from the file, offline
+CASSETTE_MODE = os.getenv("ROBOFLOW_CASSETTE_MODE", "replay")
+# Replayed calls sleep for the recorded latency times this factor (0 answers at once)
+CASSETTE_LATENCY_SCALE = float(os.getenv("ROBOFLOW_CASSETTE_LATENCY", "0"))
+
+CASSETTE_MODES = ('record', 'replay')
+
+
+class CassetteError(ValueError):
+    """A cassette file that cannot be used in the configured mode"""
+
+
+class CassetteMiss(Exception):
+    """A replayed call that was never recorded"""
+
+
+class RecordedError(Exception):
+    """Replay of a call that raised when it was recorded"""
+
+
+def _digest_source(source):
+    """SHA-256 of an image given as a path, array, bytes or string"""
+    hasher = hashlib.sha256()
+    if hasattr(source, 'tobytes'):
+        # Decoded array: the shape matters as much as the pixels
+        hasher.update(f"{source.shape}{source.dtype}".encode('utf-8'))
+        hasher.update(source.tobytes())
+    elif isinstance(source, (bytes, bytearray)):
+        hasher.update(source)
+    elif isinstance(source, str) and os.path.isfile(source):
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(block)
+    else:
+        hasher.update(str(source).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def fingerprint(operation, request, images=()):
+    """Key for one call: the operation, its arguments and the content of its images
+
+    Paths, temp file names and API keys do not affect the key, so the same
+    photo uploaded again replays the same response.
+    """
+    payload = {
+        'operation': operation,
+        'request': request,
+        'images': [_digest_source(image) for image in images]
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """Records inference calls to an append-only JSON lines file, or replays them
+
+    Each line holds a request fingerprint, the response (or error) and the
+    call's latency; a path ending in .gz is gzip-compressed. A fingerprint
+    recorded several times replays its responses in the recorded order and
+    then repeats the last one, so a replayed day of traffic is deterministic.
+    """
+
+    def __init__(self, path, mode='replay', latency_scale=CASSETTE_LATENCY_SCALE):
+        if mode not in CASSETTE_MODES:
+            raise CassetteError(f"Cassette mode must be one of {', '.join(CASSETTE_MODES)}, not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.lock = threading.Lock()
+        self.entries = defaultdict(list)
+        self.positions = defaultdict(int)
+        self.counters = {'recorded': 0, 'replayed': 0, 'misses': 0}
+        if mode == 'replay':
+            self._load()
+
+    def _open(self, mode):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, mode + 't', encoding='utf-8')
+        return open(self.path, mode, encoding='utf-8')
+
+    def _load(self):
+        try:
+            with self._open('r') as f:
+                for number, line in enumerate(f, 1):
+                    if line.strip():
+                        entry = self._parse(line, number)
+                        self.entries[entry['key']].append(entry)
+        except (OSError, UnicodeDecodeError) as e:
+            raise CassetteError(f"Cannot {self.mode} from {self.path}: {e}")
+        logger.info(f"Replaying {sum(map(len, self.entries.values()))} recorded inference calls from {self.path}")
+
+    def _parse(self, line, number):
+        try:
+            entry = json.loads(line)
+        except ValueError as e:
+            raise CassetteError(f"Cannot {self.mode} from {self.path}: line {number} is not valid JSON ({e})")
+        if not isinstance(entry, dict) or 'key' not in entry:
+            raise CassetteError(f"Cannot {self.mode} from {self.path}: line {number} is not a recorded call")
+        return entry
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def call(self, operation, request, images, func):
+        """Run func() through the cassette; request and images identify the call"""
+        key = fingerprint(operation, request, images)
+        if self.replaying:
+            return self._replay(key, operation)
+        start = time.perf_counter()
+        try:
+            response = func()
+        except Exception as e:
+            self._record(key, operation, request, start, error=f"{type(e).__name__}: {e}")
+            raise
+        self._record(key, operation, request, start, response=response)
+        return response
+
+    def _record(self, key, operation, request, start, response=None, error=None):
+        entry = {
+            'key': key,
+            'operation': operation,
+            'request': request,
+            'latency_ms': round((time.perf_counter() - start) * 1000, 1),
+            'recorded_at': time.time()
+        }
+        if error is not None:
+            entry['error'] = error
+        else:
+            entry['response'] = response
+        line = json.dumps(entry, separators=(',', ':'), default=str)
+        with self.lock:
+            with self._open('a') as f:
+                f.write(line + '\n')
+            self.counters['recorded'] += 1
+
+    def _replay(self, key, operation):
+        with self.lock:
+            entries = self.entries.get(key)
+            if not entries:
+                self.counters['misses'] += 1
+                raise CassetteMiss(f"No recorded {operation} call for this request ({key[:12]})")
+            entry = entries[min(self.positions[key], len(entries) - 1)]
+            self.positions[key] += 1
+            self.counters['replayed'] += 1
+        if self.latency_scale > 0:
+            time.sleep(entry['latency_ms'] / 1000 * self.latency_scale)
+        if 'error' in entry:
+            raise RecordedError(entry['error'])
+        return copy.deepcopy(entry['response'])
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats.update({'mode': self.mode, 'path': self.path, 'keys': len(self.entries),
+                          'latency_scale': self.latency_scale})
+        return stats
+
+
+def _configuration_context(configuration):
+    """Settings that differ from the defaults, which change what inference returns"""
+    try:
+        from inference_sdk import InferenceConfiguration
+        default = InferenceConfiguration.init_default()
+    except ImportError:
+        return vars(configuration)
+    return {name: value for name, value in vars(configuration).items()
+            if getattr(default, name, None) != value}
+
+
+class CassetteClient:
+    """InferenceHTTPClient wrapper that sends infer and run_workflow through a cassette"""
+
+    def __init__(self, client, cassette, context=None):
+        self.client = client
+        self.cassette = cassette
+        self.context = context or {}
+
+    def configure(self, configuration):
+        self.client.configure(configuration)
+        self.context = {'configuration': _configuration_context(configuration)}
+        return self
+
+    def infer(self, inference_input, model_id=None, **kwargs):
+        request = dict(kwargs, model_id=model_id, **self.context)
+        return self.cassette.call('infer', request, [inference_input],
+                                  lambda: self.client.infer(inference_input, model_id=model_id, **kwargs))
+
+    def run_workflow(self, images=None, **kwargs):
+        images = images or {}
+        request = dict(kwargs, images=sorted(images), **self.context)
+        return self.cassette.call('run_workflow', request, [images[name] for name in sorted(images)],
+                                  lambda: self.client.run_workflow(images=images, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_cassette():
+    """The cassette configured by ROBOFLOW_CASSETTE, or None when unset"""
+    global _shared
+    if not CASSETTE_PATH:
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = Cassette(CASSETTE_PATH, CASSETTE_MODE)
+        return _shared
+
+
+def wrap_client(client, cassette=None):
+    """Route a client's inference calls through the cassette, if one is configured"""
+    cassette = cassette or shared_cassette()
+    if cassette is None or client is None:
+        return client
+    return CassetteClient(client, cassette)
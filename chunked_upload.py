@@ -0,0 +1,272 @@
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from flask import request, jsonify
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+# Largest file accepted through chunked uploads
+CHUNKED_UPLOAD_MAX_SIZE = int(os.getenv("CHUNKED_UPLOAD_MAX_SIZE", str(200 * 1024 * 1024)))
+# Suggested chunk size; each PUT is still bounded by MAX_CONTENT_LENGTH
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", str(4 * 1024 * 1024)))
+# Incomplete uploads idle for longer than this are discarded
+CHUNKED_UPLOAD_TTL = int(os.getenv("CHUNKED_UPLOAD_TTL", "3600"))
+COPY_BUFFER_SIZE = 1024 * 1024
+
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """A chunked upload request that cannot be applied; carries the HTTP status"""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def copy_with_digest(stream, out, hasher, length=None):
+    """Copy a request stream to a file, feeding every block to hasher
+
+    Copies length bytes, or until the stream ends. Returns the number of
+    bytes written. A dropped connection raises with the blocks read so far
+    already written and hashed; callers that resume must roll them back.
+    """
+    written = 0
+    while length is None or written < length:
+        size = COPY_BUFFER_SIZE if length is None else min(COPY_BUFFER_SIZE, length - written)
+        block = stream.read(size)
+        if not block:
+            break
+        out.write(block)
+        hasher.update(block)
+        written += len(block)
+    return written
+
+
+class ChunkedUploadStore:
+    """Upload sessions kept as a .part file plus a small JSON manifest
+
+    The acknowledged byte offset always equals the size of the .part file:
+    a chunk cut off by a dropped connection is truncated away and the hash
+    rolled back, so the client asks for the offset and resumes from there.
+    After a worker restart the running SHA-256 is rebuilt from the file.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def _paths(self, upload_id):
+        base = os.path.join(self.folder, upload_id)
+        return base + '.part', base + '.json'
+
+    def create(self, filename, size, sha256=None):
+        if size < 1 or size > CHUNKED_UPLOAD_MAX_SIZE:
+            raise UploadError(f"size must be between 1 and {CHUNKED_UPLOAD_MAX_SIZE} bytes")
+        if sha256 is not None and not re.match(r'^[0-9a-fA-F]{64}$', sha256):
+            raise UploadError("sha256 must be 64 hex characters")
+        self.expire()
+        upload_id = uuid.uuid4().hex
+        part_path, manifest_path = self._paths(upload_id)
+        manifest = {
+            'filename': secure_filename(filename) or 'upload',
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'created_at': time.time()
+        }
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+        open(part_path, 'wb').close()
+        session = dict(manifest, id=upload_id, offset=0, hasher=hashlib.sha256(),
+                       lock=threading.Lock(), updated_at=time.time())
+        with self.lock:
+            self.sessions[upload_id] = session
+        return session
+
+    def get(self, upload_id):
+        if not _UPLOAD_ID.match(upload_id):
+            return None
+        with self.lock:
+            session = self.sessions.get(upload_id)
+            if session is not None:
+                return session
+            # Not in memory (e.g. after a restart): rebuild from disk
+            part_path, manifest_path = self._paths(upload_id)
+            if not (os.path.exists(part_path) and os.path.exists(manifest_path)):
+                return None
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            hasher = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                offset = copy_with_digest(f, _NullWriter(), hasher)
+            session = dict(manifest, id=upload_id, offset=offset, hasher=hasher,
+                           lock=threading.Lock(), updated_at=time.time())
+            self.sessions[upload_id] = session
+            return session
+
+    def write_chunk(self, session, offset, stream, length):
+        """Append one chunk at offset; returns the new offset"""
+        if not session['lock'].acquire(blocking=False):
+            raise UploadError("Another chunk is being written", 409, offset=session['offset'])
+        try:
+            if offset != session['offset']:
+                raise UploadError("Chunk does not start at the current offset", 409,
+                                  offset=session['offset'])
+            if length is None or length < 1:
+                raise UploadError("Chunk has no Content-Length", 411)
+            if offset + length > session['size']:
+                raise UploadError("Chunk runs past the declared size", 416, offset=session['offset'])
+            part_path, _ = self._paths(session['id'])
+            hasher = session['hasher'].copy()
+            with open(part_path, 'ab') as out:
+                try:
+                    written = copy_with_digest(stream, out, hasher, length)
+                except BaseException:
+                    # Drop the partial chunk so the file, hash and offset agree
+                    out.truncate(session['offset'])
+                    raise
+                finally:
+                    out.flush()
+                    session['updated_at'] = time.time()
+            session['hasher'] = hasher
+            session['offset'] += written
+            return session['offset']
+        finally:
+            session['lock'].release()
+
+    def finish(self, session, destination):
+        """Verify a fully received upload and move it to destination; returns its SHA-256"""
+        part_path, manifest_path = self._paths(session['id'])
+        if session['offset'] != session['size'] or os.path.getsize(part_path) != session['size']:
+            raise UploadError("Upload is incomplete", 409, offset=session['offset'])
+        digest = session['hasher'].hexdigest()
+        if session['sha256'] and digest != session['sha256']:
+            self.abort(session['id'])
+            raise UploadError("Uploaded content does not match sha256", 422)
+        os.replace(part_path, destination)
+        os.remove(manifest_path)
+        with self.lock:
+            self.sessions.pop(session['id'], None)
+        return digest
+
+    def abort(self, upload_id):
+        with self.lock:
+            self.sessions.pop(upload_id, None)
+        for path in self._paths(upload_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def expire(self):
+        """Drop sessions that have been idle for longer than CHUNKED_UPLOAD_TTL"""
+        cutoff = time.time() - CHUNKED_UPLOAD_TTL
+        for name in os.listdir(self.folder):
+            upload_id, _ = os.path.splitext(name)
+            path = os.path.join(self.folder, name)
+            try:
+                if _UPLOAD_ID.match(upload_id) and os.path.getmtime(path) < cutoff:
+                    with self.lock:
+                        session = self.sessions.get(upload_id)
+                    if session is None or session['updated_at'] < cutoff:
+                        self.abort(upload_id)
+            except FileNotFoundError:
+                pass
+
+
+class _NullWriter:
+    def write(self, data):
+        pass
+
+
+def _error_response(error):
+    payload = {'error': str(error)}
+    payload.update(error.details)
+    return jsonify(payload), error.status
+
+
+def _status(session):
+    return {
+        'upload_id': session['id'],
+        'offset': session['offset'],
+        'size': session['size'],
+        'chunk_size': CHUNK_SIZE
+    }
+
+
+def register_chunked_upload_routes(app, store, process_upload, is_cached=None):
+    """Expose init -> PUT chunks -> complete under /uploads
+
+    process_upload(filepath, filename, values, digest) runs the normal
+    detection pipeline on the assembled file and returns the response.
+    is_cached(sha256, values) reports whether detections for that content
+    are already cached, so clients learn it before sending any bytes.
+    """
+
+    @app.route('/uploads', methods=['POST'])
+    def init_upload():
+        values = request.get_json(silent=True) or request.values
+        try:
+            size = int(values.get('size', 0))
+            session = store.create(values.get('filename', ''), size, values.get('sha256') or None)
+        except ValueError:
+            return jsonify({'error': 'size must be an integer'}), 400
+        except UploadError as e:
+            return _error_response(e)
+        status = _status(session)
+        status['cached'] = bool(session['sha256'] and is_cached and is_cached(session['sha256'], values))
+        return jsonify(status), 201
+
+    @app.route('/uploads/<upload_id>', methods=['GET'])
+    def upload_status(upload_id):
+        # Where to resume after a dropped connection
+        session = store.get(upload_id)
+        if session is None:
+            return jsonify({'error': 'Upload not found'}), 404
+        return jsonify(_status(session))
+
+    @app.route('/uploads/<upload_id>', methods=['PUT', 'PATCH'])
+    def upload_chunk(upload_id):
+        session = store.get(upload_id)
+        if session is None:
+            return jsonify({'error': 'Upload not found'}), 404
+        offset = request.args.get('offset', type=int)
+        content_range = request.headers.get('Content-Range', '')
+        match = re.match(r'^bytes (\d+)-(\d+)/(\d+|\*)$', content_range)
+        if match:
+            offset = int(match.group(1))
+        if offset is None:
+            return jsonify({'error': 'Send the chunk offset as ?offset= or Content-Range'}), 400
+        try:
+            store.write_chunk(session, offset, request.stream, request.content_length)
+        except UploadError as e:
+            return _error_response(e)
+        return jsonify(_status(session))
+
+    @app.route('/uploads/<upload_id>', methods=['DELETE'])
+    def abort_upload(upload_id):
+        if store.get(upload_id) is None:
+            return jsonify({'error': 'Upload not found'}), 404
+        store.abort(upload_id)
+        return jsonify({'success': True})
+
+    @app.route('/uploads/<upload_id>/complete', methods=['POST'])
+    def complete_upload(upload_id):
+        session = store.get(upload_id)
+        if session is None:
+            return jsonify({'error': 'Upload not found'}), 404
+        filename = f"{upload_id}_{session['filename']}"
+        filepath = os.path.join(os.path.dirname(store.folder.rstrip(os.sep)), filename)
+        try:
+            digest = store.finish(session, filepath)
+        except UploadError as e:
+            return _error_response(e)
+        logger.info(f"Chunked upload assembled: {filepath} ({session['size']} bytes)")
+        return process_upload(filepath, session['filename'], request.values, digest)
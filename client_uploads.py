@@ -0,0 +1,46 @@
+import os
+import re
+from flask import request, jsonify
+
+# Longest side the browser downscales photos to before uploading (0 uploads them as taken)
+CLIENT_IMAGE_MAX_SIDE = int(os.getenv("CLIENT_IMAGE_MAX_SIDE", "2048"))
+# Format and quality the browser re-encodes downscaled photos with
+CLIENT_IMAGE_FORMAT = os.getenv("CLIENT_IMAGE_FORMAT", "image/jpeg")
+CLIENT_IMAGE_QUALITY = float(os.getenv("CLIENT_IMAGE_QUALITY", "0.85"))
+
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def register_client_upload_routes(app, lookup=None, progressive=False):
+    """Expose /config for browser-side preprocessing and, given lookup, /results/<sha256>
+
+    lookup(sha256, values) returns the /upload response for a photo whose
+    result is already known, or None. The browser hashes the bytes it is
+    about to send and asks /results first, uploading only on a miss.
+    progressive tells the browser /upload accepts progressive=1.
+    """
+
+    @app.route('/config')
+    def client_config():
+        return jsonify({
+            'max_dimension': CLIENT_IMAGE_MAX_SIDE,
+            'format': CLIENT_IMAGE_FORMAT,
+            'quality': CLIENT_IMAGE_QUALITY,
+            'max_upload_bytes': app.config.get('MAX_CONTENT_LENGTH'),
+            'hash_lookup': lookup is not None,
+            'progressive': progressive
+        })
+
+    if lookup is None:
+        return
+
+    @app.route('/results/<sha256>')
+    def cached_result(sha256):
+        sha256 = sha256.lower()
+        if not SHA256_PATTERN.match(sha256):
+            return jsonify({'error': 'Expected a hex SHA-256 digest'}), 400
+        result = lookup(sha256, request.values)
+        if result is None:
+            # Not an error: the client uploads the photo instead
+            return jsonify({'cached': False}), 404
+        return result
@@ -0,0 +1,164 @@
+import io
+import os
+import json
+import uuid
+import zipfile
+import logging
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from flask import request, jsonify, send_from_directory, url_for, Response
+from detections import DetectionSet
+from imaging import inspect_image, decode_image, ImageValidationError
+
+logger = logging.getLogger(__name__)
+
+# Crop thumbnail settings
+CROP_MAX_SIDE = int(os.getenv("CROP_MAX_SIDE", "160"))
+CROP_JPEG_QUALITY = int(os.getenv("CROP_JPEG_QUALITY", "85"))
+CROP_WORKERS = int(os.getenv("CROP_WORKERS", "4"))
+# Upper bound on thumbnails being resized/encoded or waiting to be written
+CROP_MAX_IN_FLIGHT = int(os.getenv("CROP_MAX_IN_FLIGHT", "16"))
+# Upper bound on crops returned for one image
+CROP_MAX_COUNT = int(os.getenv("CROP_MAX_COUNT", "200"))
+
+
+def _encode_thumbnail(view, max_side, quality):
+    height, width = view.shape[:2]
+    scale = max_side / max(height, width)
+    if scale < 1:
+        # Resizing reads the view directly; the thumbnail is the first copy
+        view = cv2.resize(view, (max(1, round(width * scale)), max(1, round(height * scale))),
+                          interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode('.jpg', view, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Failed to encode crop thumbnail")
+    return encoded.tobytes()
+
+
+def iter_crop_thumbnails(image, detections, max_side=CROP_MAX_SIDE, quality=CROP_JPEG_QUALITY,
+                         workers=CROP_WORKERS, max_in_flight=CROP_MAX_IN_FLIGHT):
+    """Yield (index, jpeg_bytes) for each detection crop of a decoded BGR image, in order
+
+    Crops are slice views into the image, resized and encoded on a thread
+    pool (OpenCV releases the GIL). At most max_in_flight thumbnails exist
+    at once; the next crop is only submitted after the oldest is consumed.
+    """
+    height, width = image.shape[:2]
+    boxes = detections.pixel_boxes(width, height)[:CROP_MAX_COUNT].tolist()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for index, (x1, y1, x2, y2) in enumerate(boxes):
+            pending.append((index, pool.submit(_encode_thumbnail, image[y1:y2, x1:x2], max_side, quality)))
+            if len(pending) >= max_in_flight:
+                oldest, future = pending.popleft()
+                yield oldest, future.result()
+        while pending:
+            oldest, future = pending.popleft()
+            yield oldest, future.result()
+
+
+def crop_filename(detections, index):
+    return f"{index:03d}_{detections.class_of(index)}.jpg".replace('/', '-').replace(' ', '-')
+
+
+def crops_omitted(detections):
+    """Number of detections past CROP_MAX_COUNT, which get no thumbnail"""
+    return max(0, len(detections) - CROP_MAX_COUNT)
+
+
+def save_crop_thumbnails(image, detections, folder):
+    """Write crop thumbnails into a new batch directory and return their URLs
+
+    Only the first CROP_MAX_COUNT detections get a thumbnail; see crops_omitted.
+    """
+    if crops_omitted(detections):
+        logger.info(f"Crops limited to {CROP_MAX_COUNT} of {len(detections)} detections")
+    batch = uuid.uuid4().hex
+    directory = os.path.join(folder, batch)
+    os.makedirs(directory, exist_ok=True)
+    crops = []
+    for index, data in iter_crop_thumbnails(image, detections):
+        filename = crop_filename(detections, index)
+        with open(os.path.join(directory, filename), 'wb') as f:
+            f.write(data)
+        crops.append({
+            'class': detections.class_of(index),
+            'detection_id': detections.detection_id[index],
+            'url': url_for('crop_file', batch=batch, filename=filename)
+        })
+    return crops
+
+
+class _ZipStream(io.RawIOBase):
+    """Write-only sink that hands zipfile output to a generator chunk by chunk"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_crop_zip(image, detections):
+    """Generate a zip archive of crop thumbnails without buffering the whole file"""
+    sink = _ZipStream()
+    # JPEG data does not compress further, so entries are stored as-is
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for index, data in iter_crop_thumbnails(image, detections):
+            archive.writestr(crop_filename(detections, index), data)
+            yield sink.drain()
+        archive.writestr('detections.json', json.dumps(detections.to_dicts()))
+    yield sink.drain()
+
+
+def register_crop_routes(app, folder):
+    """Serve saved crop thumbnails and build crop zips for stored results"""
+
+    @app.route('/crops/<batch>/<filename>')
+    def crop_file(batch, filename):
+        return send_from_directory(os.path.join(folder, os.path.basename(batch)), filename,
+                                   mimetype='image/jpeg')
+
+    @app.route('/crops', methods=['POST'])
+    def crop_zip():
+        # Crops for a stored result: the original image plus its detections JSON
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file uploaded'}), 400
+        try:
+            payload = json.loads(request.form.get('detections', ''))
+            # Accept either the detections list or a whole /upload response
+            if isinstance(payload, dict):
+                payload = payload.get('detections')
+            detections = DetectionSet.from_dicts(payload)
+        except (ValueError, TypeError, AttributeError):
+            return jsonify({'error': 'Expected a detections JSON list'}), 400
+        # Validate and decode as /upload does: header checks first, EXIF
+        # orientation applied once, so boxes match the upright image
+        with tempfile.NamedTemporaryFile(suffix='.img') as upload:
+            request.files['file'].save(upload)
+            upload.flush()
+            try:
+                info = inspect_image(upload.name)
+            except ImageValidationError as e:
+                return jsonify({'error': str(e)}), 400
+            image, _ = decode_image(upload.name, None, info)
+        if image is None:
+            return jsonify({'error': 'Could not decode image'}), 400
+        headers = {'Content-Disposition': 'attachment; filename=crops.zip'}
+        omitted = crops_omitted(detections)
+        if omitted:
+            # Only the first CROP_MAX_COUNT detections get a thumbnail
+            logger.info(f"Crop zip limited to {CROP_MAX_COUNT} of {len(detections)} detections")
+            headers['X-Crops-Omitted'] = str(omitted)
+        return Response(stream_crop_zip(image, detections), mimetype='application/zip', headers=headers)
@@ -0,0 +1,162 @@
+import os
+import time
+import logging
+import threading
+from flask import request, g, has_request_context
+
+logger = logging.getLogger(__name__)
+
+# Time budget for one request, unless the client sends X-Request-Timeout (seconds)
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "30"))
+# Upper limit for a client-supplied budget
+REQUEST_TIMEOUT_MAX = float(os.getenv("REQUEST_TIMEOUT_MAX", "120"))
+DEADLINE_HEADER = 'X-Request-Timeout'
+
+# Seconds a stage needs to be worth starting; below them it is skipped or degraded
+DEADLINE_FALLBACK_MIN = float(os.getenv("DEADLINE_FALLBACK_MIN", "5"))
+DEADLINE_CROPS_MIN = float(os.getenv("DEADLINE_CROPS_MIN", "1.5"))
+DEADLINE_RENDER_MIN = float(os.getenv("DEADLINE_RENDER_MIN", "0.5"))
+# Below this the visualization is rendered at DEADLINE_RENDER_REDUCED_SIDE instead
+DEADLINE_RENDER_FULL = float(os.getenv("DEADLINE_RENDER_FULL", "2"))
+DEADLINE_RENDER_REDUCED_SIDE = int(os.getenv("DEADLINE_RENDER_REDUCED_SIDE", "800"))
+# Threads Deadline.call may have running at once, abandoned ones included;
+# past this, calls are refused at once instead of piling up behind a slow upstream
+DEADLINE_MAX_CALLS = int(os.getenv("DEADLINE_MAX_CALLS", "32"))
+
+_call_slots = threading.BoundedSemaphore(DEADLINE_MAX_CALLS)
+_call_lock = threading.Lock()
+_call_counters = {'running': 0, 'abandoned': 0, 'rejected': 0}
+
+
+class DeadlineExceeded(Exception):
+    """A stage that could not finish within the request's time budget"""
+
+
+class DeadlineSaturated(DeadlineExceeded):
+    """A stage refused because DEADLINE_MAX_CALLS calls are still running"""
+
+
+def _count(name, delta=1):
+    with _call_lock:
+        _call_counters[name] += delta
+
+
+def call_stats():
+    """Deadline.call threads running now, plus abandoned and refused totals"""
+    with _call_lock:
+        return dict(_call_counters, limit=DEADLINE_MAX_CALLS)
+
+
+class Deadline:
+    """A request's time budget, shared by every stage of the pipeline
+
+    Stages ask remaining() or allows() before starting and record what
+    they skipped or cut short, so the response can be flagged partial
+    instead of failing.
+    """
+
+    def __init__(self, seconds=REQUEST_TIMEOUT):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.skipped = []
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def allows(self, seconds):
+        """Whether a stage expected to take this long can still finish"""
+        return self.remaining() >= seconds
+
+    def timeout(self, limit=None):
+        """Remaining budget as a timeout for a blocking call, at most limit"""
+        remaining = self.remaining()
+        return min(remaining, limit) if limit is not None else remaining
+
+    def skip(self, stage):
+        with self.lock:
+            if stage not in self.skipped:
+                self.skipped.append(stage)
+        logger.info(f"Deadline: skipped {stage} with {self.remaining():.2f}s left")
+
+    @property
+    def partial(self):
+        return bool(self.skipped)
+
+    def call(self, stage, fn, *args, **kwargs):
+        """Run fn, giving up when the budget runs out
+
+        For clients without a timeout option (the inference SDK), fn runs on
+        a daemon thread that is abandoned on expiry; its result is dropped.
+        An abandoned thread keeps its slot until fn returns, so at most
+        DEADLINE_MAX_CALLS run at once; beyond that the call is refused
+        with DeadlineSaturated. Raises DeadlineExceeded, recording stage as
+        skipped.
+        """
+        if self.expired():
+            self.skip(stage)
+            raise DeadlineExceeded(f"No time left for {stage}")
+        if not _call_slots.acquire(blocking=False):
+            _count('rejected')
+            self.skip(stage)
+            raise DeadlineSaturated(f"Too many slow calls in flight to start {stage}")
+        outcome = {}
+        done = threading.Event()
+
+        def run():
+            try:
+                outcome['result'] = fn(*args, **kwargs)
+            except BaseException as e:
+                outcome['error'] = e
+            finally:
+                done.set()
+                _count('running', -1)
+                _call_slots.release()
+
+        _count('running')
+        threading.Thread(target=run, daemon=True).start()
+        if not done.wait(self.remaining()):
+            _count('abandoned')
+            self.skip(stage)
+            raise DeadlineExceeded(f"{stage} did not finish within {self.seconds:.0f}s")
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['result']
+
+    def summary(self):
+        return {
+            'budget_s': self.seconds,
+            'remaining_s': round(self.remaining(), 3),
+            'skipped': list(self.skipped)
+        }
+
+
+def request_deadline(default=REQUEST_TIMEOUT):
+    """The current request's deadline, started on first use (see start_request_deadlines)
+
+    The client may set the budget with X-Request-Timeout (seconds), up to
+    REQUEST_TIMEOUT_MAX; otherwise it is default.
+    """
+    if not has_request_context():
+        return Deadline(default)
+    if 'deadline' not in g:
+        seconds = default
+        header = request.headers.get(DEADLINE_HEADER)
+        if header:
+            try:
+                seconds = min(max(float(header), 0.0), REQUEST_TIMEOUT_MAX)
+            except ValueError:
+                pass
+        g.deadline = Deadline(seconds)
+    return g.deadline
+
+
+def start_request_deadlines(app, default=REQUEST_TIMEOUT):
+    """Start every request's deadline on arrival, so the budget also covers reading the body"""
+
+    @app.before_request
+    def start_deadline():
+        request_deadline(default)
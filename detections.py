@@ -0,0 +1,204 @@
+import sys
+import json
+import numpy as np
+
+# orjson is optional; fall back to the standard library encoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class DetectionSet:
+    """Columnar container for the detections of one image
+
+    Boxes are stored Roboflow-style (center x/y, width, height) in float64
+    columns, so values round-trip to JSON exactly as Roboflow sent them, and
+    class names are interned once in class_names with a small integer
+    class_index per row.
+    """
+
+    __slots__ = ('x', 'y', 'width', 'height', 'confidence',
+                 'class_index', 'class_id', 'detection_id', 'class_names')
+
+    def __init__(self, x, y, width, height, confidence, class_index, class_id,
+                 detection_id, class_names):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.confidence = confidence
+        self.class_index = class_index
+        self.class_id = class_id
+        self.detection_id = detection_id
+        self.class_names = class_names
+
+    @classmethod
+    def empty(cls):
+        return cls.from_dicts([])
+
+    @classmethod
+    def from_dicts(cls, detections):
+        """Fill the columns from Roboflow detection dicts"""
+        count = len(detections)
+        values = np.array([(d.get('x', 0), d.get('y', 0), d.get('width', 0), d.get('height', 0),
+                            d.get('confidence', 0), d.get('class_id', 0)) for d in detections],
+                          dtype=np.float64).reshape(count, 6)
+        # Intern each class name once; rows only keep a small index into the table
+        class_lookup = {}
+        class_index = np.fromiter(
+            (class_lookup.setdefault(d.get('class', 'Unknown'), len(class_lookup)) for d in detections),
+            dtype=np.int32, count=count)
+        class_names = [sys.intern(name) for name in class_lookup]
+        detection_id = [d.get('detection_id', '') for d in detections]
+        columns = values.T.copy()
+        return cls(columns[0], columns[1], columns[2], columns[3], columns[4],
+                   class_index, values[:, 5].astype(np.int32), detection_id, class_names)
+
+    @classmethod
+    def from_roboflow(cls, result):
+        """Parse a workflow or direct inference response"""
+        detections = []
+        if isinstance(result, list) and len(result) > 0:
+            # Workflow response format
+            first_result = result[0]
+            if 'predictions' in first_result and 'predictions' in first_result['predictions']:
+                detections = first_result['predictions']['predictions']
+            elif 'detections' in first_result:
+                detections = first_result['detections']
+        elif isinstance(result, dict):
+            if 'predictions' in result:
+                # Direct inference response format
+                detections = result['predictions']
+            elif 'detections' in result:
+                detections = result['detections']
+        return cls.from_dicts(detections)
+
+    @classmethod
+    def concatenate(cls, sets):
+        """Merge several sets, remapping their class tables into one"""
+        sets = [s for s in sets if len(s)]
+        if not sets:
+            return cls.empty()
+        class_names = []
+        class_lookup = {}
+        class_index = []
+        for s in sets:
+            remap = np.empty(len(s.class_names), dtype=np.int32)
+            for i, name in enumerate(s.class_names):
+                if name not in class_lookup:
+                    class_lookup[name] = len(class_names)
+                    class_names.append(name)
+                remap[i] = class_lookup[name]
+            class_index.append(remap[s.class_index])
+        detection_id = []
+        for s in sets:
+            detection_id.extend(s.detection_id)
+        return cls(np.concatenate([s.x for s in sets]), np.concatenate([s.y for s in sets]),
+                   np.concatenate([s.width for s in sets]), np.concatenate([s.height for s in sets]),
+                   np.concatenate([s.confidence for s in sets]), np.concatenate(class_index),
+                   np.concatenate([s.class_id for s in sets]), detection_id, class_names)
+
+    def __len__(self):
+        return len(self.x)
+
+    def take(self, indices):
+        """Return a new set with the rows at indices (or a boolean mask), in that order"""
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        else:
+            indices = indices.astype(np.int64, copy=False)
+        return DetectionSet(self.x[indices], self.y[indices], self.width[indices],
+                            self.height[indices], self.confidence[indices],
+                            self.class_index[indices], self.class_id[indices],
+                            [self.detection_id[i] for i in indices.tolist()], self.class_names)
+
+    def translated(self, dx, dy):
+        """Return a copy shifted by (dx, dy), e.g. from tile to image coordinates"""
+        return DetectionSet(self.x + dx, self.y + dy, self.width, self.height, self.confidence,
+                            self.class_index, self.class_id, self.detection_id, self.class_names)
+
+    def scaled(self, sx, sy):
+        """Return a copy with boxes scaled, e.g. to a resized copy of the image"""
+        return DetectionSet(self.x * sx, self.y * sy, self.width * sx, self.height * sy,
+                            self.confidence, self.class_index, self.class_id, self.detection_id,
+                            self.class_names)
+
+    def boxes_xyxy(self):
+        half_width = self.width / 2
+        half_height = self.height / 2
+        return np.stack([self.x - half_width, self.y - half_height,
+                         self.x + half_width, self.y + half_height], axis=1)
+
+    def with_boxes_xyxy(self, boxes, confidence=None, changed=None):
+        """Return a copy with new xyxy boxes (and optionally confidences)
+
+        With a changed mask, only those rows take the new boxes; the others
+        keep their columns as they are, free of xyxy round-trip error.
+        """
+        boxes = boxes.astype(np.float64, copy=False)
+        columns = [(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2,
+                   boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]]
+        if changed is not None:
+            columns = [np.where(changed, new, old)
+                       for new, old in zip(columns, (self.x, self.y, self.width, self.height))]
+        return DetectionSet(*columns,
+                            self.confidence if confidence is None else confidence.astype(np.float64),
+                            self.class_index, self.class_id, self.detection_id, self.class_names)
+
+    def pixel_boxes(self, width, height):
+        """Integer xyxy boxes clipped to a width x height image, at least one pixel each"""
+        boxes = np.rint(self.boxes_xyxy()).astype(np.int64)
+        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width - 1)
+        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height - 1)
+        boxes[:, 2] = np.maximum(boxes[:, 2], boxes[:, 0] + 1)
+        boxes[:, 3] = np.maximum(boxes[:, 3], boxes[:, 1] + 1)
+        return boxes
+
+    def class_of(self, i):
+        return self.class_names[self.class_index[i]]
+
+    def counts(self):
+        """Per-class counts, most common first (same order as Counter.most_common)"""
+        totals = np.bincount(self.class_index, minlength=len(self.class_names))
+        order = np.argsort(-totals, kind='stable')
+        return {self.class_names[i]: int(totals[i]) for i in order.tolist() if totals[i] > 0}
+
+    def to_dicts(self):
+        """Rows as the detection dicts the frontend expects"""
+        names = self.class_names
+        return [
+            {
+                'class': names[class_index],
+                'confidence': confidence,
+                'x': x,
+                'y': y,
+                'width': width,
+                'height': height,
+                'detection_id': detection_id,
+                'class_id': class_id
+            }
+            for class_index, confidence, x, y, width, height, detection_id, class_id in zip(
+                self.class_index.tolist(), self.confidence.tolist(), self.x.tolist(),
+                self.y.tolist(), self.width.tolist(), self.height.tolist(),
+                self.detection_id, self.class_id.tolist())
+        ]
+
+
+def _default(obj):
+    if isinstance(obj, DetectionSet):
+        return obj.to_dicts()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_json(payload):
+    """Serialize a response payload to bytes, using orjson when it is installed
+
+    DetectionSet values are written as lists of detection dicts.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, default=_default, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from detections import DetectionSet
+from postprocess import weighted_box_fusion
+from deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# Models queried together, as name:weight pairs; 'workflow' is the furniture
+# workflow, anything else a Roboflow model id. Unset: workflow with COCO fallback
+ENSEMBLE_MODELS = os.getenv("ENSEMBLE_MODELS", "")
+ENSEMBLE_IOU = float(os.getenv("ENSEMBLE_IOU", "0.55"))
+# JSON file of {model: {model class: furniture class}} replacing the default tables
+ENSEMBLE_CLASS_MAP = os.getenv("ENSEMBLE_CLASS_MAP", "")
+
+WORKFLOW_MODEL = 'workflow'
+
+# COCO classes that correspond to the workflow's classes (Armchair, Carpet,
+# Floor-Lamp, Painting, Plants, Side-Table, Sideboard-Credenza-Storage);
+# other COCO classes are dropped
+DEFAULT_CLASS_MAPS = {
+    'coco/3': {
+        'chair': 'Armchair',
+        'dining table': 'Side-Table',
+        'potted plant': 'Plants',
+    }
+}
+
+EnsembleModel = namedtuple('EnsembleModel', 'name weight class_map')
+
+
+def load_class_maps(path=ENSEMBLE_CLASS_MAP):
+    if not path:
+        return DEFAULT_CLASS_MAPS
+    with open(path) as f:
+        return json.load(f)
+
+
+def parse_models(spec=ENSEMBLE_MODELS, class_maps=None):
+    """'workflow:1.0,coco/3:0.5' -> [EnsembleModel, ...]
+
+    The workflow's classes are the reference vocabulary and are not mapped;
+    every other model needs a class map.
+    """
+    class_maps = load_class_maps() if class_maps is None else class_maps
+    models = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, weight = item.rpartition(':') if ':' in item else (item, '', '1')
+        weight = float(weight)
+        if weight <= 0:
+            raise ValueError(f"Ensemble weight for {name} must be positive")
+        if name == WORKFLOW_MODEL:
+            models.append(EnsembleModel(name, weight, None))
+        elif name in class_maps:
+            models.append(EnsembleModel(name, weight, class_maps[name]))
+        else:
+            raise ValueError(f"No class map for ensemble model {name}")
+    return models
+
+
+def map_classes(detections, class_map):
+    """Rename classes through class_map, dropping rows whose class is not in it"""
+    if class_map is None or len(detections) == 0:
+        return detections
+    targets = [class_map.get(name, class_map.get(name.lower())) for name in detections.class_names]
+    class_names = sorted({target for target in targets if target is not None})
+    lookup = np.array([class_names.index(target) if target is not None else -1 for target in targets],
+                      dtype=np.int64)
+    new_index = lookup[detections.class_index]
+    kept = detections.take(new_index >= 0)
+    return DetectionSet(kept.x, kept.y, kept.width, kept.height, kept.confidence,
+                        new_index[new_index >= 0].astype(kept.class_index.dtype), kept.class_id,
+                        kept.detection_id, class_names)
+
+
+def fuse(results, iou_threshold=ENSEMBLE_IOU):
+    """Weighted box fusion across models: [(EnsembleModel, DetectionSet)] -> DetectionSet
+
+    Box coordinates are averaged by confidence times model weight. A fused
+    score is the weighted score sum over the total weight of the models that
+    answered and can detect that class, so a box only one of two models
+    found keeps only that model's share. A model that answered with no
+    detections still counts towards that total.
+    """
+    answered = [model for model, _ in results]
+    results = [(model, detections) for model, detections in results if len(detections)]
+    if not results:
+        return DetectionSet.empty()
+    merged = DetectionSet.concatenate([detections for _, detections in results])
+    weights = np.concatenate([np.full(len(detections), model.weight) for model, detections in results])
+    coverage = np.array([sum(model.weight for model in answered
+                             if model.class_map is None or name in model.class_map.values())
+                         for name in merged.class_names])
+    fused_boxes, fused_scores, representatives = weighted_box_fusion(
+        merged.boxes_xyxy(), merged.confidence * weights, merged.class_index, iou_threshold,
+        normalizers=coverage[merged.class_index])
+    return merged.take(representatives).with_boxes_xyxy(fused_boxes, fused_scores)
+
+
+class Ensemble:
+    """Queries several models concurrently and fuses their detections
+
+    Latency is that of the slowest model rather than the sum. With a
+    deadline, a model that has not answered in time is left out and the
+    result is fused from the others.
+    """
+
+    def __init__(self, models, iou_threshold=ENSEMBLE_IOU):
+        self.models = models
+        self.iou_threshold = iou_threshold
+        self.lock = threading.Lock()
+        self.counters = {model.name: {'calls': 0, 'failures': 0, 'timeouts': 0, 'total_ms': 0.0}
+                         for model in models}
+
+    @property
+    def enabled(self):
+        return bool(self.models)
+
+    def _call(self, model, call_model, deadline):
+        start = time.perf_counter()
+        outcome = 'failures'
+        try:
+            if deadline is not None:
+                detections = deadline.call(f'ensemble:{model.name}', call_model, model)
+            else:
+                detections = call_model(model)
+            outcome = None
+            return map_classes(detections, model.class_map)
+        except DeadlineExceeded:
+            outcome = 'timeouts'
+            raise
+        finally:
+            with self.lock:
+                counters = self.counters[model.name]
+                counters['calls'] += 1
+                counters['total_ms'] += (time.perf_counter() - start) * 1000
+                if outcome:
+                    counters[outcome] += 1
+
+    def run(self, call_model, deadline=None):
+        """Fuse call_model(model) -> DetectionSet over every model
+
+        Raises the last error (DeadlineExceeded if time ran out) when no
+        model answered.
+        """
+        with ThreadPoolExecutor(max_workers=len(self.models)) as pool:
+            futures = [(model, pool.submit(self._call, model, call_model, deadline)) for model in self.models]
+        results = []
+        error = None
+        for model, future in futures:
+            try:
+                results.append((model, future.result()))
+            except DeadlineExceeded as e:
+                error = e
+            except Exception as e:
+                logger.warning(f"Ensemble model {model.name} failed: {e}")
+                error = error or e
+        if not results:
+            if isinstance(error, DeadlineExceeded) and deadline is not None:
+                deadline.skip('inference')
+            raise error
+        return fuse(results, self.iou_threshold)
+
+    def stats(self):
+        models = []
+        with self.lock:
+            for model in self.models:
+                counters = self.counters[model.name]
+                models.append({
+                    'name': model.name,
+                    'weight': model.weight,
+                    'calls': counters['calls'],
+                    'failures': counters['failures'],
+                    'timeouts': counters['timeouts'],
+                    'mean_ms': counters['total_ms'] / counters['calls'] if counters['calls'] else None
+                })
+        return {'models': models, 'iou_threshold': self.iou_threshold}
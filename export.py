@@ -0,0 +1,211 @@
+import io
+import os
+import sys
+import argparse
+from datetime import datetime, timezone
+from flask import request, jsonify, Response
+from detections import encode_json
+from filters import parse_filter_params
+from inventory import InventoryStore, EXPORT_COLUMNS
+
+# Parquet export is optional; it needs pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "10000"))
+# Rows per Parquet row group (each group is written and flushed as it fills)
+PARQUET_ROW_GROUP_SIZE = int(os.getenv("PARQUET_ROW_GROUP_SIZE", "65536"))
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'detections.csv'),
+    'coco': ('application/json', 'detections_coco.json'),
+    'parquet': ('application/vnd.apache.parquet', 'detections.parquet'),
+}
+
+
+def _parse_time(value):
+    """Epoch seconds or an ISO date/datetime (UTC unless it has an offset)"""
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def parse_export_params(values):
+    """Read export filters: since/until, property, room, classes, exclude_classes, min_confidence
+
+    Raises ValueError for malformed values.
+    """
+    detection_filters = parse_filter_params(values)
+    return {
+        'since': _parse_time(values.get('since')),
+        'until': _parse_time(values.get('until')),
+        'property': values.get('property') or None,
+        'room': values.get('room') or None,
+        'classes': detection_filters['classes'],
+        'exclude_classes': detection_filters['exclude_classes'],
+        'min_confidence': detection_filters['min_confidence'],
+    }
+
+
+def export_csv(store, filters):
+    """Yield the export as CSV text chunks, one chunk per database batch"""
+    yield ','.join(EXPORT_COLUMNS) + '\n'
+    for lines in store.iter_export_csv_lines(filters, EXPORT_BATCH_SIZE):
+        lines.append('')
+        yield '\n'.join(lines)
+
+
+def _json_items(items):
+    # Encode a batch as one array and drop the brackets, so batches can be joined
+    return encode_json(items)[1:-1]
+
+
+def export_coco(store, filters):
+    """Yield the export as COCO-format JSON bytes
+
+    Photos become images, detections become annotations with top-left
+    [x, y, width, height] boxes, and classes become categories. All three
+    are read in one snapshot, so every annotation's category is listed.
+    """
+    with store.export_snapshot() as conn:
+        categories = store.export_classes(filters, conn)
+        category_ids = {name: i for i, name in enumerate(categories, 1)}
+        yield b'{"info":{"description":"Furniture detection export"},"categories":'
+        yield encode_json([{'id': i, 'name': name, 'supercategory': 'furniture'}
+                           for name, i in category_ids.items()])
+
+        yield b',"images":['
+        separator = b''
+        for rows in store.iter_export_photos(filters, EXPORT_BATCH_SIZE, conn):
+            yield separator + _json_items([
+                {'id': photo_id, 'file_name': filename, 'width': width, 'height': height,
+                 'date_captured': datetime.fromtimestamp(created_at, timezone.utc).isoformat()}
+                for photo_id, filename, width, height, created_at in rows])
+            separator = b','
+
+        yield b'],"annotations":['
+        separator = b''
+        for rows in store.iter_export_rows(filters, EXPORT_BATCH_SIZE, conn):
+            yield separator + _json_items([
+                {'id': row[0], 'image_id': row[1], 'category_id': category_ids[row[8]],
+                 'bbox': [row[10] - row[12] / 2, row[11] - row[13] / 2, row[12], row[13]],
+                 'area': row[12] * row[13], 'score': row[9], 'iscrowd': 0}
+                for row in rows])
+            separator = b','
+        yield b']}'
+
+
+class _StreamSink(io.RawIOBase):
+    """Write-only sink that collects writer output for a generator to drain"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _parquet_schema():
+    return pa.schema([
+        ('detection_row', pa.int64()), ('photo_id', pa.int64()), ('property', pa.string()),
+        ('room', pa.string()), ('filename', pa.string()), ('image_width', pa.int32()),
+        ('image_height', pa.int32()), ('created_at', pa.timestamp('us', tz='UTC')),
+        ('class', pa.dictionary(pa.int32(), pa.string())), ('confidence', pa.float32()),
+        ('x', pa.float32()), ('y', pa.float32()), ('width', pa.float32()), ('height', pa.float32()),
+        ('detection_id', pa.string()), ('item_id', pa.int64()),
+    ])
+
+
+def export_parquet(store, filters):
+    """Yield the export as Parquet bytes, one row group per database batch"""
+    schema = _parquet_schema()
+    sink = _StreamSink()
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for rows in store.iter_export_rows(filters, PARQUET_ROW_GROUP_SIZE):
+            columns = dict(zip(EXPORT_COLUMNS, (list(values) for values in zip(*rows))))
+            # created_at is stored as epoch seconds
+            columns['created_at'] = [int(value * 1_000_000) for value in columns['created_at']]
+            writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+EXPORTERS = {'csv': export_csv, 'coco': export_coco, 'parquet': export_parquet}
+
+
+def register_export_routes(app, store):
+    """Stream stored detections as /export/detections.<csv|coco|parquet>"""
+
+    @app.route('/export/detections.<export_format>')
+    def export_detections(export_format):
+        if export_format not in EXPORTERS:
+            return jsonify({'error': f'Unknown export format: {export_format}'}), 404
+        if export_format == 'parquet' and pa is None:
+            return jsonify({'error': 'Parquet export requires pyarrow'}), 501
+        try:
+            filters = parse_export_params(request.args)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid filter: {str(e)}'}), 400
+        mimetype, filename = EXPORT_FORMATS[export_format]
+        return Response(EXPORTERS[export_format](store, filters), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export stored detections from the inventory database")
+    parser.add_argument('format', choices=sorted(EXPORTERS))
+    parser.add_argument('-o', '--output', help="Output file (default: stdout)")
+    parser.add_argument('--db', default=os.getenv("INVENTORY_DB", "inventory.db"))
+    parser.add_argument('--since', help="Start date/time (ISO) or epoch seconds")
+    parser.add_argument('--until', help="End date/time (ISO) or epoch seconds, exclusive")
+    parser.add_argument('--property')
+    parser.add_argument('--room')
+    parser.add_argument('--classes', help="Comma-separated classes to include")
+    parser.add_argument('--exclude-classes', help="Comma-separated classes to skip")
+    parser.add_argument('--min-confidence')
+    args = parser.parse_args()
+
+    if args.format == 'parquet' and pa is None:
+        parser.error("Parquet export requires pyarrow")
+    values = {key: value for key, value in vars(args).items() if value is not None}
+    try:
+        filters = parse_export_params(values)
+    except ValueError as e:
+        parser.error(str(e))
+    store = InventoryStore(args.db)
+
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in EXPORTERS[args.format](store, filters):
+            output.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
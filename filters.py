@@ -0,0 +1,123 @@
+import os
+
+# The light Vercel build ships without NumPy and only filters dicts
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Upper bound on max_detections so a request cannot ask for unbounded work
+MAX_DETECTIONS_LIMIT = int(os.getenv("MAX_DETECTIONS_LIMIT", "1000"))
+
+
+def _split_classes(value):
+    if not value:
+        return None
+    classes = {name.strip() for name in value.split(',') if name.strip()}
+    return classes or None
+
+
+def _positive_int(values, name):
+    value = values.get(name)
+    if value in (None, ''):
+        return None
+    number = int(value)
+    if number < 1:
+        raise ValueError(f"{name} must be a positive integer")
+    return number
+
+
+def parse_filter_params(values):
+    """Read detection filters from request args/form values
+
+    Recognised keys: min_confidence (0-1), classes and exclude_classes
+    (comma-separated class names), top_k (per class) and max_detections.
+    Raises ValueError for malformed values.
+    """
+    filters = {
+        'min_confidence': None,
+        'classes': _split_classes(values.get('classes')),
+        'exclude_classes': _split_classes(values.get('exclude_classes')),
+        'top_k': _positive_int(values, 'top_k'),
+        'max_detections': _positive_int(values, 'max_detections'),
+    }
+    min_confidence = values.get('min_confidence')
+    if min_confidence not in (None, ''):
+        min_confidence = float(min_confidence)
+        if not 0 <= min_confidence <= 1:
+            raise ValueError("min_confidence must be between 0 and 1")
+        filters['min_confidence'] = min_confidence
+    if filters['max_detections'] is not None:
+        filters['max_detections'] = min(filters['max_detections'], MAX_DETECTIONS_LIMIT)
+    return filters
+
+
+def has_filters(filters):
+    return any(value is not None for value in filters.values())
+
+
+def apply_filters(detections, filters):
+    """Apply parsed filters to a DetectionSet, keeping highest-confidence rows first"""
+    if not filters or len(detections) == 0 or not has_filters(filters):
+        return detections
+
+    mask = np.ones(len(detections), dtype=bool)
+    if filters['min_confidence'] is not None:
+        mask &= detections.confidence >= filters['min_confidence']
+    if filters['classes'] is not None or filters['exclude_classes'] is not None:
+        # Decide per entry of the class table, then broadcast to rows
+        allowed = np.array([
+            (filters['classes'] is None or name in filters['classes']) and
+            (filters['exclude_classes'] is None or name not in filters['exclude_classes'])
+            for name in detections.class_names
+        ], dtype=bool)
+        mask &= allowed[detections.class_index]
+    indices = np.flatnonzero(mask)
+
+    # Highest confidence first, so top-k and max_detections keep the best rows
+    indices = indices[np.argsort(-detections.confidence[indices], kind='stable')]
+
+    if filters['top_k'] is not None and indices.size:
+        classes = detections.class_index[indices]
+        # Stable sort by class keeps the confidence order inside each class
+        by_class = np.argsort(classes, kind='stable')
+        sorted_classes = classes[by_class]
+        rank = np.arange(sorted_classes.size) - np.searchsorted(sorted_classes, sorted_classes, side='left')
+        within = np.zeros(indices.size, dtype=bool)
+        within[by_class[rank < filters['top_k']]] = True
+        indices = indices[within]
+
+    if filters['max_detections'] is not None:
+        indices = indices[:filters['max_detections']]
+    return detections.take(indices)
+
+
+def filter_detection_dicts(detections, filters):
+    """Plain-Python equivalent of apply_filters for lists of detection dicts"""
+    if not filters or not has_filters(filters):
+        return detections
+    kept = []
+    for detection in detections:
+        class_name = detection.get('class', 'Unknown')
+        if filters['min_confidence'] is not None and detection.get('confidence', 0) < filters['min_confidence']:
+            continue
+        if filters['classes'] is not None and class_name not in filters['classes']:
+            continue
+        if filters['exclude_classes'] is not None and class_name in filters['exclude_classes']:
+            continue
+        kept.append(detection)
+    kept.sort(key=lambda detection: detection.get('confidence', 0), reverse=True)
+
+    if filters['top_k'] is not None:
+        per_class = {}
+        limited = []
+        for detection in kept:
+            class_name = detection.get('class', 'Unknown')
+            per_class[class_name] = per_class.get(class_name, 0) + 1
+            if per_class[class_name] <= filters['top_k']:
+                limited.append(detection)
+        kept = limited
+
+    if filters['max_detections'] is not None:
+        kept = kept[:filters['max_detections']]
+    return kept
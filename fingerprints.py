@@ -0,0 +1,109 @@
+import cv2
+import numpy as np
+
+# Crops are reduced to HASH_SIZE x HASH_SIZE before the DCT; the perceptual
+# hash keeps the lowest 8 x 8 frequencies (64 bits)
+HASH_SIZE = 32
+HASH_BITS = 64
+# Hue x saturation x value bins of the color histogram
+HISTOGRAM_BINS = (8, 3, 3)
+HISTOGRAM_SIZE = int(np.prod(HISTOGRAM_BINS))
+
+
+def _dct_matrix(size):
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(HASH_SIZE)
+# Number of set bits in every byte value, for vectorized Hamming distances
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def perceptual_hashes(gray):
+    """64-bit DCT hashes of a stack of HASH_SIZE x HASH_SIZE grayscale tiles"""
+    low = (_DCT @ gray.astype(np.float32) @ _DCT.T)[:, :8, :8].reshape(len(gray), HASH_BITS)
+    # Compare against the median of the AC coefficients (the DC term only encodes brightness)
+    bits = low > np.median(low[:, 1:], axis=1, keepdims=True)
+    return np.packbits(bits, axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def crop_fingerprints(image, detections):
+    """Perceptual hash and color histogram of every detection crop in one image
+
+    image is the decoded BGR array. All crops are resized to one small tile
+    and stacked, so the color conversions, DCT and histograms run once per
+    image instead of once per crop. Returns (hashes, histograms): a uint64
+    hash per detection and an L1-normalised float32 histogram per detection.
+    """
+    count = len(detections)
+    if count == 0:
+        return np.empty(0, dtype=np.uint64), np.empty((0, HISTOGRAM_SIZE), dtype=np.float32)
+
+    height, width = image.shape[:2]
+    boxes = detections.pixel_boxes(width, height)
+
+    # Crops are views into the decoded image; only the resized tiles are copied
+    tiles = np.concatenate([
+        cv2.resize(image[y1:y2, x1:x2], (HASH_SIZE, HASH_SIZE), interpolation=cv2.INTER_AREA)
+        for x1, y1, x2, y2 in boxes.tolist()
+    ], axis=0)
+
+    gray = cv2.cvtColor(tiles, cv2.COLOR_BGR2GRAY).reshape(count, HASH_SIZE, HASH_SIZE)
+    hashes = perceptual_hashes(gray)
+
+    hsv = cv2.cvtColor(tiles, cv2.COLOR_BGR2HSV).reshape(count, -1, 3).astype(np.int64)
+    hue_bins, saturation_bins, value_bins = HISTOGRAM_BINS
+    bins = ((hsv[:, :, 0] * hue_bins // 180) * saturation_bins +
+            hsv[:, :, 1] * saturation_bins // 256) * value_bins + hsv[:, :, 2] * value_bins // 256
+    # Offset each crop into its own bin range so a single bincount covers all crops
+    bins += np.arange(count)[:, None] * HISTOGRAM_SIZE
+    histograms = np.bincount(bins.ravel(), minlength=count * HISTOGRAM_SIZE).reshape(count, HISTOGRAM_SIZE)
+    histograms = (histograms / histograms.sum(axis=1, keepdims=True)).astype(np.float32)
+    return hashes, histograms
+
+
+def hamming_distances(hashes, other_hashes):
+    """Matrix of bit differences between two arrays of 64-bit hashes"""
+    xor = np.bitwise_xor(hashes[:, None], other_hashes[None, :])
+    return _POPCOUNT[xor.view(np.uint8).reshape(len(hashes), len(other_hashes), 8)].sum(axis=2)
+
+
+def similarity_matrix(hashes, histograms, other_hashes, other_histograms, hash_weight=0.5):
+    """Similarity in [0, 1] between every pair of fingerprints
+
+    Blends the perceptual hash agreement with the Bhattacharyya coefficient
+    of the color histograms; both are computed as whole matrices.
+    """
+    hash_similarity = 1 - hamming_distances(hashes, other_hashes) / HASH_BITS
+    histogram_similarity = np.sqrt(histograms) @ np.sqrt(other_histograms).T
+    return hash_weight * hash_similarity + (1 - hash_weight) * histogram_similarity
+
+
+def match_fingerprints(hashes, histograms, classes, item_hashes, item_histograms, item_classes,
+                       threshold):
+    """Match new crops to known items of the same class
+
+    classes and item_classes are comparable integer class codes. Each item
+    is matched to at most one crop, best similarity first. Returns, for each
+    crop, the position of its matching item or -1.
+    """
+    matches = np.full(len(hashes), -1, dtype=np.int64)
+    if len(hashes) == 0 or len(item_hashes) == 0:
+        return matches
+
+    similarity = similarity_matrix(hashes, histograms, item_hashes, item_histograms)
+    similarity[classes[:, None] != item_classes[None, :]] = -1
+    crops, items = np.nonzero(similarity >= threshold)
+    order = np.argsort(-similarity[crops, items], kind='stable')
+
+    # Greedy one-to-one assignment over the (few) candidate pairs
+    used = set()
+    for crop, item in zip(crops[order].tolist(), items[order].tolist()):
+        if matches[crop] < 0 and item not in used:
+            matches[crop] = item
+            used.add(item)
+    return matches
@@ -0,0 +1,227 @@
+import os
+import time
+import random
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+from PIL import Image
+from fingerprints import HASH_SIZE, perceptual_hashes
+
+# Near-duplicate cache settings; IMAGE_CACHE_SIZE=0 disables the cache
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "512"))
+# Maximum Hamming distance (of 64 bits) for two images to count as the same photo
+IMAGE_CACHE_THRESHOLD = int(os.getenv("IMAGE_CACHE_THRESHOLD", "4"))
+# Fraction of cache hits that are re-run through inference to check the match
+IMAGE_CACHE_AUDIT_RATE = float(os.getenv("IMAGE_CACHE_AUDIT_RATE", "0.05"))
+# Crops or letterboxing change the aspect ratio; such images are never reused
+ASPECT_TOLERANCE = 0.02
+
+
+def _popcount(value):
+    return bin(value).count('1')
+
+
+# PIL transpose operations for EXIF orientations 2-8
+_ORIENTATION_TRANSPOSE = {
+    2: Image.FLIP_LEFT_RIGHT, 3: Image.ROTATE_180, 4: Image.FLIP_TOP_BOTTOM, 5: Image.TRANSPOSE,
+    6: Image.ROTATE_270, 7: Image.TRANSVERSE, 8: Image.ROTATE_90,
+}
+
+
+def image_hash(path, orientation=1):
+    """Perceptual hash of an image file, computed on the upright image
+
+    Only a small thumbnail is decoded: JPEGs are DCT-scaled while decoding
+    via Image.draft, so the full-resolution pixels are never materialised.
+    """
+    with Image.open(path) as img:
+        img.draft('L', (HASH_SIZE * 2, HASH_SIZE * 2))
+        thumbnail = img.convert('L').resize((HASH_SIZE, HASH_SIZE), Image.BILINEAR)
+    if orientation in _ORIENTATION_TRANSPOSE:
+        thumbnail = thumbnail.transpose(_ORIENTATION_TRANSPOSE[orientation])
+    gray = np.asarray(thumbnail, dtype=np.float32)[None]
+    return int(perceptual_hashes(gray)[0])
+
+
+class _BKNode:
+    __slots__ = ('hash', 'keys', 'children')
+
+    def __init__(self, value):
+        self.hash = value
+        self.keys = []
+        self.children = {}
+
+
+class BKTree:
+    """BK-tree over 64-bit hashes under Hamming distance
+
+    Each node holds the cache keys stored under its hash. Removal only
+    detaches keys; empty nodes stay in place as routing nodes and are
+    dropped when the tree is rebuilt.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.nodes = 0
+        self.empty_nodes = 0
+
+    def add(self, value, key):
+        if self.root is None:
+            self.root = _BKNode(value)
+            self.nodes = 1
+            self.root.keys.append(key)
+            return
+        node = self.root
+        while True:
+            distance = _popcount(node.hash ^ value)
+            if distance == 0:
+                if not node.keys:
+                    self.empty_nodes -= 1
+                node.keys.append(key)
+                return
+            child = node.children.get(distance)
+            if child is None:
+                child = node.children[distance] = _BKNode(value)
+                self.nodes += 1
+                child.keys.append(key)
+                return
+            node = child
+
+    def remove(self, value, key):
+        node = self.root
+        while node is not None:
+            distance = _popcount(node.hash ^ value)
+            if distance == 0:
+                node.keys.remove(key)
+                if not node.keys:
+                    self.empty_nodes += 1
+                return
+            node = node.children.get(distance)
+
+    def search(self, value, radius):
+        """Return (distance, key) for every stored key within radius, closest first"""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = _popcount(node.hash ^ value)
+            if distance <= radius:
+                found.extend((distance, key) for key in node.keys)
+            # Triangle inequality: only subtrees at distance d +- radius can match
+            for edge, child in node.children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+class NearDuplicateCache:
+    """LRU cache of detections keyed by perceptual image hash
+
+    A lookup matches any stored image within the Hamming threshold that has
+    the same aspect ratio and was produced with the same inference variant
+    (parameters that change the detections). Hits are rescaled to the size
+    of the new image. Entries stored with the SHA-256 of the file can also
+    be found by digest alone, before the image has even finished uploading.
+    """
+
+    def __init__(self, max_entries=IMAGE_CACHE_SIZE, threshold=IMAGE_CACHE_THRESHOLD,
+                 audit_rate=IMAGE_CACHE_AUDIT_RATE):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.audit_rate = audit_rate
+        self.entries = OrderedDict()
+        self.tree = BKTree()
+        self.digests = {}
+        self.lock = threading.Lock()
+        self.next_key = 0
+        self.counters = {'lookups': 0, 'hits': 0, 'exact_hits': 0, 'audits': 0, 'false_matches': 0}
+        self.recent_false_matches = deque(maxlen=20)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def lookup(self, value, size, variant):
+        """Return (distance, detections) of the closest usable entry, or None"""
+        with self.lock:
+            self.counters['lookups'] += 1
+            for distance, key in self.tree.search(value, self.threshold):
+                entry = self.entries[key]
+                cached_width, cached_height = entry['size']
+                if entry['variant'] != variant:
+                    continue
+                aspect = size[0] / size[1]
+                if abs(cached_width / cached_height - aspect) > ASPECT_TOLERANCE * aspect:
+                    continue
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                detections = entry['detections']
+                if (cached_width, cached_height) != tuple(size):
+                    detections = detections.scaled(size[0] / cached_width, size[1] / cached_height)
+                return distance, detections
+        return None
+
+    def lookup_digest(self, digest, variant):
+        """Return (image size, detections) stored for this exact file content, or None"""
+        with self.lock:
+            key = self.digests.get((digest, variant))
+            if key is None:
+                return None
+            self.entries.move_to_end(key)
+            self.counters['exact_hits'] += 1
+            entry = self.entries[key]
+            return entry['size'], entry['detections']
+
+    def store(self, value, size, variant, detections, digest=None):
+        with self.lock:
+            key = self.next_key
+            self.next_key += 1
+            self.entries[key] = {'hash': value, 'size': tuple(size), 'variant': variant,
+                                 'detections': detections, 'digest': digest, 'stored_at': time.time()}
+            self.tree.add(value, key)
+            if digest is not None:
+                self.digests[(digest, variant)] = key
+            while len(self.entries) > self.max_entries:
+                evicted_key, evicted = self.entries.popitem(last=False)
+                self.tree.remove(evicted['hash'], evicted_key)
+                if self.digests.get((evicted['digest'], evicted['variant'])) == evicted_key:
+                    del self.digests[(evicted['digest'], evicted['variant'])]
+            # Rebuild once most nodes only route to evicted hashes
+            if self.tree.empty_nodes > len(self.entries):
+                self._rebuild()
+
+    def _rebuild(self):
+        self.tree = BKTree()
+        for key, entry in self.entries.items():
+            self.tree.add(entry['hash'], key)
+
+    def should_audit(self):
+        return random.random() < self.audit_rate
+
+    def record_audit(self, distance, cached_counts, fresh_counts):
+        """Count an audited hit; a different per-class count is a false match"""
+        with self.lock:
+            self.counters['audits'] += 1
+            if cached_counts != fresh_counts:
+                self.counters['false_matches'] += 1
+                self.recent_false_matches.append({
+                    'distance': distance,
+                    'cached_counts': cached_counts,
+                    'fresh_counts': fresh_counts,
+                    'audited_at': time.time()
+                })
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters.update({
+                'enabled': self.enabled,
+                'entries': len(self.entries),
+                'threshold': self.threshold,
+                'hit_rate': counters['hits'] / counters['lookups'] if counters['lookups'] else 0.0,
+                'false_match_rate': (counters['false_matches'] / counters['audits']
+                                     if counters['audits'] else 0.0),
+                'recent_false_matches': list(self.recent_false_matches)
+            })
+        return counters
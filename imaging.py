@@ -0,0 +1,140 @@
+import os
+import warnings
+from collections import namedtuple
+from PIL import Image
+
+# The light Vercel build ships without OpenCV and only inspects headers
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+# Longest side to decode at when an image is only rendered for display
+VISUALIZATION_MAX_SIDE = int(os.getenv("VISUALIZATION_MAX_SIDE", "1600"))
+# Longest side to decode at before sending an image for inference (0 = send the original file)
+INFERENCE_MAX_SIDE = int(os.getenv("INFERENCE_MAX_SIDE", "0"))
+# Uploads with more pixels than this are rejected before anything is decoded
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "64000000"))
+
+# MPO is the multi-picture JPEG variant many phones write
+ALLOWED_FORMATS = {'JPEG', 'MPO', 'PNG', 'GIF', 'BMP'}
+JPEG_FORMATS = {'JPEG', 'MPO'}
+EXIF_ORIENTATION = 0x0112
+
+
+class ImageValidationError(ValueError):
+    """The upload is not an image this app will decode"""
+
+
+class ImageInfo(namedtuple('ImageInfo', 'format width height orientation')):
+    """Header metadata: stored width/height plus the EXIF orientation (1-8)"""
+
+    @property
+    def pixels(self):
+        return self.width * self.height
+
+    @property
+    def size(self):
+        """(width, height) once the EXIF orientation is applied"""
+        if self.orientation in (5, 6, 7, 8):
+            return self.height, self.width
+        return self.width, self.height
+
+
+def inspect_image(source):
+    """Read format, dimensions and EXIF orientation from the header only
+
+    source is a path or file object. No pixel data is decoded, so oversized
+    images (decompression bombs) are rejected before any allocation.
+    Raises ImageValidationError.
+    """
+    try:
+        with warnings.catch_warnings():
+            # Pillow warns about large images; the pixel limit below decides
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(source) as img:
+                image_format = img.format
+                width, height = img.size
+                exif_data = img.info.get('exif')
+    except Image.DecompressionBombError:
+        raise ImageValidationError("Image has too many pixels")
+    except Exception:
+        raise ImageValidationError("Invalid image file")
+
+    if image_format not in ALLOWED_FORMATS:
+        raise ImageValidationError(f"Unsupported image format: {image_format}")
+    if width < 1 or height < 1:
+        raise ImageValidationError("Image has no pixels")
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ImageValidationError(
+            f"Image is too large: {width}x{height} exceeds {MAX_IMAGE_PIXELS} pixels")
+
+    orientation = 1
+    if exif_data:
+        # Parse the EXIF block from the header; getexif() would decode PNGs
+        exif = Image.Exif()
+        try:
+            exif.load(exif_data)
+            orientation = exif.get(EXIF_ORIENTATION, 1)
+        except Exception:
+            pass
+        if orientation not in range(1, 9):
+            orientation = 1
+    return ImageInfo(image_format, width, height, orientation)
+
+
+def reduction_factor(size, target_side):
+    """Largest JPEG scale denominator that keeps the longest side >= target_side"""
+    if not target_side:
+        return 1
+    longest = max(size)
+    for factor in (8, 4, 2):
+        if -(-longest // factor) >= target_side:
+            return factor
+    return 1
+
+
+def apply_orientation(image, orientation):
+    """Rotate/flip decoded pixels so they display upright (EXIF orientation 1-8)"""
+    if orientation == 2:
+        return cv2.flip(image, 1)
+    if orientation == 3:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(image, 0)
+    if orientation == 5:
+        return cv2.transpose(image)
+    if orientation == 6:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(image), -1)
+    if orientation == 8:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
+
+
+def decode_image(path, target_side=None, info=None):
+    """Decode an image as upright BGR, at reduced resolution when the target size allows
+
+    JPEGs whose longest side is at least 2x target_side are decoded directly
+    at 1/2, 1/4 or 1/8 size; anything else is decoded in full. The EXIF
+    orientation is applied here, once, so every consumer sees the same
+    pixels. Returns (image, (sx, sy)), the scale from the upright original
+    to the decoded image, or (None, None) if the file cannot be decoded.
+    """
+    if info is None:
+        info = inspect_image(path)
+    factor = reduction_factor(info.size, target_side) if info.format in JPEG_FORMATS else 1
+    flags = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    }[factor]
+    # Skip OpenCV's own EXIF handling so the orientation is applied exactly once
+    image = cv2.imread(path, flags | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        return None, None
+    image = apply_orientation(image, info.orientation)
+    width, height = info.size
+    return image, (image.shape[1] / width, image.shape[0] / height)
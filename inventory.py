@@ -0,0 +1,544 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+from flask import request, jsonify
+from detections import DetectionSet
+from fingerprints import match_fingerprints
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+# Columns of exported detection rows, in order
+EXPORT_COLUMNS = ('detection_row', 'photo_id', 'property', 'room', 'filename', 'image_width',
+                  'image_height', 'created_at', 'class', 'confidence', 'x', 'y', 'width', 'height',
+                  'detection_id', 'item_id')
+
+# Merge detections that look like an item already recorded in the same room
+INVENTORY_DEDUP = os.getenv("INVENTORY_DEDUP", "1") == "1"
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.8"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS properties (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL,
+    room_count INTEGER NOT NULL DEFAULT 0,
+    photo_count INTEGER NOT NULL DEFAULT 0,
+    total_objects INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS rooms (
+    id INTEGER PRIMARY KEY,
+    property_id INTEGER NOT NULL REFERENCES properties(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    photo_count INTEGER NOT NULL DEFAULT 0,
+    total_objects INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (property_id, name)
+);
+CREATE TABLE IF NOT EXISTS photos (
+    id INTEGER PRIMARY KEY,
+    room_id INTEGER NOT NULL REFERENCES rooms(id) ON DELETE CASCADE,
+    filename TEXT,
+    width INTEGER,
+    height INTEGER,
+    created_at REAL NOT NULL,
+    total_objects INTEGER NOT NULL,
+    new_items INTEGER NOT NULL DEFAULT 0,
+    object_counts TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_photos_room ON photos (room_id, id);
+CREATE INDEX IF NOT EXISTS idx_photos_created ON photos (created_at);
+-- Unique physical items per room; detections of the same item in several
+-- photos point at one row. phash/histogram are the crop fingerprint.
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    room_id INTEGER NOT NULL REFERENCES rooms(id) ON DELETE CASCADE,
+    class_name TEXT NOT NULL,
+    phash INTEGER,
+    histogram BLOB,
+    sightings INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_items_room ON items (room_id, class_name);
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    photo_id INTEGER NOT NULL REFERENCES photos(id) ON DELETE CASCADE,
+    class_name TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    x REAL NOT NULL,
+    y REAL NOT NULL,
+    width REAL NOT NULL,
+    height REAL NOT NULL,
+    detection_id TEXT,
+    item_id INTEGER REFERENCES items(id)
+);
+CREATE INDEX IF NOT EXISTS idx_detections_photo ON detections (photo_id);
+CREATE INDEX IF NOT EXISTS idx_detections_class ON detections (class_name);
+CREATE INDEX IF NOT EXISTS idx_detections_item ON detections (item_id);
+-- Aggregates maintained incrementally on every insert/delete
+CREATE TABLE IF NOT EXISTS room_counts (
+    room_id INTEGER NOT NULL REFERENCES rooms(id) ON DELETE CASCADE,
+    class_name TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (room_id, class_name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS property_counts (
+    property_id INTEGER NOT NULL REFERENCES properties(id) ON DELETE CASCADE,
+    class_name TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (property_id, class_name)
+) WITHOUT ROWID;
+"""
+
+
+class InventoryStore:
+    """SQLite store for property -> room -> photo -> detections
+
+    Per-room and per-property class counts are kept in their own tables and
+    updated in the same transaction as each photo, so totals never need to
+    be recomputed from the detections. Counts are of unique items: a
+    detection whose crop fingerprint matches an item already seen in the
+    room is linked to that item instead of adding a new one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            self._migrate(conn)
+            conn.executescript(SCHEMA)
+
+    def _migrate(self, conn):
+        # Databases created before item de-duplication lack these columns
+        for table, column, definition in (
+                ('photos', 'new_items', 'INTEGER NOT NULL DEFAULT 0'),
+                ('detections', 'item_id', 'INTEGER REFERENCES items(id)')):
+            columns = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if columns and column not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _get_or_create_room(self, conn, property_name, room_name, now):
+        conn.execute("INSERT OR IGNORE INTO properties (name, created_at) VALUES (?, ?)",
+                     (property_name, now))
+        property_id = conn.execute("SELECT id FROM properties WHERE name = ?",
+                                   (property_name,)).fetchone()['id']
+        created = conn.execute(
+            "INSERT OR IGNORE INTO rooms (property_id, name, created_at) VALUES (?, ?, ?)",
+            (property_id, room_name, now)).rowcount
+        if created:
+            conn.execute("UPDATE properties SET room_count = room_count + 1 WHERE id = ?", (property_id,))
+        room_id = conn.execute("SELECT id FROM rooms WHERE property_id = ? AND name = ?",
+                               (property_id, room_name)).fetchone()['id']
+        return property_id, room_id
+
+    def _apply_counts(self, conn, property_id, room_id, object_counts, total, sign):
+        rows = [(room_id, name, sign * count) for name, count in object_counts.items()]
+        conn.executemany(
+            "INSERT INTO room_counts (room_id, class_name, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (room_id, class_name) DO UPDATE SET count = count + excluded.count",
+            rows)
+        conn.executemany(
+            "INSERT INTO property_counts (property_id, class_name, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (property_id, class_name) DO UPDATE SET count = count + excluded.count",
+            [(property_id, name, delta) for _, name, delta in rows])
+        if sign < 0:
+            conn.execute("DELETE FROM room_counts WHERE room_id = ? AND count <= 0", (room_id,))
+            conn.execute("DELETE FROM property_counts WHERE property_id = ? AND count <= 0", (property_id,))
+        conn.execute("UPDATE rooms SET photo_count = photo_count + ?, total_objects = total_objects + ? "
+                     "WHERE id = ?", (sign, sign * total, room_id))
+        conn.execute("UPDATE properties SET photo_count = photo_count + ?, total_objects = total_objects + ? "
+                     "WHERE id = ?", (sign, sign * total, property_id))
+
+    def _match_items(self, conn, room_id, detections, fingerprints):
+        """Return the existing item id for each detection, or None for new items"""
+        item_ids = [None] * len(detections)
+        if fingerprints is None or not INVENTORY_DEDUP or len(detections) == 0:
+            return item_ids
+        rows = conn.execute(
+            "SELECT id, class_name, phash, histogram FROM items "
+            "WHERE room_id = ? AND phash IS NOT NULL", (room_id,)).fetchall()
+        if not rows:
+            return item_ids
+        hashes, histograms = fingerprints
+        class_lookup = {name: i for i, name in enumerate(detections.class_names)}
+        item_classes = np.array([class_lookup.get(row['class_name'], -1) for row in rows], dtype=np.int64)
+        item_hashes = np.array([row['phash'] for row in rows], dtype=np.int64).view(np.uint64)
+        item_histograms = np.frombuffer(b''.join(row['histogram'] for row in rows),
+                                        dtype=np.float32).reshape(len(rows), -1)
+        matches = match_fingerprints(hashes, histograms, detections.class_index.astype(np.int64),
+                                     item_hashes, item_histograms, item_classes, DEDUP_SIMILARITY)
+        for i, match in enumerate(matches.tolist()):
+            if match >= 0:
+                item_ids[i] = rows[match]['id']
+        return item_ids
+
+    def add_photo(self, property_name, room_name, detections, filename=None, image_size=None,
+                  fingerprints=None):
+        """Store one photo's DetectionSet under a room and update the aggregates
+
+        fingerprints is the (hashes, histograms) pair from crop_fingerprints;
+        without it every detection is recorded as a new item.
+        Returns the new photo id.
+        """
+        now = time.time()
+        object_counts = detections.counts()
+        width, height = image_size if image_size else (None, None)
+        names = detections.class_names
+        conn = self._connection()
+        with conn:
+            property_id, room_id = self._get_or_create_room(conn, property_name, room_name, now)
+            item_ids = self._match_items(conn, room_id, detections, fingerprints)
+            conn.executemany("UPDATE items SET sightings = sightings + 1 WHERE id = ?",
+                             [(item_id,) for item_id in item_ids if item_id is not None])
+
+            # Detections without a match become new items; matched items gain a sighting
+            new_counts = {}
+            for i, class_index in enumerate(detections.class_index.tolist()):
+                if item_ids[i] is not None:
+                    continue
+                phash = histogram = None
+                if fingerprints is not None:
+                    phash = int(fingerprints[0][i:i + 1].view(np.int64)[0])
+                    histogram = fingerprints[1][i].tobytes()
+                item_ids[i] = conn.execute(
+                    "INSERT INTO items (room_id, class_name, phash, histogram, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)", (room_id, names[class_index], phash, histogram, now)
+                ).lastrowid
+                new_counts[names[class_index]] = new_counts.get(names[class_index], 0) + 1
+            new_items = sum(new_counts.values())
+
+            photo_id = conn.execute(
+                "INSERT INTO photos (room_id, filename, width, height, created_at, total_objects, "
+                "new_items, object_counts) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (room_id, filename, width, height, now, len(detections), new_items,
+                 json.dumps(object_counts))
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO detections (photo_id, class_name, confidence, x, y, width, height, "
+                "detection_id, item_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(photo_id, names[class_index], confidence, x, y, w, h, detection_id, item_id)
+                 for class_index, confidence, x, y, w, h, detection_id, item_id in zip(
+                     detections.class_index.tolist(), detections.confidence.tolist(),
+                     detections.x.tolist(), detections.y.tolist(), detections.width.tolist(),
+                     detections.height.tolist(), detections.detection_id, item_ids)])
+            self._apply_counts(conn, property_id, room_id, new_counts, new_items, 1)
+        return photo_id
+
+    def delete_photo(self, photo_id):
+        """Remove a photo and subtract the items only it had seen from the aggregates"""
+        conn = self._connection()
+        with conn:
+            row = conn.execute(
+                "SELECT photos.room_id, rooms.property_id FROM photos "
+                "JOIN rooms ON rooms.id = photos.room_id WHERE photos.id = ?",
+                (photo_id,)).fetchone()
+            if row is None:
+                return False
+            item_ids = [item['item_id'] for item in conn.execute(
+                "SELECT item_id FROM detections WHERE photo_id = ? AND item_id IS NOT NULL",
+                (photo_id,))]
+            conn.executemany("UPDATE items SET sightings = sightings - 1 WHERE id = ?",
+                             [(item_id,) for item_id in item_ids])
+            # Items no other photo has seen disappear; detections stored before
+            # de-duplication (no item) each counted as one object
+            removed = conn.execute(
+                "SELECT class_name FROM detections WHERE photo_id = ? AND item_id IS NULL "
+                "UNION ALL SELECT items.class_name FROM items "
+                "JOIN detections ON detections.item_id = items.id "
+                "WHERE detections.photo_id = ? AND items.sightings <= 0",
+                (photo_id, photo_id)).fetchall()
+            removed_counts = {}
+            for item in removed:
+                removed_counts[item['class_name']] = removed_counts.get(item['class_name'], 0) + 1
+            self._apply_counts(conn, row['property_id'], row['room_id'],
+                               removed_counts, len(removed), -1)
+            conn.execute("DELETE FROM photos WHERE id = ?", (photo_id,))
+            conn.execute("DELETE FROM items WHERE room_id = ? AND sightings <= 0", (row['room_id'],))
+        return True
+
+    def _export_query(self, select, filters, order):
+        clauses = []
+        params = []
+        for column, key, op in (('photos.created_at', 'since', '>='), ('photos.created_at', 'until', '<'),
+                                ('properties.name', 'property', '='), ('rooms.name', 'room', '='),
+                                ('detections.confidence', 'min_confidence', '>=')):
+            if filters.get(key) is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(filters[key])
+        for key, op in (('classes', 'IN'), ('exclude_classes', 'NOT IN')):
+            if filters.get(key):
+                clauses.append(f"detections.class_name {op} ({','.join('?' * len(filters[key]))})")
+                params.extend(sorted(filters[key]))
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        return (f"SELECT {select} FROM detections "
+                "JOIN photos ON photos.id = detections.photo_id "
+                "JOIN rooms ON rooms.id = photos.room_id "
+                "JOIN properties ON properties.id = rooms.property_id "
+                f"{where}{order}"), params
+
+    @contextmanager
+    def export_snapshot(self):
+        """A connection holding one read transaction, for exports that run several queries
+
+        Every query on it sees the same WAL snapshot, so rows written while
+        the export streams never appear in one part and not another.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("BEGIN")
+            yield conn
+        finally:
+            conn.close()
+
+    def _iter_batches(self, sql, params, batch_size, conn=None):
+        # Without a snapshot connection, a separate connection gives the export
+        # its own WAL snapshot and keeps a long-running read off the request
+        # thread's connection
+        if conn is not None:
+            yield from self._fetch_batches(conn, sql, params, batch_size)
+            return
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield from self._fetch_batches(conn, sql, params, batch_size)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _fetch_batches(conn, sql, params, batch_size):
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+    def iter_export_rows(self, filters, batch_size=10000, conn=None):
+        """Yield batches of detection rows (tuples in EXPORT_COLUMNS order)
+
+        filters may contain since/until (epoch seconds), property, room,
+        classes, exclude_classes and min_confidence. Rows are streamed from
+        the database, so memory use does not grow with the export size.
+        conn is an export_snapshot() connection to read from, if any.
+        """
+        sql, params = self._export_query(
+            "detections.id, photos.id, properties.name, rooms.name, photos.filename, photos.width, "
+            "photos.height, photos.created_at, detections.class_name, detections.confidence, "
+            "detections.x, detections.y, detections.width, detections.height, "
+            "detections.detection_id, detections.item_id",
+            filters, "ORDER BY detections.id")
+        return self._iter_batches(sql, params, batch_size, conn)
+
+    def iter_export_csv_lines(self, filters, batch_size=10000):
+        """Yield batches of CSV lines (without newlines) in EXPORT_COLUMNS order
+
+        Lines are formatted by SQLite's printf, which is several times faster
+        than building them from Python rows with the csv module.
+        """
+        def quoted(column):
+            return f"'\"' || replace(COALESCE({column}, ''), '\"', '\"\"') || '\"'"
+        sql, params = self._export_query(
+            "printf('%d,%d,%s,%s,%s,%s,%s,%.3f,%s,%.4f,%.2f,%.2f,%.2f,%.2f,%s,%s', "
+            f"detections.id, photos.id, {quoted('properties.name')}, {quoted('rooms.name')}, "
+            f"{quoted('photos.filename')}, COALESCE(photos.width, ''), COALESCE(photos.height, ''), "
+            f"photos.created_at, {quoted('detections.class_name')}, detections.confidence, "
+            "detections.x, detections.y, detections.width, detections.height, "
+            f"{quoted('detections.detection_id')}, COALESCE(detections.item_id, ''))",
+            filters, "ORDER BY detections.id")
+        for rows in self._iter_batches(sql, params, batch_size):
+            yield [row[0] for row in rows]
+
+    def iter_export_photos(self, filters, batch_size=10000, conn=None):
+        """Yield batches of (photo_id, filename, width, height, created_at) with matching detections"""
+        sql, params = self._export_query(
+            "DISTINCT photos.id, photos.filename, photos.width, photos.height, photos.created_at",
+            filters, "ORDER BY photos.id")
+        return self._iter_batches(sql, params, batch_size, conn)
+
+    def export_classes(self, filters, conn=None):
+        sql, params = self._export_query("DISTINCT detections.class_name", filters,
+                                         "ORDER BY detections.class_name")
+        return [row[0] for row in (conn or self._connection()).execute(sql, params)]
+
+    def _counts_for(self, table, key, ids):
+        if not ids:
+            return {}
+        placeholders = ','.join('?' * len(ids))
+        rows = self._connection().execute(
+            f"SELECT {key}, class_name, count FROM {table} WHERE {key} IN ({placeholders}) "
+            f"ORDER BY count DESC, class_name", ids).fetchall()
+        counts = {i: {} for i in ids}
+        for row in rows:
+            counts[row[key]][row['class_name']] = row['count']
+        return counts
+
+    def list_properties(self, page, per_page):
+        conn = self._connection()
+        total = conn.execute("SELECT COUNT(*) FROM properties").fetchone()[0]
+        rows = conn.execute(
+            "SELECT id, name, room_count, photo_count, total_objects FROM properties "
+            "ORDER BY id LIMIT ? OFFSET ?", (per_page, (page - 1) * per_page)).fetchall()
+        counts = self._counts_for('property_counts', 'property_id', [row['id'] for row in rows])
+        items = [{
+            'name': row['name'],
+            'room_count': row['room_count'],
+            'photo_count': row['photo_count'],
+            'total_objects': row['total_objects'],
+            'object_counts': counts[row['id']]
+        } for row in rows]
+        return items, total
+
+    def get_property(self, property_name, page, per_page):
+        conn = self._connection()
+        prop = conn.execute(
+            "SELECT id, name, room_count, photo_count, total_objects FROM properties WHERE name = ?",
+            (property_name,)).fetchone()
+        if prop is None:
+            return None
+        rooms = conn.execute(
+            "SELECT id, name, photo_count, total_objects FROM rooms WHERE property_id = ? "
+            "ORDER BY id LIMIT ? OFFSET ?", (prop['id'], per_page, (page - 1) * per_page)).fetchall()
+        room_counts = self._counts_for('room_counts', 'room_id', [room['id'] for room in rooms])
+        return {
+            'name': prop['name'],
+            'room_count': prop['room_count'],
+            'photo_count': prop['photo_count'],
+            'total_objects': prop['total_objects'],
+            'object_counts': self._counts_for('property_counts', 'property_id', [prop['id']])[prop['id']],
+            'rooms': [{
+                'name': room['name'],
+                'photo_count': room['photo_count'],
+                'total_objects': room['total_objects'],
+                'object_counts': room_counts[room['id']]
+            } for room in rooms]
+        }
+
+    def get_room(self, property_name, room_name, page, per_page):
+        conn = self._connection()
+        room = conn.execute(
+            "SELECT rooms.id, rooms.name, rooms.photo_count, rooms.total_objects FROM rooms "
+            "JOIN properties ON properties.id = rooms.property_id "
+            "WHERE properties.name = ? AND rooms.name = ?", (property_name, room_name)).fetchone()
+        if room is None:
+            return None
+        photos = conn.execute(
+            "SELECT id, filename, width, height, created_at, total_objects, new_items, object_counts FROM photos "
+            "WHERE room_id = ? ORDER BY id LIMIT ? OFFSET ?",
+            (room['id'], per_page, (page - 1) * per_page)).fetchall()
+        return {
+            'property': property_name,
+            'name': room['name'],
+            'photo_count': room['photo_count'],
+            'total_objects': room['total_objects'],
+            'object_counts': self._counts_for('room_counts', 'room_id', [room['id']])[room['id']],
+            'photos': [{
+                'id': photo['id'],
+                'filename': photo['filename'],
+                'width': photo['width'],
+                'height': photo['height'],
+                'created_at': photo['created_at'],
+                'total_objects': photo['total_objects'],
+                'new_items': photo['new_items'],
+                'object_counts': json.loads(photo['object_counts'])
+            } for photo in photos]
+        }
+
+
+def _pagination():
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = min(MAX_PER_PAGE, max(1, request.args.get('per_page', DEFAULT_PER_PAGE, type=int)))
+    return page, per_page
+
+
+def _parse_attached_result(payload):
+    """(DetectionSet, image size or None) from an /upload result; ValueError if malformed"""
+    for i, detection in enumerate(payload['detections']):
+        if not isinstance(detection, dict):
+            raise ValueError(f"Detection {i} is not an object")
+        for field in ('class', 'detection_id'):
+            if not isinstance(detection.get(field, ''), str):
+                raise ValueError(f"Detection {i} has a non-string {field}")
+        for field in ('x', 'y', 'width', 'height', 'confidence', 'class_id'):
+            value = detection.get(field, 0)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"Detection {i} has a non-numeric {field}")
+    if payload.get('filename') is not None and not isinstance(payload['filename'], str):
+        raise ValueError("filename must be a string")
+    image_size = None
+    if payload.get('image_width') and payload.get('image_height'):
+        try:
+            image_size = (int(payload['image_width']), int(payload['image_height']))
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError("image_width and image_height must be integers")
+        if min(image_size) < 1:
+            raise ValueError("image_width and image_height must be positive")
+    return DetectionSet.from_dicts(payload['detections']), image_size
+
+
+def register_inventory_routes(app, store):
+    """Expose the inventory store under /inventory"""
+
+    @app.route('/inventory')
+    def list_inventory():
+        page, per_page = _pagination()
+        items, total = store.list_properties(page, per_page)
+        return jsonify({'page': page, 'per_page': per_page, 'total': total, 'properties': items})
+
+    @app.route('/inventory/<property_name>')
+    def property_inventory(property_name):
+        page, per_page = _pagination()
+        result = store.get_property(property_name, page, per_page)
+        if result is None:
+            return jsonify({'error': 'Property not found'}), 404
+        result.update({'page': page, 'per_page': per_page})
+        return jsonify(result)
+
+    @app.route('/inventory/<property_name>/<room_name>')
+    def room_inventory(property_name, room_name):
+        page, per_page = _pagination()
+        result = store.get_room(property_name, room_name, page, per_page)
+        if result is None:
+            return jsonify({'error': 'Room not found'}), 404
+        result.update({'page': page, 'per_page': per_page})
+        return jsonify(result)
+
+    @app.route('/inventory/<property_name>/<room_name>/photos', methods=['POST'])
+    def attach_photo(property_name, room_name):
+        # Attach an existing /upload result to a room
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get('detections'), list):
+            return jsonify({'error': 'Expected JSON with a detections list'}), 400
+        try:
+            detections, image_size = _parse_attached_result(payload)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        photo_id = store.add_photo(property_name, room_name, detections,
+                                   payload.get('filename'), image_size)
+        return jsonify({'success': True, 'photo_id': photo_id}), 201
+
+    @app.route('/inventory/photos/<int:photo_id>', methods=['DELETE'])
+    def delete_photo(photo_id):
+        if not store.delete_photo(photo_id):
+            return jsonify({'error': 'Photo not found'}), 404
+        return jsonify({'success': True})
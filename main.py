@@ -4,13 +4,17 @@ import cv2
 import os
 from collections import Counter
 from inference_sdk import InferenceHTTPClient
+from PIL import Image
+from detections import DetectionSet
+from postprocess import postprocess_detections
+from cassette import wrap_client
 
 def main():
     # Initialize Roboflow client
-    client = InferenceHTTPClient(
+    client = wrap_client(InferenceHTTPClient(
         api_url="https://serverless.roboflow.com",
         api_key="OCYzLwdUcqDtypAh0OYT"
-    )
+    ))
     
     # Use the local living room image
     image_path = "living-room.jpg"
@@ -46,17 +50,9 @@ def main():
         print("DETECTION RESULTS")
         print("="*50)
         
-        # Extract detections from the workflow result
-        # The workflow returns a list with detection data
-        detections = []
-        
-        if isinstance(result, list) and len(result) > 0:
-            # Get the first result which contains the predictions
-            first_result = result[0]
-            if 'predictions' in first_result and 'predictions' in first_result['predictions']:
-                detections = first_result['predictions']['predictions']
-            elif 'detections' in first_result:
-                detections = first_result['detections']
+        # Parse detections, then filter, clip and de-duplicate overlapping boxes
+        with Image.open(image_path) as img:
+            detections = postprocess_detections(DetectionSet.from_roboflow(result), img.size).to_dicts()
         
         if not detections:
             print("Raw result structure:")
@@ -124,14 +120,13 @@ def create_visualization(image_source, detections):
     try:
         # Handle both local files and URLs
         if image_source.startswith('http'):
-            # Download image from URL
-            import urllib.request
+            # Download image from URL (streamed, with size and time limits)
             import numpy as np
+            from remote_images import read_url
             
             print(f"Downloading image from URL...")
-            with urllib.request.urlopen(image_source) as response:
-                image_array = np.asarray(bytearray(response.read()), dtype=np.uint8)
-                image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+            image_array = np.frombuffer(read_url(image_source), dtype=np.uint8)
+            image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
         else:
             # Load local image file
             image = cv2.imread(image_source)
@@ -0,0 +1,201 @@
+import os
+import time
+import logging
+import threading
+import tracemalloc
+from collections import deque, namedtuple
+from imaging import JPEG_FORMATS
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Projected peak for one request above which the image is decoded at reduced size
+REQUEST_MEMORY_BUDGET = int(os.getenv("REQUEST_MEMORY_BUDGET_MB", "384")) * MB
+# Projected memory all in-flight requests may hold together (app.yaml gives 2 GB)
+INSTANCE_MEMORY_LIMIT = int(os.getenv("INSTANCE_MEMORY_LIMIT_MB", "1200")) * MB
+# Seconds a request waits for memory before getting a 503
+MEMORY_WAIT_TIMEOUT = float(os.getenv("MEMORY_WAIT_TIMEOUT", "20"))
+# Also record the traced Python/NumPy allocation peak per stage (slower)
+MEMORY_TRACEMALLOC = os.getenv("MEMORY_TRACEMALLOC", "0") == "1"
+MEMORY_RECORDS_KEEP = int(os.getenv("MEMORY_RECORDS_KEEP", "50"))
+
+# Full-size BGR arrays alive at once: the decoded image plus one working copy
+# (rotation, tile batch, or the crops being encoded)
+DECODED_COPIES = 2
+# Copies of the upload bytes: the file read back, its base64 string and the JSON body
+FILE_COPIES = 3
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class MemoryBudgetError(Exception):
+    """A request that does not fit in memory; 413 if it never will, 503 if busy"""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+MemoryPlan = namedtuple('MemoryPlan', 'projected_bytes max_side')
+
+
+def rss_bytes():
+    """Resident set size of this process, or 0 where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def peak_rss_bytes():
+    """Highest resident set size this process has reached"""
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return 0
+
+
+def projected_bytes(width, height, file_size):
+    """Rough peak memory of one request for an image decoded at width x height"""
+    return width * height * 3 * DECODED_COPIES + file_size * FILE_COPIES
+
+
+def plan_request(info, file_size, budget=REQUEST_MEMORY_BUDGET):
+    """Choose the decode size that keeps a request within the memory budget
+
+    Returns a MemoryPlan; max_side is None for full resolution, otherwise
+    the longest side to decode at (JPEG 1/2, 1/4 or 1/8 scale). Images that
+    do not fit even at 1/8, or non-JPEGs that do not fit at full size, raise
+    MemoryBudgetError.
+    """
+    projected = projected_bytes(info.width, info.height, file_size)
+    if projected <= budget:
+        return MemoryPlan(projected, None)
+    if info.format in JPEG_FORMATS:
+        longest = max(info.width, info.height)
+        for factor in (2, 4, 8):
+            reduced = projected_bytes(-(-info.width // factor), -(-info.height // factor), file_size)
+            if reduced <= budget:
+                return MemoryPlan(reduced, -(-longest // factor))
+    raise MemoryBudgetError(
+        f"Image needs about {projected // MB} MB to process; the limit is {budget // MB} MB", 413)
+
+
+class MemoryAccount:
+    """Per-request memory checkpoints: RSS change (and optionally traced peak) per stage
+
+    RSS is process-wide, so under concurrency a stage's delta includes
+    other requests' allocations; the traced peak has the same caveat.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.start_rss = self.last_rss = rss_bytes()
+        self.stages = []
+        self.plan = None
+        self.last_traced = 0
+        if MEMORY_TRACEMALLOC and tracemalloc.is_tracing():
+            self.last_traced = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+    def mark(self, stage):
+        """Close the stage that ends here"""
+        rss = rss_bytes()
+        record = {'stage': stage, 'rss_delta_bytes': rss - self.last_rss, 'rss_bytes': rss}
+        if MEMORY_TRACEMALLOC and tracemalloc.is_tracing():
+            # Peak traced allocations above what was live when the stage began
+            current, peak = tracemalloc.get_traced_memory()
+            record['traced_peak_bytes'] = peak - self.last_traced
+            self.last_traced = current
+            tracemalloc.reset_peak()
+        self.stages.append(record)
+        self.last_rss = rss
+
+    def summary(self):
+        return {
+            'duration_ms': (time.perf_counter() - self.started) * 1000,
+            'projected_bytes': self.plan.projected_bytes if self.plan else None,
+            'max_side': self.plan.max_side if self.plan else None,
+            'rss_start_bytes': self.start_rss,
+            'rss_max_bytes': max([self.start_rss] + [stage['rss_bytes'] for stage in self.stages]),
+            'stages': self.stages
+        }
+
+
+class _Reservation:
+    def __init__(self, monitor, nbytes):
+        self.monitor = monitor
+        self.nbytes = nbytes
+
+    def release(self):
+        if self.nbytes:
+            self.monitor._release(self.nbytes)
+            self.nbytes = 0
+
+
+class MemoryMonitor:
+    """Admits requests by projected memory and keeps recent per-request accounts
+
+    reserve() blocks while the reservations of in-flight requests plus the
+    new one would exceed the instance limit. A request larger than the whole
+    limit is admitted alone once nothing else holds memory.
+    """
+
+    def __init__(self, limit=INSTANCE_MEMORY_LIMIT, wait_timeout=MEMORY_WAIT_TIMEOUT):
+        self.limit = limit
+        self.wait_timeout = wait_timeout
+        self.reserved = 0
+        self.condition = threading.Condition()
+        self.records = deque(maxlen=MEMORY_RECORDS_KEEP)
+        self.counters = {'admitted': 0, 'waited': 0, 'rejected_busy': 0, 'rejected_size': 0,
+                         'downscaled': 0}
+        if MEMORY_TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def reserve(self, nbytes, timeout=None):
+        """Block until nbytes fit, for at most timeout seconds (default wait_timeout)"""
+        nbytes = min(nbytes, self.limit)
+        wait = self.wait_timeout if timeout is None else min(timeout, self.wait_timeout)
+        with self.condition:
+            if self.reserved + nbytes > self.limit:
+                self.counters['waited'] += 1
+                if not self.condition.wait_for(lambda: self.reserved + nbytes <= self.limit, wait):
+                    self.counters['rejected_busy'] += 1
+                    raise MemoryBudgetError("Server is busy with other large images, retry shortly", 503)
+            self.reserved += nbytes
+            self.counters['admitted'] += 1
+        return _Reservation(self, nbytes)
+
+    def _release(self, nbytes):
+        with self.condition:
+            self.reserved -= nbytes
+            self.condition.notify_all()
+
+    def record(self, account):
+        summary = account.summary()
+        with self.condition:
+            if account.plan is not None and account.plan.max_side is not None:
+                self.counters['downscaled'] += 1
+            self.records.append(summary)
+        logger.info("Request memory: " + ", ".join(
+            f"{stage['stage']} {stage['rss_delta_bytes'] / MB:+.1f} MB" for stage in summary['stages']))
+
+    def reject(self):
+        with self.condition:
+            self.counters['rejected_size'] += 1
+
+    def stats(self):
+        with self.condition:
+            counters = dict(self.counters)
+            counters.update({
+                'reserved_bytes': self.reserved,
+                'limit_bytes': self.limit,
+                'request_budget_bytes': REQUEST_MEMORY_BUDGET,
+                'rss_bytes': rss_bytes(),
+                'peak_rss_bytes': peak_rss_bytes(),
+                'recent_requests': list(self.records)[-10:]
+            })
+        return counters
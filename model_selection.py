@@ -0,0 +1,199 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque, namedtuple
+
+import numpy as np
+
+from ensemble import WORKFLOW_MODEL, load_class_maps, map_classes
+from deadline import DeadlineExceeded, DEADLINE_FALLBACK_MIN
+
+logger = logging.getLogger(__name__)
+
+# Models a request may be routed to, as name:quality pairs (quality 0-1, e.g.
+# measured precision); 'workflow' is the furniture workflow. Unset: no routing
+MODEL_CANDIDATES = os.getenv("MODEL_CANDIDATES", "")
+# Latency objective for the chosen model's p95, in milliseconds
+MODEL_LATENCY_SLO_MS = float(os.getenv("MODEL_LATENCY_SLO_MS", "4000"))
+# Models below this quality are never chosen
+MODEL_QUALITY_FLOOR = float(os.getenv("MODEL_QUALITY_FLOOR", "0.5"))
+# Models failing more often than this (EWMA) are treated as not meeting the SLO
+MODEL_MAX_ERROR_RATE = float(os.getenv("MODEL_MAX_ERROR_RATE", "0.2"))
+MODEL_EWMA_ALPHA = float(os.getenv("MODEL_EWMA_ALPHA", "0.2"))
+MODEL_STATS_WINDOW = int(os.getenv("MODEL_STATS_WINDOW", "200"))
+# A model not tried for this many seconds gets the next request, so its stats stay current
+MODEL_EXPLORE_INTERVAL = float(os.getenv("MODEL_EXPLORE_INTERVAL", "60"))
+# Share of requests sent to a random other model on top of that
+MODEL_EXPLORE_RATE = float(os.getenv("MODEL_EXPLORE_RATE", "0.02"))
+# Samples before a model's percentiles are trusted over its EWMA
+MODEL_MIN_SAMPLES = 5
+
+Candidate = namedtuple('Candidate', 'name quality class_map')
+
+
+def parse_candidates(spec=MODEL_CANDIDATES, class_maps=None):
+    """'workflow:0.9,coco/3:0.6' -> [Candidate, ...]; non-workflow models need a class map"""
+    class_maps = load_class_maps() if class_maps is None else class_maps
+    candidates = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, quality = item.rpartition(':')
+        if not name:
+            raise ValueError(f"Model candidate {item} needs a quality, e.g. {item}:0.8")
+        if name != WORKFLOW_MODEL and name not in class_maps:
+            raise ValueError(f"No class map for model candidate {name}")
+        candidates.append(Candidate(name, float(quality), class_maps.get(name)))
+    return candidates
+
+
+class ModelStats:
+    """Rolling latency and error statistics for one model"""
+
+    def __init__(self, window=MODEL_STATS_WINDOW, alpha=MODEL_EWMA_ALPHA):
+        self.alpha = alpha
+        self.latencies = deque(maxlen=window)
+        self.ewma_ms = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.last_used = 0.0
+
+    def observe(self, latency_ms, ok):
+        self.calls += 1
+        self.last_used = time.monotonic()
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if not ok:
+            self.errors += 1
+        # Failed calls still count towards latency: a timeout is as slow as it gets
+        self.latencies.append(latency_ms)
+        self.ewma_ms = latency_ms if self.ewma_ms is None else self.ewma_ms + self.alpha * (latency_ms - self.ewma_ms)
+
+    def percentile(self, q):
+        return float(np.percentile(self.latencies, q)) if self.latencies else None
+
+    def expected_ms(self):
+        """p95 once there are enough samples, the EWMA before that"""
+        if len(self.latencies) >= MODEL_MIN_SAMPLES:
+            return self.percentile(95)
+        return self.ewma_ms
+
+    def summary(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'error_rate': round(self.error_rate, 4),
+            'ewma_ms': self.ewma_ms,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'samples': len(self.latencies)
+        }
+
+
+class ModelSelector:
+    """Routes each request to the best model that currently meets the latency SLO
+
+    Among models at or above the quality floor, the highest-quality one
+    whose p95 latency is within the SLO and whose error rate is acceptable
+    wins; if none qualifies, the fastest of them. Models not tried for
+    MODEL_EXPLORE_INTERVAL seconds, plus a MODEL_EXPLORE_RATE share of
+    requests, are routed elsewhere to keep every model's stats current.
+    A failed call falls back to the next model in preference order.
+    """
+
+    def __init__(self, candidates, slo_ms=MODEL_LATENCY_SLO_MS, quality_floor=MODEL_QUALITY_FLOOR,
+                 explore_interval=MODEL_EXPLORE_INTERVAL, explore_rate=MODEL_EXPLORE_RATE):
+        self.candidates = [c for c in candidates if c.quality >= quality_floor]
+        if candidates and not self.candidates:
+            raise ValueError("No model candidate meets MODEL_QUALITY_FLOOR")
+        self.slo_ms = slo_ms
+        self.quality_floor = quality_floor
+        self.explore_interval = explore_interval
+        self.explore_rate = explore_rate
+        self.model_stats = {c.name: ModelStats() for c in self.candidates}
+        self.lock = threading.Lock()
+        self.decisions = {'slo': 0, 'best_effort': 0, 'explore': 0}
+        self.last_decision = None
+
+    @property
+    def enabled(self):
+        return bool(self.candidates)
+
+    def _meets_slo(self, candidate):
+        stats = self.model_stats[candidate.name]
+        expected = stats.expected_ms()
+        # Untried models are assumed to meet it until measured
+        return (expected is None or expected <= self.slo_ms) and stats.error_rate <= MODEL_MAX_ERROR_RATE
+
+    def _ranked(self):
+        """Candidates in preference order with the reason the first was chosen"""
+        meeting = sorted((c for c in self.candidates if self._meets_slo(c)), key=lambda c: -c.quality)
+        others = sorted((c for c in self.candidates if c not in meeting),
+                        key=lambda c: self.model_stats[c.name].expected_ms() or 0.0)
+        return meeting + others, ('slo' if meeting else 'best_effort')
+
+    def choose(self):
+        """Return (models in the order to try, reason)"""
+        with self.lock:
+            ranked, reason = self._ranked()
+            now = time.monotonic()
+            stale = [c for c in ranked[1:] if now - self.model_stats[c.name].last_used > self.explore_interval]
+            if stale or (len(ranked) > 1 and random.random() < self.explore_rate):
+                explored = stale[0] if stale else random.choice(ranked[1:])
+                # Mark it now so concurrent requests do not all explore at once
+                self.model_stats[explored.name].last_used = now
+                ranked = [explored] + [c for c in ranked if c is not explored]
+                reason = 'explore'
+            self.decisions[reason] += 1
+            self.last_decision = {'model': ranked[0].name, 'reason': reason, 'at': time.time()}
+        return ranked, reason
+
+    def record(self, candidate, latency_ms, ok):
+        with self.lock:
+            self.model_stats[candidate.name].observe(latency_ms, ok)
+
+    def run(self, call_model, deadline=None):
+        """Detect with the chosen model, falling back down the ranking on errors
+
+        call_model(candidate) returns a DetectionSet in the model's classes;
+        the result is mapped to furniture classes. With a deadline, the next
+        model is only tried if DEADLINE_FALLBACK_MIN seconds are left.
+        """
+        ranked, reason = self.choose()
+        error = None
+        for candidate in ranked:
+            if error is not None and deadline is not None and not deadline.allows(DEADLINE_FALLBACK_MIN):
+                deadline.skip('fallback')
+                raise DeadlineExceeded(f"No time left for another model after: {error}")
+            start = time.perf_counter()
+            try:
+                if deadline is not None:
+                    detections = deadline.call('inference', call_model, candidate)
+                else:
+                    detections = call_model(candidate)
+            except DeadlineExceeded:
+                self.record(candidate, (time.perf_counter() - start) * 1000, False)
+                raise
+            except Exception as e:
+                self.record(candidate, (time.perf_counter() - start) * 1000, False)
+                logger.warning(f"Model {candidate.name} failed: {e}")
+                error = e
+                continue
+            self.record(candidate, (time.perf_counter() - start) * 1000, True)
+            logger.info(f"Detected with {candidate.name} ({reason})")
+            return map_classes(detections, candidate.class_map)
+        raise error
+
+    def stats(self):
+        with self.lock:
+            ranked, reason = self._ranked()
+            return {
+                'current': {'model': ranked[0].name, 'reason': reason},
+                'last_decision': self.last_decision,
+                'decisions': dict(self.decisions),
+                'slo_ms': self.slo_ms,
+                'quality_floor': self.quality_floor,
+                'models': [dict(self.model_stats[c.name].summary(), name=c.name, quality=c.quality,
+                                meets_slo=self._meets_slo(c)) for c in self.candidates]
+            }
@@ -0,0 +1,172 @@
+import os
+import numpy as np
+
+# Post-processing defaults, shared by every entry point
+POSTPROCESS_METHOD = os.getenv("POSTPROCESS_METHOD", "nms")  # 'nms', 'wbf' or 'none'
+POSTPROCESS_IOU = float(os.getenv("POSTPROCESS_IOU", "0.5"))
+POSTPROCESS_MIN_CONFIDENCE = float(os.getenv("POSTPROCESS_MIN_CONFIDENCE", "0"))
+POSTPROCESS_MIN_AREA = float(os.getenv("POSTPROCESS_MIN_AREA", "0"))
+
+
+def box_areas(boxes):
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def _overlapping_pairs(boxes, scores, class_ids, iou_threshold):
+    """Find all same-class pairs with IoU above the threshold
+
+    Uses a sweep over boxes sorted by x1 so only pairs that overlap on the
+    x axis are ever compared, instead of building an N x N IoU matrix.
+    Returns (rank, higher, lower): the score rank of every box, and for each
+    overlapping pair the index of the higher- and lower-scoring box.
+    """
+    count = len(boxes)
+    rank = np.empty(count, dtype=np.int64)
+    rank[np.argsort(-scores, kind='stable')] = np.arange(count)
+
+    # Shift each class into its own x range so boxes of different classes
+    # never become candidates for each other
+    span = float(boxes[:, 2].max() - boxes[:, 0].min()) + 1.0
+    offsets = class_ids * span
+    by_x = np.argsort(boxes[:, 0] + offsets, kind='stable')
+    x1 = boxes[by_x, 0] + offsets[by_x]
+    x2 = boxes[by_x, 2] + offsets[by_x]
+    y1 = boxes[by_x, 1]
+    y2 = boxes[by_x, 3]
+    areas = (x2 - x1) * (y2 - y1)
+
+    # IoU > t implies the x overlap exceeds t * width of either box, so the
+    # candidates for box i are the boxes after it starting before x2 - t * w
+    ends = np.searchsorted(x1, x2 - iou_threshold * (x2 - x1), side='left')
+    counts = np.maximum(ends - np.arange(count) - 1, 0)
+    total = int(counts.sum())
+    if total == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return rank, empty, empty
+
+    first = np.repeat(np.arange(count), counts)
+    second = np.arange(1, total + 1) - np.repeat(np.cumsum(counts) - counts - np.arange(count), counts)
+
+    width = np.minimum(x2[first], x2[second]) - x1[second]
+    height = np.minimum(y2[first], y2[second]) - np.maximum(y1[first], y1[second])
+    intersection = width * np.clip(height, 0, None)
+    union = areas[first] + areas[second] - intersection
+    overlapping = intersection > iou_threshold * union
+
+    first = by_x[first[overlapping]]
+    second = by_x[second[overlapping]]
+    first_wins = rank[first] < rank[second]
+    higher = np.where(first_wins, first, second)
+    lower = np.where(first_wins, second, first)
+
+    # Process pairs in score order of the higher box (see the greedy loops)
+    order = np.argsort(rank[higher], kind='stable')
+    return rank, higher[order], lower[order]
+
+
+def class_aware_nms(boxes, scores, class_ids, iou_threshold=0.5):
+    """Greedy non-maximum suppression that only suppresses boxes of the same class
+
+    Returns the indices of the kept boxes, highest score first.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    rank, higher, lower = _overlapping_pairs(boxes, scores, class_ids, iou_threshold)
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    # Pairs arrive in score order of the higher box, so a box's own fate is
+    # settled before any pair in which it could suppress another box
+    for winner, loser in zip(higher.tolist(), lower.tolist()):
+        if not suppressed[winner]:
+            suppressed[loser] = True
+
+    keep = np.flatnonzero(~suppressed)
+    return keep[np.argsort(rank[keep], kind='stable')]
+
+
+def weighted_box_fusion(boxes, scores, class_ids, iou_threshold=0.55, normalizers=None):
+    """Fuse overlapping same-class boxes into their confidence-weighted average
+
+    Returns (fused_boxes, fused_scores, representative_indices), where each
+    representative is the highest-scoring member of its cluster. A fused
+    score is the mean of its cluster's scores or, given normalizers (one per
+    box), the cluster's score sum over its representative's normalizer,
+    capped at 1; ensembles use this to lower boxes only some models found.
+    """
+    if len(boxes) == 0:
+        return boxes, scores, np.empty(0, dtype=np.int64)
+
+    rank, higher, lower = _overlapping_pairs(boxes, scores, class_ids, iou_threshold)
+    cluster = np.arange(len(boxes))
+    assigned = np.zeros(len(boxes), dtype=bool)
+    # Same ordering argument as NMS: a box that was not absorbed by a
+    # stronger box heads its own cluster and absorbs its unassigned neighbours
+    for head, member in zip(higher.tolist(), lower.tolist()):
+        if not assigned[head] and not assigned[member]:
+            cluster[member] = head
+            assigned[member] = True
+
+    representatives = np.flatnonzero(~assigned)
+    representatives = representatives[np.argsort(rank[representatives], kind='stable')]
+    sorted_representatives = np.sort(representatives)
+    labels = np.searchsorted(sorted_representatives, cluster)
+    positions = np.searchsorted(sorted_representatives, representatives)
+    clusters = len(representatives)
+
+    weights = scores.astype(np.float64)
+    weight_sums = np.bincount(labels, weights=weights, minlength=clusters)
+    fused = np.stack([np.bincount(labels, weights=boxes[:, k] * weights, minlength=clusters)
+                      for k in range(4)], axis=1) / weight_sums[:, None]
+    if normalizers is None:
+        fused_scores = weight_sums / np.bincount(labels, minlength=clusters)
+    else:
+        fused_scores = np.minimum(weight_sums / normalizers[sorted_representatives], 1.0)
+    # Reorder from sorted-representative order to score order
+    return (fused[positions], fused_scores[positions],
+            representatives)
+
+
+def postprocess_detections(detections, image_size=None, method=POSTPROCESS_METHOD,
+                           iou_threshold=POSTPROCESS_IOU, min_confidence=POSTPROCESS_MIN_CONFIDENCE,
+                           min_area=POSTPROCESS_MIN_AREA):
+    """Filter, clip and de-duplicate a DetectionSet in one vectorized pass
+
+    image_size is (width, height); when given, boxes are clipped to the image
+    and boxes left with no area are dropped. method is 'nms', 'wbf' or 'none'.
+    Returns a new DetectionSet, highest confidence first.
+    """
+    if len(detections) == 0:
+        return detections
+
+    boxes = detections.boxes_xyxy()
+    scores = detections.confidence
+    clipped = np.zeros(len(detections), dtype=bool)
+    if image_size is not None:
+        width, height = image_size
+        unclipped = boxes.copy()
+        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width)
+        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height)
+        clipped = np.any(boxes != unclipped, axis=1)
+
+    areas = box_areas(boxes)
+    mask = (scores >= min_confidence) & (areas > 0) & (areas >= min_area)
+    indices = np.flatnonzero(mask)
+    if indices.size == 0:
+        return detections.take(indices)
+
+    kept_boxes = boxes[indices]
+    kept_scores = scores[indices]
+    kept_classes = detections.class_index[indices]
+
+    if method == 'wbf':
+        fused_boxes, fused_scores, representatives = weighted_box_fusion(
+            kept_boxes, kept_scores, kept_classes, iou_threshold)
+        return detections.take(indices[representatives]).with_boxes_xyxy(fused_boxes, fused_scores)
+
+    if method == 'nms':
+        order = class_aware_nms(kept_boxes, kept_scores, kept_classes, iou_threshold)
+    else:
+        order = np.argsort(-kept_scores, kind='stable')
+    # Boxes that were not clipped keep their original values
+    rows = indices[order]
+    return detections.take(rows).with_boxes_xyxy(kept_boxes[order], changed=clipped[rows])
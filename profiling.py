@@ -0,0 +1,262 @@
+"""Opt-in cProfile + tracemalloc profiling of upload requests
+
+cProfile only sees the request thread: work handed to other threads (tiled
+inference, ensemble members, Deadline.call and the final pass of a
+progressive upload) shows up as time spent waiting on a future, and the
+body of a streamed response runs after the view returns and is not
+profiled at all. cpu_ms is likewise the request thread's CPU time.
+tracemalloc is process-wide, so allocations include every thread's.
+"""
+import os
+import io
+import hmac
+import json
+import time
+import uuid
+import random
+import marshal
+import pstats
+import cProfile
+import logging
+import functools
+import threading
+import tracemalloc
+from collections import deque
+from flask import request, jsonify, send_file
+
+logger = logging.getLogger(__name__)
+
+# Profiling is opt-in: with no token and no sampling rate the decorator is a no-op
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+# 'wall' or 'cpu' - clock used for the per-function timings
+PROFILE_CLOCK = os.getenv("PROFILE_CLOCK", "wall")
+
+# The token is only accepted as a header so it never lands in access logs
+PROFILE_HEADER = 'X-Profile-Token'
+
+TREE_MAX_DEPTH = 12
+TREE_MIN_FRACTION = 0.01
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 15
+
+_profiles = deque(maxlen=PROFILE_KEEP)
+_profiles_lock = threading.Lock()
+# tracemalloc is process-wide, so only one request is profiled at a time
+_active_lock = threading.Lock()
+
+
+def profiling_enabled():
+    return bool(PROFILE_ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+def _token_matches(value):
+    # compare_digest rejects non-ASCII str, so compare the UTF-8 bytes
+    return (bool(PROFILE_ADMIN_TOKEN) and bool(value)
+            and hmac.compare_digest(value.encode('utf-8'), PROFILE_ADMIN_TOKEN.encode('utf-8')))
+
+
+def _requested_by_admin():
+    return _token_matches(request.headers.get(PROFILE_HEADER))
+
+
+def _should_profile():
+    if PROFILE_ADMIN_TOKEN and _requested_by_admin():
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _func_name(func):
+    filename, lineno, name = func
+    if filename == '~':
+        return name
+    return f"{os.path.basename(filename)}:{lineno}({name})"
+
+
+def _function_table(stats):
+    """Flatten pstats into a list of per-function timings sorted by cumulative time"""
+    rows = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        rows.append({
+            'function': _func_name(func),
+            'calls': nc,
+            'primitive_calls': cc,
+            'self_ms': tt * 1000,
+            'cumulative_ms': ct * 1000,
+        })
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:TOP_FUNCTIONS]
+
+
+def _call_tree(stats, root_name):
+    """Build a call tree from pstats caller edges, rooted at the profiled view"""
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            # edge is (cc, nc, tt, ct) for this caller -> func pair
+            callees.setdefault(caller, []).append((func, edge))
+
+    roots = [func for func in stats.stats if func[2] == root_name]
+    if not roots:
+        return None
+    root = roots[0]
+    total = stats.stats[root][3] or 1e-9
+
+    def build(func, cumulative, depth, seen):
+        node = {
+            'function': _func_name(func),
+            'cumulative_ms': cumulative * 1000,
+            'children': [],
+        }
+        if depth >= TREE_MAX_DEPTH or func in seen:
+            return node
+        children = sorted(callees.get(func, []), key=lambda item: item[1][3], reverse=True)
+        for child, edge in children:
+            if edge[3] / total < TREE_MIN_FRACTION:
+                continue
+            node['children'].append(build(child, edge[3], depth + 1, seen | {func}))
+        return node
+
+    return build(root, stats.stats[root][3], 0, frozenset())
+
+
+def _top_allocations(snapshot):
+    allocations = []
+    for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+        frame = stat.traceback[0]
+        allocations.append({
+            'location': f"{os.path.basename(frame.filename)}:{frame.lineno}",
+            'size_bytes': stat.size,
+            'count': stat.count,
+        })
+    return allocations
+
+
+def _store_profile(record, raw_stats):
+    with _profiles_lock:
+        _profiles.append((record, raw_stats))
+    if PROFILE_DIR:
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(os.path.join(PROFILE_DIR, f"{record['id']}.json"), 'w') as f:
+                json.dump(record, f, indent=2)
+            with open(os.path.join(PROFILE_DIR, f"{record['id']}.prof"), 'wb') as f:
+                f.write(raw_stats)
+        except OSError as e:
+            logger.warning(f"Failed to write profile {record['id']}: {e}")
+
+
+def _run_profiled(view, args, kwargs):
+    timer = time.thread_time if PROFILE_CLOCK == 'cpu' else time.perf_counter
+    profiler = cProfile.Profile(timer)
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    profiler.enable()
+    try:
+        return view(*args, **kwargs)
+    finally:
+        profiler.disable()
+        wall_ms = (time.perf_counter() - wall_start) * 1000
+        cpu_ms = (time.thread_time() - cpu_start) * 1000
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+
+        stats = pstats.Stats(profiler)
+        record = {
+            'id': uuid.uuid4().hex,
+            'timestamp': time.time(),
+            'path': request.path,
+            'content_length': request.content_length,
+            'clock': PROFILE_CLOCK,
+            'wall_ms': wall_ms,
+            'cpu_ms': cpu_ms,
+            'peak_alloc_bytes': peak,
+            'top_allocations': _top_allocations(snapshot),
+            'functions': _function_table(stats),
+            'call_tree': _call_tree(stats, view.__name__),
+        }
+        _store_profile(record, marshal.dumps(stats.stats))
+        logger.info(f"Profiled {request.path}: {wall_ms:.1f} ms wall, "
+                    f"{cpu_ms:.1f} ms CPU, peak {peak / 1024 / 1024:.1f} MB (profile {record['id']})")
+
+
+def profile_upload(view):
+    """Wrap a view in cProfile + tracemalloc when profiling is configured"""
+    if not profiling_enabled():
+        return view
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _should_profile():
+            return view(*args, **kwargs)
+        if not _active_lock.acquire(blocking=False):
+            # Another request is already being profiled
+            return view(*args, **kwargs)
+        try:
+            return _run_profiled(view, args, kwargs)
+        finally:
+            _active_lock.release()
+
+    return wrapper
+
+
+def _find_profile(profile_id):
+    with _profiles_lock:
+        for record, raw_stats in _profiles:
+            if record['id'] == profile_id:
+                return record, raw_stats
+    if PROFILE_DIR and all(c in '0123456789abcdef' for c in profile_id):
+        json_path = os.path.join(PROFILE_DIR, f"{profile_id}.json")
+        prof_path = os.path.join(PROFILE_DIR, f"{profile_id}.prof")
+        if os.path.exists(json_path) and os.path.exists(prof_path):
+            with open(json_path) as f:
+                record = json.load(f)
+            with open(prof_path, 'rb') as f:
+                return record, f.read()
+    return None, None
+
+
+def register_profiling_routes(app):
+    """Expose stored profiles under /admin/profiles (admin token required)"""
+    if not PROFILE_ADMIN_TOKEN:
+        return
+
+    def authorized():
+        return _requested_by_admin()
+
+    @app.route('/admin/profiles')
+    def list_profiles():
+        if not authorized():
+            return jsonify({'error': 'Forbidden'}), 403
+        with _profiles_lock:
+            summaries = [{
+                'id': record['id'],
+                'timestamp': record['timestamp'],
+                'path': record['path'],
+                'wall_ms': record['wall_ms'],
+                'cpu_ms': record['cpu_ms'],
+                'peak_alloc_bytes': record['peak_alloc_bytes'],
+            } for record, _ in reversed(_profiles)]
+        return jsonify({'profiles': summaries})
+
+    @app.route('/admin/profiles/<profile_id>')
+    def get_profile(profile_id):
+        if not authorized():
+            return jsonify({'error': 'Forbidden'}), 403
+        record, raw_stats = _find_profile(profile_id)
+        if record is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        if request.args.get('format') == 'pstats':
+            # Loadable with pstats.Stats(path) or snakeviz
+            return send_file(io.BytesIO(raw_stats), mimetype='application/octet-stream',
+                             as_attachment=True, download_name=f"{profile_id}.prof")
+        return jsonify(record)
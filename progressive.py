@@ -0,0 +1,36 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import copy_current_request_context
+
+from remote_images import result_line
+
+logger = logging.getLogger(__name__)
+
+# Longest side of the image the preview pass detects on (0 disables progressive uploads)
+PROGRESSIVE_PREVIEW_SIDE = int(os.getenv("PROGRESSIVE_PREVIEW_SIDE", "512"))
+# Model for the preview pass, as in ENSEMBLE_MODELS (e.g. coco/3); unset: the workflow
+PROGRESSIVE_PREVIEW_MODEL = os.getenv("PROGRESSIVE_PREVIEW_MODEL", "")
+# Longest the preview may take; the full pass runs alongside it regardless
+PROGRESSIVE_PREVIEW_TIMEOUT = float(os.getenv("PROGRESSIVE_PREVIEW_TIMEOUT", "5"))
+
+
+def stream_passes(preview, full):
+    """Yield the preview pass's line as soon as it is ready, then the full pass's
+
+    full() runs on a worker thread from the start, so the preview adds
+    nothing to the time to the final result. preview() returns a response,
+    or None to send no preview; it is also dropped when the full pass
+    finished first. full() runs in a copy of the current request context.
+    """
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        final = pool.submit(copy_current_request_context(full))
+        try:
+            response = preview()
+        except Exception as e:
+            logger.warning(f"Preview pass failed: {e}")
+            response = None
+        if response is not None and not final.done():
+            yield result_line({'pass': 'preview'}, response)
+        yield result_line({'pass': 'final'}, final.result())
@@ -0,0 +1,359 @@
+import io
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import logging
+import ipaddress
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urljoin
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from flask import request, jsonify, make_response, Response, stream_with_context
+from werkzeug.utils import secure_filename
+from deadline import Deadline, request_deadline
+
+logger = logging.getLogger(__name__)
+
+# Download limits for images fetched by URL
+REMOTE_IMAGE_MAX_BYTES = int(os.getenv("REMOTE_IMAGE_MAX_BYTES", str(32 * 1024 * 1024)))
+REMOTE_IMAGE_TIMEOUT = float(os.getenv("REMOTE_IMAGE_TIMEOUT", "10"))  # per connect/read
+REMOTE_IMAGE_DEADLINE = float(os.getenv("REMOTE_IMAGE_DEADLINE", "30"))  # whole download
+REMOTE_FETCH_WORKERS = int(os.getenv("REMOTE_FETCH_WORKERS", "4"))
+REMOTE_BATCH_MAX = int(os.getenv("REMOTE_BATCH_MAX", "50"))
+# Downloaded files kept for revalidation with ETag / Last-Modified (0 disables)
+URL_CACHE_MAX_BYTES = int(os.getenv("URL_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Allow URLs that resolve to loopback/private addresses (off: blocks requests to internal services)
+REMOTE_ALLOW_PRIVATE = os.getenv("REMOTE_ALLOW_PRIVATE", "0") == "1"
+MAX_REDIRECTS = 5
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+
+
+class RemoteImageError(Exception):
+    """A URL that could not be fetched; carries the HTTP status to report"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def check_url(url):
+    """Reject non-HTTP URLs and malformed hosts or ports
+
+    Private addresses are refused when connecting (see remote_session), so
+    the address checked is the one connected to.
+    """
+    try:
+        parts = urlsplit(url)
+        parts.port
+    except ValueError:
+        raise RemoteImageError(f"Invalid URL: {url}")
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise RemoteImageError(f"Not an http(s) URL: {url}")
+
+
+def public_addresses(host, port):
+    """Resolve host, raising RemoteImageError unless every address is public"""
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise RemoteImageError(f"Cannot resolve host: {host}", 502)
+    addresses = [info[4][0] for info in infos]
+    for address in addresses:
+        if not ipaddress.ip_address(address.split('%')[0]).is_global:
+            raise RemoteImageError(f"URL resolves to a non-public address: {host}")
+    return addresses
+
+
+class _PinnedConnectionMixin:
+    # Resolve once, check, and connect to that address: a DNS answer that
+    # changes after the check (rebinding) never reaches an internal host.
+    # TLS still uses the host name for SNI and certificate checks.
+    def _new_conn(self):
+        host = self._dns_host
+        self._dns_host = public_addresses(host, self.port)[0]
+        try:
+            return super()._new_conn()
+        finally:
+            self._dns_host = host
+
+
+class _PinnedHTTPConnection(_PinnedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _PinnedHTTPSConnection(_PinnedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _PinnedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _PinnedHTTPConnection
+
+
+class _PinnedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _PinnedHTTPSConnection
+
+
+class _PublicAddressAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _PinnedHTTPConnectionPool,
+                                                   'https': _PinnedHTTPSConnectionPool}
+
+
+def remote_session(pool_maxsize=REMOTE_FETCH_WORKERS):
+    """A session for fetching user-supplied URLs
+
+    Unless REMOTE_ALLOW_PRIVATE is set, every connection is checked and
+    pinned to a public address.
+    """
+    session = requests.Session()
+    adapter_cls = HTTPAdapter if REMOTE_ALLOW_PRIVATE else _PublicAddressAdapter
+    adapter = adapter_cls(pool_connections=16, pool_maxsize=max(pool_maxsize, 1))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _open(session, url, headers):
+    """GET with redirects followed by hand, so every hop is checked"""
+    for _ in range(MAX_REDIRECTS + 1):
+        check_url(url)
+        response = session.get(url, headers=headers, stream=True, allow_redirects=False,
+                               timeout=(REMOTE_IMAGE_TIMEOUT, REMOTE_IMAGE_TIMEOUT))
+        if response.is_redirect:
+            response.close()
+            url = urljoin(url, response.headers['Location'])
+            continue
+        return response
+    raise RemoteImageError("Too many redirects", 502)
+
+
+def _download(response, out, hasher, deadline):
+    """Stream a response body to out within the size limit and deadline"""
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and int(length) > REMOTE_IMAGE_MAX_BYTES:
+        raise RemoteImageError(f"Image is larger than {REMOTE_IMAGE_MAX_BYTES} bytes", 413)
+    received = 0
+    for block in response.iter_content(DOWNLOAD_BLOCK_SIZE):
+        received += len(block)
+        if received > REMOTE_IMAGE_MAX_BYTES:
+            raise RemoteImageError(f"Image is larger than {REMOTE_IMAGE_MAX_BYTES} bytes", 413)
+        if time.monotonic() > deadline:
+            raise RemoteImageError("Download took too long", 504)
+        out.write(block)
+        hasher.update(block)
+    return received
+
+
+class RemoteImageFetcher:
+    """Downloads images over a pooled session, revalidating repeats by ETag/Last-Modified
+
+    Files served with validators are kept (hard-linked) in cache_folder,
+    least recently used first out once URL_CACHE_MAX_BYTES is exceeded. A
+    304 reuses the kept file and its SHA-256, which the detection cache is
+    keyed on, so an unchanged image costs one conditional request.
+    """
+
+    def __init__(self, cache_folder, max_cache_bytes=URL_CACHE_MAX_BYTES, workers=REMOTE_FETCH_WORKERS):
+        self.cache_folder = cache_folder
+        os.makedirs(cache_folder, exist_ok=True)
+        # Files left by a previous process have no validators to go with them
+        for name in os.listdir(cache_folder):
+            os.remove(os.path.join(cache_folder, name))
+        self.max_cache_bytes = max_cache_bytes
+        self.session = remote_session(workers)
+        self.entries = OrderedDict()
+        self.cache_bytes = 0
+        self.lock = threading.Lock()
+        self.counters = {'downloads': 0, 'revalidated': 0, 'bytes_downloaded': 0}
+
+    def fetch(self, url, destination, budget=None):
+        """Save the image at url to destination; returns (sha256, revalidated)
+
+        budget caps the download time below REMOTE_IMAGE_DEADLINE.
+        """
+        deadline = time.monotonic() + min(REMOTE_IMAGE_DEADLINE, budget or REMOTE_IMAGE_DEADLINE)
+        with self.lock:
+            entry = self.entries.get(url)
+        if entry is not None and not os.path.exists(entry['path']):
+            entry = None
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            response = _open(self.session, url, headers)
+        except requests.RequestException as e:
+            raise RemoteImageError(f"Download failed: {e}", 502)
+        with response:
+            if response.status_code == 304 and entry is not None:
+                try:
+                    os.link(entry['path'], destination)
+                except OSError as e:
+                    raise RemoteImageError(f"Cached copy unavailable: {e}", 502)
+                with self.lock:
+                    if url in self.entries:
+                        self.entries.move_to_end(url)
+                    self.counters['revalidated'] += 1
+                return entry['digest'], True
+            if response.status_code != 200:
+                raise RemoteImageError(f"Download failed: HTTP {response.status_code}", 502)
+            hasher = hashlib.sha256()
+            try:
+                with open(destination, 'wb') as out:
+                    size = _download(response, out, hasher, deadline)
+            except requests.RequestException as e:
+                os.remove(destination)
+                raise RemoteImageError(f"Download failed: {e}", 502)
+            except RemoteImageError:
+                os.remove(destination)
+                raise
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+        digest = hasher.hexdigest()
+        with self.lock:
+            self.counters['downloads'] += 1
+            self.counters['bytes_downloaded'] += size
+        if (etag or last_modified) and size <= self.max_cache_bytes:
+            self._remember(url, destination, size, digest, etag, last_modified)
+        return digest, False
+
+    def _remember(self, url, path, size, digest, etag, last_modified):
+        cache_path = os.path.join(self.cache_folder, uuid.uuid4().hex)
+        try:
+            os.link(path, cache_path)
+        except OSError:
+            return
+        with self.lock:
+            previous = self.entries.pop(url, None)
+            if previous is not None:
+                self._drop(previous)
+            self.entries[url] = {'path': cache_path, 'size': size, 'digest': digest,
+                                 'etag': etag, 'last_modified': last_modified}
+            self.cache_bytes += size
+            while self.cache_bytes > self.max_cache_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self._drop(evicted)
+
+    def _drop(self, entry):
+        self.cache_bytes -= entry['size']
+        try:
+            os.remove(entry['path'])
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters.update({'entries': len(self.entries), 'cache_bytes': self.cache_bytes})
+        return counters
+
+
+def read_url(url):
+    """Fetch an image URL into memory with the same limits (for the CLI)"""
+    with remote_session(1) as session:
+        response = _open(session, url, {})
+        with response:
+            if response.status_code != 200:
+                raise RemoteImageError(f"Download failed: HTTP {response.status_code}", 502)
+            out = io.BytesIO()
+            _download(response, out, hashlib.sha256(), time.monotonic() + REMOTE_IMAGE_DEADLINE)
+    return out.getvalue()
+
+
+def result_line(fields, result):
+    """One NDJSON line: fields plus the status and body of a view's return value
+
+    result is anything a view may return (a response, or a tuple with a
+    status and headers); its JSON body is embedded without re-encoding.
+    """
+    response = make_response(result)
+    prefix = ''.join(f'{json.dumps(key)}:{json.dumps(value)},' for key, value in fields.items())
+    return (b'{' + prefix.encode('utf-8') + b'"status":' + str(response.status_code).encode('utf-8')
+            + b',"result":' + response.get_data().strip() + b'}\n')
+
+
+def _local_name(url):
+    name = secure_filename(os.path.basename(urlsplit(url).path)) or 'image'
+    return f"{uuid.uuid4().hex[:8]}_{name}"
+
+
+def register_remote_image_routes(app, fetcher, upload_folder, process_upload):
+    """Expose /detect?url=... for one image and a batch mode that streams NDJSON
+
+    process_upload(filepath, filename, values, digest, deadline) is the
+    /upload pipeline. Batch downloads run on a pool while earlier images are
+    in inference; each result line is written as soon as it is ready. A
+    single image shares the request's deadline with its download; in a
+    batch each image gets a budget of its own.
+    """
+
+    def fetch_one(url, budget=None):
+        filepath = os.path.join(upload_folder, _local_name(url))
+        digest, revalidated = fetcher.fetch(url, filepath, budget)
+        logger.info(f"Fetched {url} ({'not modified' if revalidated else 'downloaded'})")
+        return filepath, digest
+
+    def detect_one(url, fetch, values, deadline):
+        try:
+            filepath, digest = fetch()
+        except RemoteImageError as e:
+            return jsonify({'error': str(e), 'url': url}), e.status
+        return process_upload(filepath, url, values, digest, deadline)
+
+    @app.route('/detect', methods=['GET', 'POST'])
+    def detect_urls():
+        body = request.get_json(silent=True)
+        values = dict(request.values.items())
+        if isinstance(body, dict):
+            values.update({key: value for key, value in body.items() if key not in ('url', 'urls')})
+            urls = body.get('urls') or ([body['url']] if body.get('url') else [])
+            batch = 'urls' in body
+        else:
+            urls = request.values.getlist('urls') or request.values.getlist('url')
+            batch = 'urls' in request.values
+        if not urls or not all(isinstance(url, str) for url in urls):
+            return jsonify({'error': 'Pass url=... or a JSON body with "urls"'}), 400
+        if len(urls) > REMOTE_BATCH_MAX:
+            return jsonify({'error': f'At most {REMOTE_BATCH_MAX} URLs per request'}), 400
+        deadline = request_deadline()
+        if not batch and len(urls) == 1:
+            return detect_one(urls[0], lambda: fetch_one(urls[0], deadline.remaining()), values, deadline)
+        return Response(stream_with_context(generate(urls, values, deadline.seconds)),
+                        mimetype='application/x-ndjson')
+
+    def generate(urls, values, budget):
+        # Keep a few downloads ahead of inference; each one waits on disk
+        pool = ThreadPoolExecutor(max_workers=REMOTE_FETCH_WORKERS)
+        pending = deque()
+        queued = iter(urls)
+        try:
+            for url in queued:
+                pending.append((url, pool.submit(fetch_one, url)))
+                if len(pending) < 2 * REMOTE_FETCH_WORKERS:
+                    continue
+                yield _result_line(*pending.popleft(), values, budget)
+            while pending:
+                yield _result_line(*pending.popleft(), values, budget)
+        finally:
+            # The client went away: drop queued downloads and delete finished ones
+            for _, future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+            for _, future in pending:
+                if not future.cancelled() and future.exception() is None:
+                    filepath = future.result()[0]
+                    if os.path.exists(filepath):
+                        os.remove(filepath)
+
+    def _result_line(url, future, values, budget):
+        return result_line({'url': url}, detect_one(url, future.result, values, Deadline(budget)))
@@ -0,0 +1,149 @@
+import os
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Files in the scratch folders older than this are deleted by the janitor
+SCRATCH_MAX_AGE = int(os.getenv("SCRATCH_MAX_AGE", "3600"))
+# Oldest files go first once the scratch folders hold more than this
+SCRATCH_MAX_BYTES = int(os.getenv("SCRATCH_MAX_MB", "512")) * 1024 * 1024
+SCRATCH_SWEEP_INTERVAL = int(os.getenv("SCRATCH_SWEEP_INTERVAL", "60"))
+# Files younger than this may belong to a request in flight and are never deleted
+SCRATCH_GRACE_PERIOD = int(os.getenv("SCRATCH_GRACE_PERIOD", "300"))
+
+REQUEST_DIR_PREFIX = 'req-'
+
+
+class ScratchSpace:
+    """Bounded scratch space: per-request directories plus a background janitor
+
+    The janitor deletes files older than max_age and, while the folders hold
+    more than max_bytes, the oldest remaining files past a grace period.
+    Directories in use by a request and the skipped folders (which manage
+    their own lifetime) are left alone, but their bytes still count as in
+    use. On Cloud Run /tmp is
+    memory, so this is memory the instance cannot use for requests.
+    """
+
+    def __init__(self, folders, max_age=SCRATCH_MAX_AGE, max_bytes=SCRATCH_MAX_BYTES, skip=(),
+                 on_sweep=None):
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.skip = {os.path.abspath(folder) for folder in skip}
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.on_sweep = on_sweep
+        self.active = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.counters = {'sweeps': 0, 'files_deleted': 0, 'bytes_deleted': 0}
+        self.usage = {'bytes_in_use': 0, 'files': 0, 'last_sweep': None}
+        for folder in self.folders:
+            os.makedirs(folder, exist_ok=True)
+
+    @contextmanager
+    def request_dir(self):
+        """A directory for one request's files, removed with everything in it on exit"""
+        path = tempfile.mkdtemp(prefix=REQUEST_DIR_PREFIX, dir=self.folders[0])
+        with self.lock:
+            self.active.add(path)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            with self.lock:
+                self.active.discard(path)
+
+    def _scan(self):
+        """Return (deletable files as (mtime, size, path), bytes in use, file count)"""
+        with self.lock:
+            protected = self.skip | self.active
+        files = []
+        total = count = 0
+        for folder in self.folders:
+            for directory, subdirs, filenames in os.walk(folder):
+                keep = directory in protected or any(directory.startswith(path + os.sep) for path in protected)
+                for name in filenames:
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    total += stat.st_size
+                    count += 1
+                    if not keep:
+                        files.append((stat.st_mtime, stat.st_size, path))
+        return files, total, count
+
+    def _delete(self, path, size):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        self.counters['files_deleted'] += 1
+        self.counters['bytes_deleted'] += size
+        return True
+
+    def _remove_empty_dirs(self):
+        with self.lock:
+            protected = self.skip | self.active
+        for folder in self.folders:
+            for directory, subdirs, filenames in os.walk(folder, topdown=False):
+                if directory == folder or directory in protected or subdirs or filenames:
+                    continue
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+
+    def sweep(self):
+        """Delete expired files, then the oldest ones until under the size limit"""
+        if self.on_sweep is not None:
+            try:
+                self.on_sweep()
+            except Exception as e:
+                logger.warning(f"Scratch sweep hook failed: {e}")
+        files, total, count = self._scan()
+        now = time.time()
+        files.sort()
+        deleted = 0
+        for mtime, size, path in files:
+            if mtime >= now - self.max_age and total - deleted <= self.max_bytes:
+                break
+            if mtime >= now - SCRATCH_GRACE_PERIOD:
+                break
+            if self._delete(path, size):
+                deleted += size
+                count -= 1
+        self._remove_empty_dirs()
+        with self.lock:
+            self.counters['sweeps'] += 1
+            self.usage = {'bytes_in_use': total - deleted, 'files': count, 'last_sweep': time.time()}
+        if deleted:
+            logger.info(f"Scratch janitor freed {deleted / 1024 / 1024:.1f} MB")
+
+    def start(self, interval=SCRATCH_SWEEP_INTERVAL):
+        """Sweep once now, for files a previous process left behind, then periodically"""
+        self.sweep()
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.warning(f"Scratch sweep failed: {e}")
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters, **self.usage)
+            stats.update({'active_requests': len(self.active), 'max_bytes': self.max_bytes,
+                          'max_age': self.max_age})
+        return stats
@@ -0,0 +1,116 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from detections import DetectionSet
+from postprocess import class_aware_nms
+from deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# Tiled inference settings
+TILE_SIZE = int(os.getenv("TILE_SIZE", "1024"))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))
+TILE_CONCURRENCY = int(os.getenv("TILE_CONCURRENCY", "4"))
+TILE_NMS_IOU = float(os.getenv("TILE_NMS_IOU", "0.5"))
+# Also run the whole image so objects larger than a tile are still found
+TILE_INCLUDE_FULL_IMAGE = os.getenv("TILE_INCLUDE_FULL_IMAGE", "1") == "1"
+# 'off', 'on' or 'auto' (tile only images larger than TILE_AUTO_MIN_SIDE)
+TILED_INFERENCE = os.getenv("TILED_INFERENCE", "off")
+TILE_AUTO_MIN_SIDE = int(os.getenv("TILE_AUTO_MIN_SIDE", str(TILE_SIZE * 2)))
+
+
+def _tiling_mode(requested):
+    if requested in ('1', 'true'):
+        return 'on'
+    if requested in ('0', 'false'):
+        return 'off'
+    return requested if requested in ('on', 'off', 'auto') else TILED_INFERENCE
+
+
+def tiling_possible(requested=None):
+    """Cheap check, before decoding, whether tiling could apply to this request"""
+    return _tiling_mode(requested) != 'off'
+
+
+def should_tile(width, height, requested=None):
+    """Decide whether an image should go through tiled inference"""
+    mode = _tiling_mode(requested)
+    if mode == 'on':
+        return max(width, height) > TILE_SIZE
+    if mode == 'auto':
+        return max(width, height) >= TILE_AUTO_MIN_SIDE
+    return False
+
+
+def _axis_starts(length, tile_size, stride):
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size, stride))
+    # Last tile is aligned to the edge so no pixels are dropped
+    starts.append(length - tile_size)
+    return starts
+
+
+def compute_tiles(width, height, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Return (x1, y1, x2, y2) windows covering the image with the given overlap"""
+    stride = max(1, int(tile_size * (1 - overlap)))
+    tiles = []
+    for y1 in _axis_starts(height, tile_size, stride):
+        for x1 in _axis_starts(width, tile_size, stride):
+            tiles.append((x1, y1, min(x1 + tile_size, width), min(y1 + tile_size, height)))
+    return tiles
+
+
+def _infer_tile(infer_fn, image, window):
+    x1, y1, x2, y2 = window
+    # Slicing gives a view; the only copy is the SDK's own JPEG encode
+    return infer_fn(image[y1:y2, x1:x2]).translated(x1, y1)
+
+
+def run_tiled_inference(image, infer_fn, tile_size=TILE_SIZE, overlap=TILE_OVERLAP,
+                        concurrency=TILE_CONCURRENCY, iou_threshold=TILE_NMS_IOU,
+                        include_full_image=TILE_INCLUDE_FULL_IMAGE, deadline=None):
+    """Run infer_fn over overlapping tiles concurrently and merge the results
+
+    infer_fn takes a BGR image array and returns a DetectionSet in that
+    array's coordinates. A failed tile is left out. DeadlineExceeded from
+    any tile cancels the tiles not yet started; the tiles that finished are
+    still merged and returned, with 'tiles' recorded as skipped on deadline.
+    """
+    height, width = image.shape[:2]
+    windows = compute_tiles(width, height, tile_size, overlap)
+    if include_full_image and len(windows) > 1:
+        windows.append((0, 0, width, height))
+    logger.info(f"Tiled inference: {len(windows)} windows of {tile_size}px, "
+                f"overlap {overlap:.0%}, concurrency {concurrency}")
+
+    results = []
+    cut_short = False
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(_infer_tile, infer_fn, image, window) for window in windows]
+        for future in futures:
+            if future.cancelled():
+                continue
+            try:
+                results.append(future.result())
+            except DeadlineExceeded as e:
+                if not cut_short:
+                    # Tiles already running finish or time out; the rest never start
+                    logger.warning(f"Tiled inference cut short: {e}")
+                    for pending in futures:
+                        pending.cancel()
+                    cut_short = True
+            except Exception as e:
+                # One failed tile should not lose the detections from the others
+                logger.warning(f"Tile inference failed: {e}")
+
+    if cut_short:
+        logger.info(f"Keeping {len(results)} of {len(windows)} tiles")
+        if deadline is not None:
+            deadline.skip('tiles')
+    detections = DetectionSet.concatenate(results)
+    if len(detections) == 0:
+        return detections
+    keep = class_aware_nms(detections.boxes_xyxy(), detections.confidence,
+                           detections.class_index, iou_threshold)
+    return detections.take(keep)